@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+aqhia: one command line for the air-quality pipeline.
+
+    python aqhia.py status
+    python aqhia.py fetch --days 30
+    python aqhia.py forecast --engine harmonic --workers 0
+    python aqhia.py diagnose
+
+Every subcommand imports its script (and with it pandas, statsmodels,
+prophet, ...) only when it runs, so --help, status and cities start
+without touching the scientific stack.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+SCRIPTS = ROOT / "scripts"
+DASHBOARDS = ROOT / "dashboards"
+sys.path.insert(0, str(SCRIPTS))
+
+# same locations as measurement_store.STORE / ingest.STATE, which import pandas
+BASE = Path("projects/air_quality_health")
+STORE = BASE / "data" / "store" / "measurements"
+STATE = BASE / "data" / "store" / "state"
+
+
+# ---------------------------------------------------------------- pipeline
+def cmd_run(args):
+    from pipeline import PROFILE_ENV, main
+    if args.profile:
+        os.environ[PROFILE_ENV] = args.profile
+    main(args.targets or None, force=args.force, workers=args.workers)
+
+
+def cmd_fetch(args):
+    from fetch_openaq import fetch_pm25, generate_pm25_grid
+    if args.grid:
+        generate_pm25_grid(country=args.country, days=args.days, stations=args.stations,
+                           start=args.start, missing_rate=args.missing_rate, seed=args.seed,
+                           chunk_hours=args.chunk_hours)
+    else:
+        fetch_pm25(country=args.country, days=args.days)
+    # readers never refresh the rollups themselves, as in fetch_openaq.py
+    from rollups import update_rollups
+    print(f"🔄 Rollups refreshed for {update_rollups()} date(s)")
+
+
+def cmd_analyze(args):
+    from analyze_data import main
+    main()
+
+
+def cmd_decompose(args):
+    from decompose_pm25 import main
+    main(incremental=args.incremental, method=args.method, plots=not args.no_plots)
+
+
+def cmd_forecast(args):
+    from forecast_pm25 import main
+    main(incremental=args.incremental, workers=args.workers, engine=args.engine,
+         compare=args.compare, plots=not args.no_plots)
+
+
+def cmd_backtest(args):
+    from backtest import main
+    main(engines=args.engines, horizon=args.horizon, step=args.step, origins=args.origins,
+         workers=args.workers)
+
+
+def cmd_query(args):
+    from archive_query import main, query
+    if args.tables:
+        main(workers=args.workers)
+        return
+    result = query(by=args.by, bucket=args.bucket, cities=args.cities, stations=args.stations,
+                   start=args.start, end=args.end, source=args.source, workers=args.workers)
+    if args.out:
+        result.to_csv(args.out, index=False)
+        print(f"✅ {len(result)} group(s) -> {args.out}")
+    else:
+        print(result.to_string(index=False, float_format="{:.2f}".format))
+
+
+def cmd_regress(args):
+    from regress_pm25_mortality import main
+    main()
+
+
+def cmd_report(args):
+    from make_report import main
+    main(formats=args.formats, force=args.force)
+
+
+def _streamlit_flags(path, skip=()):
+    """
+    streamlit_config.toml as `--section.key value` flags: streamlit run has
+    no option for a config file outside .streamlit/, but takes every config
+    key on the command line.
+    """
+    import tomllib
+    with open(path, "rb") as f:
+        config = tomllib.load(f)
+    flags = []
+    for section, values in config.items():
+        for key, value in values.items():
+            option = f"--{section}.{key}"
+            if option not in skip:
+                flags += [option, str(value).lower() if isinstance(value, bool) else str(value)]
+    return flags
+
+
+def cmd_serve(args):
+    app = DASHBOARDS / ("app_super.py" if args.app == "super" else "app.py")
+    command = [sys.executable, "-m", "streamlit", "run", str(app), "--server.port", str(args.port)]
+    if (ROOT / "streamlit_config.toml").exists():
+        command += _streamlit_flags(ROOT / "streamlit_config.toml", skip=("--server.port",))
+    raise SystemExit(subprocess.call(command))
+
+
+def cmd_api(args):
+    from data_api import serve
+    serve(host=args.host, port=args.port, refresh_s=args.refresh)
+
+
+# ------------------------------------------------------------ quick commands
+def _read_json(path, default):
+    path = Path(path)
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else default
+
+
+def _last_line(path):
+    """Last line of an append-only log without reading the whole file."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        while pos > 0:
+            step = min(pos, 4096)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            if chunk.rstrip(b"\n").count(b"\n") or pos == 0:
+                break
+        f.seek(pos)
+        lines = f.read().rstrip(b"\n").splitlines()
+    return lines[-1].decode("utf-8") if lines else None
+
+
+def _store_dates():
+    return sorted(p.name.split("=", 1)[1] for p in STORE.glob("date=*"))
+
+
+def cmd_status(args):
+    from instrument import load_manifest
+
+    dates = _store_dates()
+    watermarks = _read_json(STATE / "watermarks.json", {})
+    if dates:
+        print(f"🗄  store: {len(dates)} day(s) {dates[0]} .. {dates[-1]}, "
+              f"{len(watermarks)} station(s)")
+    else:
+        print(f"🗄  store: empty ({STORE}); run `aqhia.py fetch`")
+    if watermarks:
+        print(f"🕒 newest reading: {max(w['watermark'] for w in watermarks.values())}")
+    changes = STATE / "changes.jsonl"
+    if changes.exists() and (line := _last_line(changes)):
+        batch = json.loads(line)
+        print(f"📥 last ingest: {batch['ingested_at']} ({batch['rows']} rows, "
+              f"{len(batch['changes'])} cities)")
+
+    manifest = load_manifest()
+    if manifest is None:
+        print("🧾 no pipeline run recorded yet")
+        return
+    stages = manifest["stages"]
+    bad = [name for name, s in stages.items() if s.get("status") in ("failed", "blocked")]
+    print(f"🧾 run {manifest['run_id']} started {manifest['started']}, "
+          f"{len(stages)} stage(s), {len(bad)} failed/blocked")
+    for name, s in stages.items():
+        seconds = s.get("wall_s")
+        timing = f"{seconds:8.2f}s" if seconds is not None else " " * 9
+        rows = s.get("rows_out")
+        print(f"   {name:14s} {s.get('status', '?'):8s}{timing}"
+              + (f"  {rows} rows out" if rows is not None else "")
+              + (f"  ({s['error']})" if s.get("error") else ""))
+    if bad:
+        raise SystemExit(1)
+
+
+def cmd_cities(args):
+    watermarks = _read_json(STATE / "watermarks.json", {})
+    cities = {}
+    for w in watermarks.values():
+        n, latest = cities.get(w["city"], (0, ""))
+        cities[w["city"]] = (n + 1, max(latest, w["watermark"]))
+    if not cities:
+        # no ingest state (e.g. a migrated CSV archive): use the partition names
+        dates = _store_dates()
+        names = [p.name.split("=", 1)[1] for p in (STORE / f"date={dates[-1]}").glob("city=*")] if dates else []
+        cities = {name: (None, dates[-1]) for name in names}
+    if not cities:
+        raise SystemExit("⚠ No cities in the store yet; run `aqhia.py fetch` first.")
+    for city, (n, latest) in sorted(cities.items()):
+        print(f"{city:20s} {'' if n is None else f'{n:5d} station(s)'}  latest {latest}")
+
+
+# ---------------------------------------------------------------- diagnose
+def import_times(module):
+    """
+    `python -X importtime -c "import <module>"` in a fresh interpreter.
+    Returns (wall seconds, cumulative import seconds of the module, and
+    [(package, cumulative seconds)] for every top-level package it pulled in).
+    """
+    code = (f"import sys; sys.path[:0] = [{str(SCRIPTS)!r}, {str(DASHBOARDS)!r}]; "
+            f"import {module}")
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    total, packages = 0.0, []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # header row
+        seconds, depth, name = int(cumulative) / 1e6, (len(name) - len(name.lstrip())) // 2, name.strip()
+        if depth == 0:
+            # children print before their parent: keep only the module's subtree
+            if name == module:
+                total = seconds
+                break
+            packages = []
+        elif "." not in name:
+            # a package's first import line carries everything it pulled in
+            packages.append((name, seconds))
+    return wall, total, packages
+
+
+def cmd_diagnose(args):
+    modules = args.modules or sorted(
+        p.stem for p in SCRIPTS.glob("*.py") if not p.stem.startswith("_")
+    )
+    print(f"{'module':24s} {'start':>7s} {'imports':>8s}  heaviest packages")
+    for module in modules:
+        try:
+            wall, total, packages = import_times(module)
+        except RuntimeError as e:
+            print(f"{module:24s} failed: {e}")
+            continue
+        heavy = sorted(packages, key=lambda t: -t[1])[:args.top]
+        print(f"{module:24s} {wall:6.2f}s {total:7.2f}s  "
+              + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in heavy))
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, str(Path(__file__).resolve()), "--help"],
+                   capture_output=True)
+    print(f"\n⏱  `aqhia --help` round trip: {time.perf_counter() - start:.2f}s")
+
+
+# -------------------------------------------------------------------- CLI
+def build_parser():
+    parser = argparse.ArgumentParser(prog="aqhia", description="Air quality & health analysis")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="run the pipeline DAG (all stages by default)")
+    p.add_argument("targets", nargs="*")
+    p.add_argument("--force", action="store_true", help="ignore the stage cache")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--profile", default=None, metavar="STAGES",
+                   help="comma-separated stages to profile (or 'all')")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("fetch", help="ingest new PM2.5 readings")
+    p.add_argument("--country", default="IN")
+    p.add_argument("--days", type=int, default=30)
+    p.add_argument("--grid", action="store_true", help="vectorised station x hour generator")
+    p.add_argument("--stations", type=int, default=20)
+    p.add_argument("--start", default=None, help="first timestamp (YYYY-MM-DD)")
+    p.add_argument("--missing-rate", type=float, default=0.05)
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--chunk-hours", type=int, default=168)
+    p.set_defaults(func=cmd_fetch)
+
+    p = sub.add_parser("analyze", help="rank cities by 30-day mean PM2.5")
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser("decompose", help="seasonal decomposition per city")
+    p.add_argument("--incremental", action="store_true")
+    p.add_argument("--method", choices=["batched", "statsmodels"], default="batched")
+    p.add_argument("--no-plots", action="store_true")
+    p.set_defaults(func=cmd_decompose)
+
+    p = sub.add_parser("forecast", help="30-day forecasts per city")
+    p.add_argument("--incremental", action="store_true")
+    p.add_argument("--workers", type=int, default=1, help="0 = all cores")
+    p.add_argument("--engine", choices=["prophet", "harmonic"], default="prophet")
+    p.add_argument("--compare", action="store_true")
+    p.add_argument("--no-plots", action="store_true")
+    p.set_defaults(func=cmd_forecast)
+
+    p = sub.add_parser("backtest", help="rolling-origin accuracy of the forecast engines")
+    p.add_argument("--engines", nargs="*", default=["prophet", "harmonic", "naive"])
+    p.add_argument("--horizon", type=int, default=30)
+    p.add_argument("--step", type=int, default=7)
+    p.add_argument("--origins", type=int, default=4)
+    p.add_argument("--workers", type=int, default=0, help="0 = all cores")
+    p.set_defaults(func=cmd_backtest)
+
+    p = sub.add_parser("query", help="aggregate PM2.5 over the whole archive, out of core")
+    p.add_argument("--by", nargs="*", default=["city"], choices=["city", "station", "country"])
+    p.add_argument("--bucket", default=None,
+                   choices=["hour", "day", "week", "month", "year", "hour_of_day", "day_of_week",
+                            "month_of_year", "season"])
+    p.add_argument("--cities", nargs="*", default=None)
+    p.add_argument("--stations", nargs="*", default=None)
+    p.add_argument("--start", default=None, help="first timestamp (YYYY-MM-DD)")
+    p.add_argument("--end", default=None, help="last timestamp, or last whole day (YYYY-MM-DD)")
+    p.add_argument("--source", choices=["store", "csv"], default="store")
+    p.add_argument("--workers", type=int, default=0, help="0 = all cores")
+    p.add_argument("--out", default=None, help="write the result to this CSV")
+    p.add_argument("--tables", action="store_true",
+                   help="write the monthly trend and climatology tables")
+    p.set_defaults(func=cmd_query)
+
+    p = sub.add_parser("regress", help="PM2.5 vs mortality regressions")
+    p.set_defaults(func=cmd_regress)
+
+    p = sub.add_parser("report", help="build the Markdown / DOCX / HTML report")
+    p.add_argument("--formats", nargs="*", default=["docx", "html"])
+    p.add_argument("--force", action="store_true")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser("serve", help="launch a Streamlit dashboard")
+    p.add_argument("--app", choices=["super", "basic"], default="super")
+    p.add_argument("--port", type=int, default=8501)
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("api", help="serve the pipeline outputs over a read-only HTTP API")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8600)
+    p.add_argument("--refresh", type=float, default=1.0,
+                   help="seconds between checks of the output files")
+    p.set_defaults(func=cmd_api)
+
+    p = sub.add_parser("status", help="store coverage, last ingest and last pipeline run")
+    p.set_defaults(func=cmd_status)
+
+    p = sub.add_parser("cities", help="cities with station counts and latest reading")
+    p.set_defaults(func=cmd_cities)
+
+    p = sub.add_parser("diagnose", help="import-time cost of each script (-X importtime)")
+    p.add_argument("modules", nargs="*", help="modules to check (default: every script)")
+    p.add_argument("--top", type=int, default=3, help="heaviest imports to list per module")
+    p.set_defaults(func=cmd_diagnose)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
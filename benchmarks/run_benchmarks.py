@@ -0,0 +1,288 @@
+"""
+Scaling benchmarks for the pipeline stages.
+
+Each scale generates a synthetic archive (cities x stations per city x days,
+relative to the 20-city x 30-day reference) in a throwaway workspace, then
+runs every stage in its own subprocess with that workspace as the working
+directory. Wall time, CPU time and peak RSS are recorded per stage, written
+to benchmarks/results/<timestamp>.json and compared against
+benchmarks/baseline.json when it exists.
+
+    python benchmarks/run_benchmarks.py                  # scales 1 and 10
+    python benchmarks/run_benchmarks.py --scales 1 10 100 1000
+    python benchmarks/run_benchmarks.py --save-baseline  # accept these numbers
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SCRIPTS = ROOT / "scripts"
+DASHBOARDS = ROOT / "dashboards"
+RESULTS = ROOT / "benchmarks" / "results"
+BASELINE = ROOT / "benchmarks" / "baseline.json"
+
+# (cities, stations per city, days); each row multiplies to the scale factor
+# against the 20 cities x 1 station x 30 days of the default fetch
+SCALES = {
+    1: (20, 1, 30),
+    10: (50, 2, 60),
+    100: (200, 5, 60),
+    1000: (1000, 10, 60),
+}
+# stages in run order with their prerequisites; max_scale keeps the
+# per-city Prophet fits bounded
+STAGES = {
+    "ingest": {},
+    "rollup": {"deps": ("ingest",)},
+    "load_health": {},
+    "analyze": {"deps": ("rollup", "load_health")},
+    "decompose": {"deps": ("rollup",)},
+    "regress": {"deps": ("load_health",)},
+    "forecast_harmonic": {"deps": ("rollup",)},
+    "forecast_prophet": {"deps": ("rollup",), "max_scale": 10},
+    "dashboard_load": {"deps": ("decompose", "forecast_harmonic")},
+}
+
+
+def _with_deps(names):
+    selected, todo = set(), list(names)
+    while todo:
+        name = todo.pop()
+        if name not in STAGES:
+            raise SystemExit(f"⚠ Unknown stage: {name}")
+        if name not in selected:
+            selected.add(name)
+            todo.extend(STAGES[name].get("deps", ()))
+    return {k: v for k, v in STAGES.items() if k in selected}
+
+
+def synthetic_cities(n, seed=0):
+    """The 20 real cities plus `n - 20` generated ones scattered over India."""
+    import numpy as np
+    from fetch_openaq import CITIES
+
+    cities = dict(list(CITIES.items())[:n])
+    rng = np.random.default_rng(seed)
+    for i in range(len(cities), n):
+        base = float(rng.uniform(30, 90))
+        cities[f"City{i:04d}"] = {
+            "base_pm25": base, "variation": base * 0.4,
+            "lat": float(rng.uniform(8, 32)), "lon": float(rng.uniform(70, 92)),
+        }
+    return cities
+
+
+def _cpu_seconds():
+    """User + system CPU of this process and its reaped children (pool workers)."""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def _run_stage(name, scale):
+    """Child-process body: import, run and measure one stage in the cwd workspace."""
+    sys.path[:0] = [str(SCRIPTS), str(DASHBOARDS)]
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    n_cities, per_city, days = SCALES[scale]
+    rows = None
+
+    start = time.perf_counter()
+    if name == "ingest":
+        import numpy as np
+        import pandas as pd
+        from fetch_openaq import station_layout, synthetic_readings
+        from ingest import ingest_batch
+        from measurement_store import open_store
+        # generate the archive up front, in the weekly blocks a feed would
+        # deliver, so only ingest_batch (dedup, watermarks, writes and the
+        # change log) is timed
+        rng = np.random.default_rng(0)
+        layout = station_layout(n_cities * per_city, rng, cities=synthetic_cities(n_cities))
+        hours = pd.date_range(pd.Timestamp.now().floor("h") - pd.Timedelta(days=days),
+                              periods=days * 24 + 1, freq="h")
+        batches = [synthetic_readings(hours[i:i + 168], layout, rng)
+                   for i in range(0, len(hours), 168)]
+
+        def call():
+            for batch in batches:
+                ingest_batch(batch)
+    elif name == "rollup":
+        from rollups import update_rollups
+        call = update_rollups
+    elif name == "load_health":
+        from load_health_data import load_who_sample
+        call = load_who_sample
+    elif name == "analyze":
+        from analyze_data import main as call
+    elif name == "decompose":
+        from decompose_pm25 import main
+        call = lambda: main(plots=False)
+    elif name == "regress":
+        from regress_pm25_mortality import main as call
+    elif name == "forecast_harmonic":
+        from forecast_pm25 import main
+        call = lambda: main(engine="harmonic", plots=False)
+    elif name == "forecast_prophet":
+        from forecast_pm25 import main
+        call = lambda: main(workers=0, plots=False)
+    elif name == "dashboard_load":
+        import data_access
+
+        def call():
+            data_access.city_means()
+            data_access.load_decomposition()
+            for city in data_access.forecast_cities()[:5]:
+                data_access.load_forecast(city)
+            data_access.station_index()
+    else:
+        raise SystemExit(f"unknown stage {name}")
+    import_s = time.perf_counter() - start
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    cpu0, wall0 = _cpu_seconds(), time.perf_counter()
+    call()
+    wall, cpu = time.perf_counter() - wall0, _cpu_seconds() - cpu0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if name == "ingest":
+        rows = open_store().count_rows()
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return {"wall_s": wall, "cpu_s": cpu, "import_s": import_s,
+            "peak_rss_mb": peak * unit / 2**20,
+            "rss_growth_mb": (peak - rss_before) * unit / 2**20, "rows": rows}
+
+
+def run_scale(scale, stages=STAGES, timeout=None):
+    """Run every stage at one scale in a fresh workspace; returns result records."""
+    records = []
+    with tempfile.TemporaryDirectory(prefix=f"aqhia_bench_{scale}x_") as tmp:
+        (Path(tmp) / "projects" / "air_quality_health").mkdir(parents=True)
+        status = {}
+        for name, opts in stages.items():
+            record = {"scale": scale, "stage": name}
+            if (scale > opts.get("max_scale", scale)
+                    or any(status.get(d) != "ok" for d in opts.get("deps", ()))):
+                record["status"] = status[name] = "skipped"
+                records.append(record)
+                continue
+            try:
+                proc = subprocess.run(
+                    [sys.executable, __file__, "--run-stage", name, "--scale", str(scale)],
+                    cwd=tmp, capture_output=True, text=True, timeout=timeout,
+                )
+            except subprocess.TimeoutExpired:
+                record.update(status="failed", error=f"timeout after {timeout}s")
+            else:
+                lines = [l for l in proc.stdout.splitlines() if l.startswith("BENCH_RESULT ")]
+                if proc.returncode == 0 and lines:
+                    record.update(status="ok", **json.loads(lines[-1].split(" ", 1)[1]))
+                else:
+                    record.update(status="failed", error=(proc.stderr or proc.stdout).strip()[-500:])
+            status[name] = record["status"]
+            records.append(record)
+            print(_format(record), flush=True)
+    return records
+
+
+def _format(r):
+    if r["status"] != "ok":
+        return f"  {r['scale']:>5}x {r['stage']:18s} {r['status']}: {r.get('error', '')[:200]}"
+    return (f"  {r['scale']:>5}x {r['stage']:18s} {r['wall_s']:8.2f}s wall "
+            f"{r['cpu_s']:8.2f}s cpu {r['peak_rss_mb']:8.0f} MB peak")
+
+
+def compare(results, baseline, time_tolerance=0.25, mem_tolerance=0.25, min_seconds=0.05):
+    """
+    Stage/scale pairs slower or larger than the baseline beyond the
+    tolerances (relative, with an absolute noise floor on time).
+    """
+    base = {(r["scale"], r["stage"]): r for r in baseline["results"] if r["status"] == "ok"}
+    regressions = []
+    for r in results:
+        b = base.get((r["scale"], r["stage"]))
+        if b is None or r["status"] != "ok":
+            continue
+        if (r["wall_s"] > b["wall_s"] * (1 + time_tolerance)
+                and r["wall_s"] - b["wall_s"] > min_seconds):
+            regressions.append({**_key(r), "metric": "wall_s", "baseline": b["wall_s"], "now": r["wall_s"]})
+        if r["peak_rss_mb"] > b["peak_rss_mb"] * (1 + mem_tolerance):
+            regressions.append({**_key(r), "metric": "peak_rss_mb",
+                                "baseline": b["peak_rss_mb"], "now": r["peak_rss_mb"]})
+    return regressions
+
+
+def _key(r):
+    return {"scale": r["scale"], "stage": r["stage"]}
+
+
+def main(scales=(1, 10), stages=None, baseline=BASELINE, save_baseline=False,
+         time_tolerance=0.25, mem_tolerance=0.25, timeout=None):
+    selected = _with_deps(stages) if stages else STAGES
+    results = []
+    for scale in scales:
+        n_cities, per_city, days = SCALES[scale]
+        print(f"==> {scale}x: {n_cities} cities x {per_city} stations x {days} days")
+        results += run_scale(scale, selected, timeout=timeout)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scales": {str(s): dict(zip(["cities", "stations_per_city", "days"], SCALES[s])) for s in scales},
+        "results": results,
+    }
+    baseline = Path(baseline)
+    if baseline.exists() and not save_baseline:
+        report["regressions"] = compare(results, json.loads(baseline.read_text(encoding="utf-8")),
+                                        time_tolerance, mem_tolerance)
+
+    RESULTS.mkdir(parents=True, exist_ok=True)
+    path = RESULTS / f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"
+    path.write_text(json.dumps(report, indent=1), encoding="utf-8")
+    print(f"✅ results -> {path}")
+    if save_baseline:
+        baseline.write_text(json.dumps(report, indent=1), encoding="utf-8")
+        print(f"✅ baseline saved -> {baseline}")
+
+    failed = [r for r in results if r["status"] == "failed"]
+    for r in report.get("regressions", []):
+        print(f"❌ regression {r['scale']}x {r['stage']} {r['metric']}: "
+              f"{r['baseline']:.2f} -> {r['now']:.2f}")
+    if failed:
+        print(f"❌ {len(failed)} stage run(s) failed")
+    if failed or report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline scaling benchmarks")
+    parser.add_argument("--scales", type=int, nargs="*", default=[1, 10])
+    parser.add_argument("--stages", nargs="*", default=None,
+                        help=f"subset of: {', '.join(STAGES)} (prerequisites are added)")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--time-tolerance", type=float, default=0.25)
+    parser.add_argument("--mem-tolerance", type=float, default=0.25)
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per stage")
+    parser.add_argument("--run-stage", help=argparse.SUPPRESS)
+    parser.add_argument("--scale", type=int, default=1, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        print("BENCH_RESULT " + json.dumps(_run_stage(args.run_stage, args.scale)))
+    else:
+        bad = [s for s in args.scales if s not in SCALES]
+        if bad:
+            parser.error(f"unknown scale(s) {bad}; choose from {sorted(SCALES)}")
+        main(scales=args.scales, stages=args.stages, baseline=args.baseline,
+             save_baseline=args.save_baseline, time_tolerance=args.time_tolerance,
+             mem_tolerance=args.mem_tolerance, timeout=args.timeout)
@@ -1,25 +1,23 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import glob
-from pathlib import Path
 
 st.set_page_config(
     page_title="Air Quality and Health Dashboard",
     layout="wide"
 )
-BASE = Path("projects/air_quality_health")
 
 st.title("🌫 Air Quality & Health Impact")
 
+# heavy imports after the title, so the page paints before they load
+import plotly.express as px  # noqa: E402
+from data_access import city_means, who_latest  # noqa: E402
+
 # latest PM2.5
-files = sorted(glob.glob(str(BASE / "data" / "openaq" / "openaq_pm25_IN_*.csv")))
-if not files:
+try:
+    city_mean = city_means()
+except FileNotFoundError:
     st.warning("Run fetch_openaq.py first.")
 else:
-    df = pd.read_csv(files[-1])
     st.subheader("PM2.5 Measurements (OpenAQ)")
-    city_mean = df.groupby("city")["value"].mean().reset_index()
     fig = px.bar(
         city_mean.sort_values("value", ascending=False).head(20),
         x="value",
@@ -31,8 +29,7 @@ else:
 
 # WHO deaths
 try:
-    who = pd.read_csv(BASE / "data" / "who" / "air_pollution_death_rate.csv")
-    latest = who.groupby("country").last().reset_index()
+    latest = who_latest()
     fig2 = px.choropleth(
         latest,
         locations="country",
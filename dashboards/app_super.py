@@ -1,8 +1,4 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import glob
 from pathlib import Path
 
 st.set_page_config(
@@ -13,22 +9,31 @@ BASE = Path("projects/air_quality_health")
 
 st.title("🌫 Air Quality & Health — Integrated Analytics Dashboard")
 
-tab1, tab2, tab3, tab4 = st.tabs([
+# heavy imports after the title, so the page paints before they load
+import pandas as pd  # noqa: E402
+import plotly.express as px  # noqa: E402
+import plotly.graph_objects as go  # noqa: E402
+from data_access import (  # noqa: E402
+    city_means, forecast_cities, load_backtest, load_decomposition, load_forecast,
+    load_text, run_manifest, station_index
+)
+
+tab1, tab2, tab3, tab4, tab5 = st.tabs([
     "📊 Current PM₂․₅",
     "📈 Trends & Decomposition",
     "🔮 Forecast (Prophet)",
-    "⚕️ Regression & Health Impact"
+    "⚕️ Regression & Health Impact",
+    "🩺 Pipeline Health"
 ])
 
 # -------------- TAB 1 – Current PM₂․₅ --------------
 with tab1:
     st.subheader("Real-time PM₂․₅ from OpenAQ")
-    files = sorted(glob.glob(str(BASE / "data" / "openaq" / "openaq_pm25_IN_*.csv")))
-    if not files:
+    try:
+        city_mean = city_means()
+    except FileNotFoundError:
         st.warning("Run fetch_openaq.py first.")
     else:
-        df = pd.read_csv(files[-1])
-        city_mean = df.groupby("city")["value"].mean().reset_index()
         fig = px.bar(
             city_mean.sort_values("value", ascending=False).head(20),
             x="value",
@@ -41,38 +46,44 @@ with tab1:
             "National Average PM₂․₅ (µg/m³)",
             f"{city_mean['value'].mean():.1f}"
         )
+        with st.expander("📍 Nearest monitors"):
+            c1, c2, c3 = st.columns(3)
+            lat = c1.number_input("Latitude", value=28.6139, format="%.4f")
+            lon = c2.number_input("Longitude", value=77.2090, format="%.4f")
+            k = c3.slider("Stations", 1, 20, 5)
+            st.dataframe(
+                station_index().nearest(lat, lon, k=k),
+                use_container_width=True
+            )
 
 # -------------- TAB 2 – Trends & Decomposition --------------
 with tab2:
     st.subheader("Seasonal Decomposition (7-day period)")
-    trend_files = sorted(glob.glob(str(BASE / "outputs" / "tables" / "trend_*.csv")))
-    if not trend_files:
+    try:
+        decomp = load_decomposition()
+    except FileNotFoundError:
         st.info("Run decompose_pm25.py first.")
     else:
-        cities = sorted([
-            Path(f).stem.replace("trend_", "").replace("_", " ")
-            for f in trend_files
-        ])
+        cities = sorted(decomp["city"].unique())
         city = st.selectbox("Select city to view trend", cities)
-        fpath = BASE / "outputs" / "tables" / f"trend_{city.replace(' ', '_')}.csv"
-        df = pd.read_csv(fpath)
+        df = decomp[decomp["city"] == city].dropna(subset=["trend"])
         fig = px.line(df, x="date", y="trend", title=f"PM₂․₅ Trend for {city}")
         st.plotly_chart(fig, use_container_width=True)
+        with st.expander("Full decomposition figure"):
+            # rendered on first request, reused until the city's data changes;
+            # imported here so matplotlib loads only when a figure is wanted
+            from render_plots import ensure_plot
+            st.image(str(ensure_plot("decompose", city)))
 
 # -------------- TAB 3 – Forecast (Prophet) --------------
 with tab3:
     st.subheader("30-day Forecast of PM₂․₅")
-    forecast_files = sorted(glob.glob(str(BASE / "outputs" / "tables" / "forecast_*.csv")))
-    if not forecast_files:
+    cities = forecast_cities()
+    if not cities:
         st.info("Run forecast_pm25.py first.")
     else:
-        cities = sorted([
-            Path(f).stem.replace("forecast_", "").replace("_", " ")
-            for f in forecast_files
-        ])
         city = st.selectbox("Choose city for forecast", cities)
-        fpath = BASE / "outputs" / "tables" / f"forecast_{city.replace(' ', '_')}.csv"
-        df = pd.read_csv(fpath)
+        df = load_forecast(city)
         fig = go.Figure()
         fig.add_trace(go.Scatter(
             x=df["ds"],
@@ -104,6 +115,24 @@ with tab3:
             df[["ds", "yhat", "yhat_lower", "yhat_upper"]].tail(30),
             use_container_width=True
         )
+        with st.expander("📏 Backtest accuracy"):
+            try:
+                metrics, summary = load_backtest()
+            except FileNotFoundError:
+                st.info("Run backtest.py first.")
+            else:
+                if summary.empty:
+                    st.info("Not enough history to backtest yet.")
+                else:
+                    st.dataframe(
+                        summary[summary["city"].isin([city, "All cities"])].round(2),
+                        use_container_width=True
+                    )
+                    fig = px.line(
+                        metrics[metrics["city"] == city], x="horizon", y="mae", color="engine",
+                        title=f"Backtest MAE by days ahead — {city}"
+                    )
+                    st.plotly_chart(fig, use_container_width=True)
 
 # -------------- TAB 4 – Regression & Health Impact --------------
 with tab4:
@@ -114,7 +143,43 @@ with tab4:
         st.info("Run regress_pm25_mortality.py first.")
     else:
         st.text("OLS Regression Summary:")
-        st.code(reg_path.read_text())
+        st.code(load_text(reg_path))
     if fe_path.exists():
         st.text("Fixed Effects Panel Model:")
-        st.code(fe_path.read_text())
+        st.code(load_text(fe_path))
+
+# -------------- TAB 5 – Pipeline Health --------------
+with tab5:
+    st.subheader("Last Pipeline Run")
+    try:
+        manifest, stages = run_manifest()
+    except FileNotFoundError:
+        st.info("Run pipeline.py first.")
+    else:
+        failed = stages[stages["status"].isin(["failed", "blocked"])]
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Run", manifest["run_id"])
+        c2.metric("Stages", len(stages))
+        c3.metric("Failed / blocked", len(failed))
+        c4.metric("Stage time (s)", f"{stages['wall_s'].fillna(0).sum():.1f}")
+        st.caption(f"Started {manifest['started']} on {manifest.get('host')}, "
+                   f"last update {manifest.get('updated')}")
+        for row in failed.itertuples():
+            st.error(f"{row.stage}: {row.status}" + (f" ({row.error})" if row.error else ""))
+
+        ran = stages[stages["status"] != "cached"].dropna(subset=["wall_s"])
+        if not ran.empty:
+            fig = px.bar(ran, x="wall_s", y="stage", orientation="h", color="status",
+                         hover_data=["cpu_s", "peak_rss_mb", "rows_in", "rows_out"],
+                         title="Wall time per stage (s)")
+            st.plotly_chart(fig, use_container_width=True)
+        st.dataframe(stages, use_container_width=True)
+
+        with_cities = [name for name, entry in manifest["stages"].items() if entry.get("cities")]
+        if with_cities:
+            with st.expander("Per-city metrics"):
+                name = st.selectbox("Stage", with_cities)
+                st.dataframe(
+                    pd.DataFrame.from_dict(manifest["stages"][name]["cities"], orient="index"),
+                    use_container_width=True
+                )
@@ -0,0 +1,209 @@
+"""
+Shared data access for the Streamlit dashboards.
+
+Every loader is memoised with st.cache_data / st.cache_resource and keyed on
+the (path, mtime, size) fingerprint of its source, so widget reruns are
+served from memory while a new pipeline output invalidates the entry on the
+next rerun. Caches are bounded with max_entries and evict old fingerprints.
+
+With AQHIA_API_URL set (e.g. http://127.0.0.1:8600) the city means,
+forecasts, decomposition and backtest tables come from a shared
+data_api.py service instead, revalidated with ETags on each read.
+"""
+import gzip
+import os
+import sys
+import threading
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+import pandas as pd
+import streamlit as st
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+from instrument import MANIFEST, load_manifest, summary  # noqa: E402
+from measurement_store import STORE  # noqa: E402
+from rollups import ROLLUPS, read_rollup  # noqa: E402
+
+BASE = Path("projects/air_quality_health")
+TABLES = BASE / "outputs" / "tables"
+WHO = BASE / "data" / "who" / "air_pollution_death_rate.csv"
+CHANGES = BASE / "data" / "store" / "state" / "changes.jsonl"
+API_URL = os.environ.get("AQHIA_API_URL")
+API_PAGE = 50_000
+
+_api_pages = {}  # page url -> (etag, frame, total rows)
+_api_lock = threading.Lock()
+
+
+def fingerprint(path):
+    """(path, mtime_ns, size) of a file; newest mtime and total size for a directory."""
+    path = Path(path)
+    if not path.exists():
+        return (str(path), 0, 0)
+    if path.is_dir():
+        stats = [p.stat() for p in path.rglob("*") if p.is_file()]
+        return (str(path), max((s.st_mtime_ns for s in stats), default=0),
+                sum(s.st_size for s in stats))
+    st_ = path.stat()
+    return (str(path), st_.st_mtime_ns, st_.st_size)
+
+
+def api_frame(name, **params):
+    """
+    Every page of one data_api.py dataset as a DataFrame, sent as Arrow.
+    Pages already held are revalidated with If-None-Match, so an unchanged
+    dataset costs one 304 per page. Raises FileNotFoundError on a 404.
+    """
+    frames, offset = [], 0
+    while True:
+        query = urlencode({**params, "format": "arrow", "limit": API_PAGE, "offset": offset})
+        url = f"{API_URL.rstrip('/')}/v1/{name}?{query}"
+        with _api_lock:
+            cached = _api_pages.get(url)
+        headers = {"Accept-Encoding": "gzip"}
+        if cached:
+            headers["If-None-Match"] = cached[0]
+        try:
+            with urlopen(Request(url, headers=headers), timeout=30) as resp:
+                body = resp.read()
+                if resp.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                import pyarrow as pa
+                cached = (resp.headers["ETag"], pa.ipc.open_stream(body).read_pandas(),
+                          int(resp.headers["X-Total-Count"]))
+            with _api_lock:
+                _api_pages[url] = cached
+        except HTTPError as e:
+            if e.code == 404:
+                raise FileNotFoundError(f"{name}: {e.read().decode()}")
+            if e.code != 304 or not cached:
+                raise
+        frames.append(cached[1])
+        offset += API_PAGE
+        if offset >= cached[2]:
+            break
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def store_fingerprint():
+    """
+    Stat of the ingest change log (appended on every logged write) folded
+    with the newest date partition and its city directories, which any
+    write to the latest day touches even if it bypasses the log: a few
+    stats instead of a tree walk.
+    """
+    dates = sorted(STORE.glob("date=*"))
+    if not CHANGES.exists() and not dates:
+        return fingerprint(STORE)
+    log = CHANGES.stat() if CHANGES.exists() else None
+    newest = [dates[-1], *dates[-1].glob("city=*")] if dates else []
+    mtime = max([log.st_mtime_ns if log else 0, *(p.stat().st_mtime_ns for p in newest)])
+    return (f"{CHANGES}|{dates[-1].name if dates else ''}", mtime,
+            (log.st_size if log else 0) + len(newest))
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _read_csv(path, mtime_ns, size, parse_dates=None):
+    return pd.read_csv(path, parse_dates=list(parse_dates) if parse_dates else None)
+
+
+def load_csv(path, parse_dates=None):
+    """Cached read_csv; raises FileNotFoundError when the output is missing."""
+    if not Path(path).exists():
+        raise FileNotFoundError(path)
+    return _read_csv(*fingerprint(path), parse_dates=tuple(parse_dates or ()))
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _read_text(path, mtime_ns, size):
+    return Path(path).read_text()
+
+
+def load_text(path):
+    if not Path(path).exists():
+        raise FileNotFoundError(path)
+    return _read_text(*fingerprint(path))
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _city_means(path, mtime_ns, size):
+    # exact all-time mean from the per-day partial sums, no raw scan
+    daily = read_rollup("city_day").groupby("city")[["sum", "count"]].sum()
+    return (daily["sum"] / daily["count"]).rename("value").reset_index()
+
+
+def city_means():
+    """Mean PM2.5 per city over the stored measurements."""
+    if API_URL:
+        return api_frame("city_means", columns="city,value")
+    # keyed on the rollup it reads, which only the rollup writers replace
+    return _city_means(*fingerprint(ROLLUPS / "city_day.parquet"))
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _who_latest(path, mtime_ns, size):
+    return pd.read_csv(path).groupby("country").last().reset_index()
+
+
+def who_latest():
+    """Most recent WHO/IHME death rate per country."""
+    if not WHO.exists():
+        raise FileNotFoundError(WHO)
+    return _who_latest(*fingerprint(WHO))
+
+
+def load_decomposition():
+    if API_URL:
+        return api_frame("decomposition")
+    return load_csv(TABLES / "decomposition.csv")
+
+
+def forecast_cities():
+    """Cities that have a forecast table, from file names only."""
+    if API_URL:
+        return sorted(api_frame("forecasts", columns="city")["city"].unique())
+    return sorted(
+        p.stem.replace("forecast_", "").replace("_", " ")
+        for p in TABLES.glob("forecast_*.csv")
+        if p.name != "forecast_engine_comparison.csv"
+    )
+
+
+def load_forecast(city):
+    if API_URL:
+        return api_frame("forecasts", city=city)
+    return load_csv(TABLES / f"forecast_{city.replace(' ', '_')}.csv")
+
+
+def load_backtest():
+    """(per-horizon metrics, per-city summary) of the last backtest run."""
+    if API_URL:
+        return api_frame("backtest_metrics"), api_frame("backtest_summary")
+    return load_csv(TABLES / "backtest_metrics.csv"), load_csv(TABLES / "backtest_summary.csv")
+
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _station_index(path, mtime_ns, size):
+    from station_index import load_station_index  # scipy; only when the lookup is used
+    return load_station_index()
+
+
+def station_index():
+    """Shared (not copied) KD-tree station index, rebuilt when the store changes."""
+    return _station_index(*store_fingerprint())
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _run_manifest(path, mtime_ns, size):
+    manifest = load_manifest(path)
+    return manifest, summary(manifest)
+
+
+def run_manifest():
+    """(manifest dict, one-row-per-stage DataFrame) of the last pipeline run."""
+    if not MANIFEST.exists():
+        raise FileNotFoundError(MANIFEST)
+    return _run_manifest(*fingerprint(MANIFEST))
@@ -1,23 +1,15 @@
-import subprocess
 import sys
 from pathlib import Path
 
-def run(c):
-    print("==>", c)
-    r = subprocess.run(c, shell=True)
-    if r.returncode != 0:
-        sys.exit(r.returncode)
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+from pipeline import main  # noqa: E402
 
 print("🚀 Starting Air Quality & Health Analysis Pipeline")
 print("=" * 50)
 
-# Use the virtual environment Python executable
-python_exe = Path(".venv/Scripts/python.exe").resolve()
-
-run(f'"{python_exe}" projects/air_quality_health/scripts/fetch_openaq.py')
-run(f'"{python_exe}" projects/air_quality_health/scripts/load_health_data.py')
-run(f'"{python_exe}" projects/air_quality_health/scripts/analyze_data.py')
-run(f'"{python_exe}" projects/air_quality_health/scripts/make_report.py')
+# fetch → load_health → analyze → decompose → regress → forecast → report,
+# run in-process; unchanged stages are skipped from the pipeline cache
+main(force="--force" in sys.argv)
 
 print("🎉 Basic analysis complete!")
 print("📊 Dashboard: streamlit run projects/air_quality_health/dashboards/app.py")
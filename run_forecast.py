@@ -1,21 +1,14 @@
-import subprocess
 import sys
 from pathlib import Path
 
-def run(c):
-    print("==>", c)
-    r = subprocess.run(c, shell=True)
-    if r.returncode != 0:
-        sys.exit(r.returncode)
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+from pipeline import main  # noqa: E402
 
 print("🔮 Running PM2.5 Forecasting with Prophet")
 print("=" * 45)
 
-# Use the virtual environment Python executable
-python_exe = Path(".venv/Scripts/python.exe").resolve()
-
-run(f'"{python_exe}" projects/air_quality_health/scripts/forecast_pm25.py')
+main(["forecast"], force="--force" in sys.argv)
 
 print("🎯 Forecast generation complete!")
 print("📊 See outputs/plots & outputs/tables/")
-print("🔮 Forecast Dashboard: streamlit run projects/air_quality_health/dashboards/app_forecast.py")
+print("🔮 Forecast Dashboard: streamlit run projects/air_quality_health/dashboards/app_super.py")
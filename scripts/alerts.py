@@ -0,0 +1,317 @@
+import argparse
+import math
+import pickle
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from aqi import CATEGORIES, MIN_HOURS, PM25_BREAKPOINTS, WINDOW_HOURS
+from ingest import STATE, mark_processed, pending_changes
+from instrument import current_stage, instrumented
+from measurement_store import STORE, iter_days, open_store
+
+BASE = Path("projects/air_quality_health")
+OUTT = BASE / "outputs" / "tables"
+ALERT_STATE = STATE / "alerts_state.pkl"
+EVENTS = OUTT / "alert_events.csv"
+
+# limits on the rolling 24-hour mean (µg/m³): WHO 2021 guideline and
+# interim target 1, and the lower edges of the NAQI Poor..Severe bands
+THRESHOLDS = {
+    "WHO guideline": 15.0,
+    "WHO IT-1": 75.0,
+    **{f"NAQI {CATEGORIES[i]}": float(PM25_BREAKPOINTS[i]) for i in (3, 4, 5)},
+}
+EVENT_COLUMNS = ["level", "key", "city", "event", "threshold", "limit", "hour",
+                 "rolling_mean", "value", "rate_of_rise", "duration_hours", "peak"]
+
+
+class _Series:
+    """
+    Rolling state of one station or city series: a ring of hourly values
+    with its running sum / count, and per-threshold run counters. Runs are
+    signed (positive = hours above, negative = hours below) and kept both
+    through the last closed hour and for the current, still-open hour, so a
+    repeated reading for the same hour re-evaluates instead of re-counting.
+    """
+    __slots__ = ("ring", "total", "count", "hour", "closed", "runs",
+                 "started", "peak", "rise_hour")
+
+    def __init__(self, n_thresholds, window):
+        self.ring = [math.nan] * window
+        self.total, self.count, self.hour = 0.0, 0, None
+        self.closed = [0] * n_thresholds
+        self.runs = [0] * n_thresholds
+        self.started = [None] * n_thresholds  # start hour of an open episode
+        self.peak = [0.0] * n_thresholds
+        self.rise_hour = None
+
+    def to_tuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    @classmethod
+    def from_tuple(cls, values):
+        series = cls.__new__(cls)
+        for name, value in zip(cls.__slots__, values):
+            setattr(series, name, value)
+        return series
+
+
+class EpisodeDetector:
+    """
+    Online exceedance episodes for many keyed hourly series. update() costs
+    O(window + thresholds) at worst (a long gap clears the ring) and O(1)
+    amortised. An episode starts once the rolling mean has been above a
+    limit for `min_hours` consecutive hours, and ends after `clear_hours`
+    consecutive hours below it, or when the series goes silent for a whole
+    window. A rapid_rise event fires when the mean of the last `rise_hours`
+    hours exceeds the mean of the `rise_hours` before it by `rise_rate`
+    µg/m³ per hour.
+    """
+
+    def __init__(self, level, thresholds=THRESHOLDS, window=WINDOW_HOURS,
+                 min_valid=MIN_HOURS, min_hours=3, clear_hours=2,
+                 rise_hours=3, rise_rate=20.0):
+        self.level = level
+        self.names = list(thresholds)
+        self.limits = list(thresholds.values())
+        self.window, self.min_valid = window, min_valid
+        self.min_hours, self.clear_hours = min_hours, clear_hours
+        self.rise_hours, self.rise_rate = rise_hours, rise_rate
+        self.series = {}
+
+    def _event(self, key, city, kind, i, hour, s, value, rate, duration=None, peak=None):
+        return {
+            "level": self.level, "key": key, "city": city, "event": kind,
+            "threshold": self.names[i] if i is not None else None,
+            "limit": self.limits[i] if i is not None else None,
+            "hour": pd.Timestamp(hour * 3600, unit="s"),
+            "rolling_mean": s.total / s.count if s.count else math.nan,
+            "value": value, "rate_of_rise": rate,
+            "duration_hours": duration, "peak": peak,
+        }
+
+    def _block_mean(self, s, end, n):
+        values = [v for v in (s.ring[h % self.window] for h in range(end - n + 1, end + 1))
+                  if not math.isnan(v)]
+        return sum(values) / len(values) if values else math.nan
+
+    def _advance(self, key, city, s, hour, events):
+        # close the previous hour and clear ring slots the window moved past
+        gap = hour - s.hour
+        for h in range(s.hour + 1, s.hour + 1 + min(gap, self.window)):
+            j = h % self.window
+            if not math.isnan(s.ring[j]):
+                s.total -= s.ring[j]
+                s.count -= 1
+                s.ring[j] = math.nan
+        for i in range(len(self.limits)):
+            if gap > 1:
+                # missing hours break a run; a whole silent window ends the episode
+                if s.started[i] is not None and gap >= self.window:
+                    events.append(self._event(key, city, "end", i, s.hour, s, math.nan, math.nan,
+                                              s.hour - s.started[i] + 1, s.peak[i]))
+                    s.started[i] = None
+                s.runs[i] = 0
+            s.closed[i] = s.runs[i]
+        s.hour = hour
+
+    def update(self, key, hour, value, city=None):
+        """
+        Set series `key`'s value for epoch hour `hour` (a repeat replaces
+        it) and return the events this triggers. Hours older than the
+        series' newest hour are ignored.
+        """
+        s = self.series.get(key)
+        if s is None:
+            s = self.series[key] = _Series(len(self.limits), self.window)
+        events = []
+        if s.hour is None:
+            s.hour = hour
+        elif hour < s.hour:
+            return events
+        elif hour > s.hour:
+            self._advance(key, city, s, hour, events)
+
+        j = hour % self.window
+        if not math.isnan(s.ring[j]):
+            s.total -= s.ring[j]
+            s.count -= 1
+        s.ring[j] = value
+        s.total += value
+        s.count += 1
+
+        # rise of the latest rise_hours mean over the one before it, per hour
+        recent = self._block_mean(s, hour, self.rise_hours)
+        before = self._block_mean(s, hour - self.rise_hours, self.rise_hours)
+        rate = (recent - before) / self.rise_hours
+        if (rate >= self.rise_rate
+                and (s.rise_hour is None or hour - s.rise_hour > self.rise_hours)):
+            s.rise_hour = hour
+            events.append(self._event(key, city, "rapid_rise", None, hour, s, value, rate))
+
+        if s.count < self.min_valid:
+            return events
+        mean = s.total / s.count
+        for i, limit in enumerate(self.limits):
+            prev = s.closed[i]
+            if mean > limit:
+                s.runs[i] = prev + 1 if prev > 0 else 1
+            else:
+                s.runs[i] = prev - 1 if prev < 0 else -1
+            if s.started[i] is None:
+                if s.runs[i] >= self.min_hours:
+                    s.started[i] = hour - s.runs[i] + 1
+                    s.peak[i] = mean
+                    events.append(self._event(key, city, "start", i, hour, s, value, rate))
+            else:
+                s.peak[i] = max(s.peak[i], mean)
+                if -s.runs[i] >= self.clear_hours:
+                    start = s.started[i]
+                    s.started[i] = None
+                    events.append(self._event(key, city, "end", i, hour, s, value, rate,
+                                              hour - start + 1, s.peak[i]))
+        return events
+
+    def active(self):
+        """Open episodes as (key, threshold, start hour, peak) tuples."""
+        return [(key, self.names[i], pd.Timestamp(s.started[i] * 3600, unit="s"), s.peak[i])
+                for key, s in self.series.items()
+                for i in range(len(self.limits)) if s.started[i] is not None]
+
+
+class AlertEngine:
+    """
+    Station- and city-level episode detection over a stream of readings.
+    Sub-hourly readings are folded into running hourly means per station
+    and per city (all of a city's readings in the hour), so each reading
+    costs one O(1) update of each detector.
+    """
+
+    def __init__(self, **kwargs):
+        self.stations = EpisodeDetector("station", **kwargs)
+        self.cities = EpisodeDetector("city", **kwargs)
+        self.hourly = {}   # key -> [hour, sum, n] for the open hour
+        self.last_seen = {}  # location -> newest timestamp processed (epoch ns)
+        self.readings = 0
+
+    def _hourly_mean(self, key, hour, value):
+        acc = self.hourly.get(key)
+        if acc is None or acc[0] != hour:
+            acc = self.hourly[key] = [hour, 0.0, 0]
+        acc[1] += value
+        acc[2] += 1
+        return acc[1] / acc[2]
+
+    def process(self, location, city, timestamp, value):
+        """Feed one reading; returns the station and city events it raised."""
+        return self._process(location, city, pd.Timestamp(timestamp).value, value)
+
+    def _process(self, location, city, ts_ns, value):
+        seen = self.last_seen.get(location)
+        if seen is not None and ts_ns <= seen:
+            return []
+        self.last_seen[location] = ts_ns
+        self.readings += 1
+        hour = ts_ns // 3_600_000_000_000
+        events = self.stations.update(location, hour, self._hourly_mean(location, hour, value), city)
+        events += self.cities.update(city, hour, self._hourly_mean(("city", city), hour, value), city)
+        return events
+
+    def process_frame(self, df):
+        """Replay a frame of readings in timestamp order."""
+        df = df.sort_values("timestamp", kind="stable")
+        events = []
+        stamps = df["timestamp"].to_numpy("datetime64[ns]").astype("int64").tolist()
+        for loc, city, ts_ns, value in zip(df["location"].astype(str).tolist(),
+                                           df["city"].astype(str).tolist(), stamps,
+                                           df["value"].astype(float).tolist()):
+            events += self._process(loc, city, ts_ns, value)
+        return events
+
+    def save(self, path=ALERT_STATE):
+        # plain containers only, so the pickle does not depend on __main__
+        state = {
+            "stations": {k: s.to_tuple() for k, s in self.stations.series.items()},
+            "cities": {k: s.to_tuple() for k, s in self.cities.series.items()},
+            "hourly": self.hourly, "last_seen": self.last_seen, "readings": self.readings,
+        }
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    @classmethod
+    def load(cls, path=ALERT_STATE, **kwargs):
+        engine = cls(**kwargs)
+        if Path(path).exists():
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            engine.stations.series = {k: _Series.from_tuple(v) for k, v in state["stations"].items()}
+            engine.cities.series = {k: _Series.from_tuple(v) for k, v in state["cities"].items()}
+            engine.hourly, engine.last_seen = state["hourly"], state["last_seen"]
+            engine.readings = state["readings"]
+        return engine
+
+
+def replay(engine, dates):
+    """Stream the stored archive through `engine` one day partition at a time."""
+    events = []
+    for _, df in iter_days(dates, columns=["location", "city", "timestamp", "value"]):
+        events += engine.process_frame(df)
+    return events
+
+
+@instrumented("alerts")
+def main(incremental=False):
+    """
+    Replay the archive through the alert engine and write the episode
+    events to outputs/tables/alert_events.csv. Incremental runs resume the
+    saved detector state and only read the days ingested since last time.
+    """
+    try:
+        dirty, batch = pending_changes("alerts")
+        if incremental and Path(ALERT_STATE).exists():
+            engine = AlertEngine.load()
+            dates = sorted(set().union(*dirty.values())) if dirty else []
+        else:
+            engine = AlertEngine()
+            open_store()
+            dates = [p.name.split("=", 1)[1] for p in Path(STORE).glob("date=*")]
+    except FileNotFoundError:
+        raise SystemExit("⚠ No OpenAQ data found. Run fetch_openaq.py first.")
+
+    start, before = time.perf_counter(), engine.readings
+    events = pd.DataFrame(replay(engine, dates), columns=EVENT_COLUMNS)
+    seconds = time.perf_counter() - start
+    engine.save()
+    if batch:
+        mark_processed("alerts", batch)
+
+    OUTT.mkdir(parents=True, exist_ok=True)
+    if incremental and EVENTS.exists():
+        events.to_csv(EVENTS, mode="a", header=False, index=False)
+    else:
+        events.to_csv(EVENTS, index=False)
+
+    n = engine.readings - before
+    rec = current_stage()
+    rec.rows_in(n)
+    rec.rows_out(len(events))
+    for city, k in events["city"].value_counts().items():
+        rec.city(city, events=k)
+    print(f"✅ {len(events)} alert events from {n} readings "
+          f"({n / max(seconds, 1e-9):,.0f} readings/s) -> {EVENTS}")
+    if len(events):
+        print(events.groupby(["level", "event"]).size().to_string())
+    print(f"🚨 Open episodes: {len(engine.stations.active())} station, {len(engine.cities.active())} city")
+    return events
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PM2.5 episode / exceedance alerts")
+    parser.add_argument("--incremental", action="store_true",
+                        help="resume saved state and only process newly ingested days")
+    args = parser.parse_args()
+    main(incremental=args.incremental)
@@ -0,0 +1,239 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ingest import STATE, mark_processed, pending_changes
+from instrument import current_stage, instrumented
+from rollups import ROLLUPS, read_rollup
+
+BASE = Path("projects/air_quality_health")
+OUTT = BASE / "outputs" / "tables"
+AQI_STATE = STATE / "aqi_state.npz"
+
+# CPCB National AQI, PM2.5 (24-hour average, µg/m³). Concentration edges
+# map linearly onto the index edges within each band; above 380 the index
+# is capped at 500.
+PM25_BREAKPOINTS = np.array([0, 30, 60, 90, 120, 250, 380], dtype=float)
+AQI_BREAKPOINTS = np.array([0, 50, 100, 200, 300, 400, 500], dtype=float)
+CATEGORIES = np.array(["Good", "Satisfactory", "Moderate", "Poor", "Very Poor", "Severe"])
+WINDOW_HOURS = 24
+MIN_HOURS = 16  # CPCB: at least 16 of the 24 hours must be reported
+
+
+def pm25_subindex(conc):
+    """
+    NAQI sub-index and category for 24-hour PM2.5 averages (any shape).
+    The band is found with one searchsorted over the breakpoints, so a whole
+    archive is classified in a single vectorised pass; NaN stays NaN.
+    """
+    conc = np.asarray(conc, dtype=float)
+    clipped = np.clip(conc, 0, PM25_BREAKPOINTS[-1])
+    band = np.searchsorted(PM25_BREAKPOINTS[1:-1], clipped, side="left")
+    lo_c, hi_c = PM25_BREAKPOINTS[band], PM25_BREAKPOINTS[band + 1]
+    lo_i, hi_i = AQI_BREAKPOINTS[band], AQI_BREAKPOINTS[band + 1]
+    index = lo_i + (hi_i - lo_i) * (clipped - lo_c) / (hi_c - lo_c)
+    missing = np.isnan(conc)
+    category = np.where(missing, None, CATEGORIES[band])
+    return np.where(missing, np.nan, np.round(index)), category
+
+
+def _with_aqi(df):
+    df["aqi"], df["category"] = pm25_subindex(df["pm25_24h"])
+    return df
+
+
+def rolling_24h(hourly):
+    """
+    Batch 24-hour running means per station from an hourly frame with
+    location / hour / value columns. The window is the 24 hours ending at
+    each reading; hours with fewer than MIN_HOURS readings get NaN.
+    """
+    hourly = hourly.sort_values(["location", "hour"])
+    rolled = (hourly.set_index("hour")
+              .groupby("location", observed=True)["value"]
+              .rolling(f"{WINDOW_HOURS}h", min_periods=MIN_HOURS).mean())
+    return _with_aqi(rolled.rename("pm25_24h").reset_index())
+
+
+class RollingAQI:
+    """
+    Streaming 24-hour averages for many stations. Each station keeps a ring
+    buffer of its last 24 hourly values indexed by hour-of-epoch mod 24, so
+    an update costs O(24) per station however long the history is; hours
+    skipped since a station's last reading are cleared as the ring advances.
+    """
+
+    def __init__(self):
+        self.locations = {}
+        self.buffer = np.empty((0, WINDOW_HOURS))
+        self.last_hour = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def _index(self, locations):
+        new = [loc for loc in pd.unique(locations) if loc not in self.locations]
+        if new:
+            for loc in new:
+                self.locations[loc] = len(self.locations)
+            self.buffer = np.vstack([self.buffer, np.full((len(new), WINDOW_HOURS), np.nan)])
+            self.last_hour = np.concatenate([self.last_hour, np.full(len(new), np.iinfo(np.int64).min // 2)])
+        return np.array([self.locations[loc] for loc in locations], dtype=np.int64)
+
+    def update(self, hourly):
+        """
+        Fold in hourly readings (location / hour / value). Readings older than
+        a station's newest hour are ignored; a repeated hour replaces the
+        stored value.
+        """
+        hours = (pd.to_datetime(hourly["hour"]).to_numpy("datetime64[h]")
+                 .astype(np.int64))
+        idx = self._index(hourly["location"].to_numpy())
+        values = hourly["value"].to_numpy(dtype=float)
+        # only each station's last 24 hours can reach the ring: drop the rest
+        # up front so a whole-archive backfill costs no more than a day
+        newest = np.full(len(self.locations), np.iinfo(np.int64).min)
+        np.maximum.at(newest, idx, hours)
+        keep = hours > newest[idx] - WINDOW_HOURS
+        order = np.argsort(hours[keep], kind="stable")
+        hours, idx, values = hours[keep][order], idx[keep][order], values[keep][order]
+        slots = np.arange(WINDOW_HOURS)
+        # one vectorised step per distinct hour (a station appears at most
+        # once), over contiguous runs of the sorted hours
+        bounds = np.flatnonzero(np.diff(hours)) + 1
+        for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(hours)]):
+            h = hours[lo]
+            i, v = idx[lo:hi], values[lo:hi]
+            fresh = h >= self.last_hour[i]
+            i, v = i[fresh], v[fresh]
+            gap = np.minimum(h - self.last_hour[i], WINDOW_HOURS)
+            # slots for hours last+1 .. h-1 (and h itself) fall out of the window
+            stale = (slots[None, :] - (h - gap[:, None]) - 1) % WINDOW_HOURS < gap[:, None]
+            self.buffer[i] = np.where(stale, np.nan, self.buffer[i])
+            self.buffer[i, h % WINDOW_HOURS] = v
+            self.last_hour[i] = h
+        return self
+
+    def current(self, at=None):
+        """
+        24-hour average, AQI and category per station as of hour `at`
+        (default: each station's own newest hour).
+        """
+        hours, buffer = self.last_hour, self.buffer
+        if at is not None:
+            at = pd.Timestamp(at).to_datetime64().astype("datetime64[h]").astype(np.int64)
+            # slot k holds hour last - ((last - k) mod 24); keep those after at - 24
+            age = (hours[:, None] - np.arange(WINDOW_HOURS)[None, :]) % WINDOW_HOURS
+            valid = (age < WINDOW_HOURS - (at - hours)[:, None]) & (hours <= at)[:, None]
+            buffer = np.where(valid, buffer, np.nan)
+            hours = np.full_like(hours, at)
+        counts = np.sum(~np.isnan(buffer), axis=1)
+        with np.errstate(invalid="ignore"):
+            means = np.nansum(buffer, axis=1) / counts
+        out = pd.DataFrame({
+            "location": list(self.locations),
+            "hour": hours.astype("datetime64[h]").astype("datetime64[us]"),
+            "hours_reported": counts,
+            "pm25_24h": np.where(counts >= MIN_HOURS, means, np.nan),
+        })
+        return _with_aqi(out)
+
+    def save(self, path=AQI_STATE):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(f, locations=np.array(list(self.locations), dtype=str),
+                     buffer=self.buffer, last_hour=self.last_hour)
+        return path
+
+    @classmethod
+    def load(cls, path=AQI_STATE):
+        tracker = cls()
+        if Path(path).exists():
+            with np.load(path) as state:
+                tracker.locations = {loc: i for i, loc in enumerate(state["locations"].tolist())}
+                tracker.buffer = state["buffer"]
+                tracker.last_hour = state["last_hour"]
+        return tracker
+
+
+def _station_hours(dates=None):
+    df = read_rollup("station_hour", dates=dates)
+    return df[["location", "city", "hour", "mean"]].rename(columns={"mean": "value"})
+
+
+def _recent(dates, days=2):
+    """
+    The dates within `days` calendar days of the newest one: a 24-hour
+    window ending on the newest day reaches back at most one day.
+    """
+    if not dates:
+        return []
+    first = (pd.Timestamp(max(dates)) - pd.Timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    return sorted(d for d in dates if d >= first)
+
+
+@instrumented("aqi")
+def main(incremental=False, history=True):
+    """
+    Publish the latest NAQI per station (outputs/tables/aqi_latest.csv).
+    Batch mode recomputes every station-hour into aqi_hourly.csv (the one
+    path that reads the whole station_hour rollup) and rebuilds the
+    streaming state; with history=False it skips aqi_hourly.csv and reads
+    only the last two days. Incremental mode folds in the newest two of
+    the days ingested since the last run.
+    """
+    try:
+        if incremental and Path(AQI_STATE).exists():
+            dirty, batch = pending_changes("aqi")
+            dates = _recent(sorted(set().union(*dirty.values())) if dirty else [])
+            tracker = RollingAQI.load()
+            if dates:
+                hourly = _station_hours(dates)
+                current_stage().rows_in(len(hourly))
+                tracker.update(hourly)
+        elif history:
+            _, batch = pending_changes("aqi")
+            hourly = _station_hours()
+            current_stage().rows_in(len(hourly))
+            rolled = rolling_24h(hourly)
+            OUTT.mkdir(parents=True, exist_ok=True)
+            rolled.merge(hourly[["location", "city"]].drop_duplicates("location"), on="location") \
+                .to_csv(OUTT / "aqi_hourly.csv", index=False)
+            tracker = RollingAQI().update(hourly)
+        else:
+            _, batch = pending_changes("aqi")
+            dates = _recent([p.name.split("=", 1)[1]
+                             for p in (Path(ROLLUPS) / "station_hour").glob("date=*")])
+            if not dates:
+                raise FileNotFoundError(ROLLUPS / "station_hour")
+            hourly = _station_hours(dates)
+            current_stage().rows_in(len(hourly))
+            tracker = RollingAQI().update(hourly)
+    except FileNotFoundError:
+        raise SystemExit("⚠ No OpenAQ data found. Run fetch_openaq.py first.")
+
+    tracker.save()
+    if batch:
+        mark_processed("aqi", batch)
+
+    latest = tracker.current()
+    OUTT.mkdir(parents=True, exist_ok=True)
+    latest.to_csv(OUTT / "aqi_latest.csv", index=False)
+    current_stage().rows_out(len(latest))
+    counts = latest["category"].value_counts()
+    print(f"✅ AQI for {latest['aqi'].notna().sum()}/{len(latest)} stations -> outputs/tables/aqi_latest.csv")
+    if not counts.empty:
+        print("   " + ", ".join(f"{c}: {n}" for c, n in counts.items()))
+    return latest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indian National AQI (PM2.5) per station")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only fold in hours ingested since the last run")
+    parser.add_argument("--no-history", action="store_true",
+                        help="skip aqi_hourly.csv and rebuild from the last two days only")
+    args = parser.parse_args()
+    main(incremental=args.incremental, history=not args.no_history)
@@ -0,0 +1,313 @@
+import argparse
+import datetime
+import functools
+import glob
+import operator
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from instrument import current_stage, instrumented
+from measurement_store import LEGACY, STORE, open_store, read_csv_measurements, to_frame
+
+BASE = Path("projects/air_quality_health")
+OUTT = BASE / "outputs" / "tables"
+TRENDS = OUTT / "city_monthly_trend.csv"
+CLIMATOLOGY = OUTT / "city_climatology.csv"
+
+# Mergeable partial aggregates and how each one merges: every file or
+# partition reduces to these per group and the partials combine exactly, so
+# a whole-archive query never holds more than one batch of raw readings per
+# worker. (Percentiles do not combine this way; the rollup tables keep
+# those per day.)
+PARTIALS = {"count": "sum", "sum": "sum", "sumsq": "sum", "min": "min", "max": "max"}
+AGGREGATES = ("count", "mean", "std", "min", "max")
+GROUP_COLUMNS = {"city": "city", "station": "location", "country": "country"}
+# below a date=YYYY-MM-DD directory only the city key remains
+CITY_PARTITIONING = ds.partitioning(pa.schema([("city", pa.string())]), flavor="hive")
+
+# IMD seasons for the Indian cities in the archive, indexed by month - 1
+SEASONS = pa.array(["winter", "winter", "pre-monsoon", "pre-monsoon", "pre-monsoon",
+                    "monsoon", "monsoon", "monsoon", "monsoon",
+                    "post-monsoon", "post-monsoon", "winter"])
+
+# time buckets (a timestamp per bucket) and climatological cycles (a
+# position within the year / week / day, pooled across years), as Arrow
+# compute on the timestamp column
+BUCKETS = {
+    "hour": lambda ts: pc.floor_temporal(ts, unit="hour"),
+    "day": lambda ts: pc.floor_temporal(ts, unit="day"),
+    "week": lambda ts: pc.floor_temporal(ts, unit="week", week_starts_monday=True),
+    "month": lambda ts: pc.floor_temporal(ts, unit="month"),
+    "year": lambda ts: pc.floor_temporal(ts, unit="year"),
+    "hour_of_day": pc.hour,
+    "day_of_week": pc.day_of_week,  # Monday = 0
+    "month_of_year": pc.month,
+    "season": lambda ts: SEASONS.take(pc.subtract(pc.month(ts), 1)),
+}
+
+
+def _keys(by, bucket):
+    by = [by] if isinstance(by, str) else list(by)
+    unknown = set(by) - set(GROUP_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown group-by column(s): {', '.join(sorted(unknown))}")
+    if bucket is not None and bucket not in BUCKETS:
+        raise ValueError(f"unknown time bucket: {bucket}")
+    return by + ([bucket] if bucket else [])
+
+
+def _columns(by, bucket):
+    cols = [GROUP_COLUMNS[k] for k in by] + ["value"]
+    return cols + ["timestamp"] if bucket else cols
+
+
+def partial_aggregates(table, by=("city",), bucket=None):
+    """count / sum / sumsq / min / max of `value` per group of one Arrow table."""
+    by = [by] if isinstance(by, str) else list(by)
+    keys = _keys(by, bucket)
+    value = table["value"].cast(pa.float64())
+    columns = {}
+    for k in by:
+        col = table[GROUP_COLUMNS[k]]
+        columns[k] = col.cast(pa.string()) if pa.types.is_dictionary(col.type) else col
+    if bucket:
+        columns[bucket] = BUCKETS[bucket](table["timestamp"])
+    columns.update(value=value, sq=pc.multiply(value, value))
+    grouped = pa.table(columns).group_by(keys).aggregate(
+        [("value", "count"), ("value", "sum"), ("sq", "sum"), ("value", "min"), ("value", "max")]
+    )
+    names = {"value_count": "count", "value_sum": "sum", "sq_sum": "sumsq",
+             "value_min": "min", "value_max": "max"}
+    return grouped.rename_columns([names.get(c, c) for c in grouped.column_names])
+
+
+def combine(partials, keys):
+    """Merge partial aggregates of the same groups from different files."""
+    partials = [p for p in partials if p is not None and p.num_rows]
+    if len(partials) == 1:
+        return partials[0]
+    if not partials:
+        return None
+    merged = pa.concat_tables(partials).group_by(keys).aggregate(
+        [(name, op) for name, op in PARTIALS.items()]
+    )
+    return merged.rename_columns([c.rsplit("_", 1)[0] if c not in keys else c
+                                  for c in merged.column_names])
+
+
+def finalize(partials, keys):
+    """Partial aggregates -> count / mean / std / min / max per group."""
+    if partials is None:
+        return pd.DataFrame(columns=[*keys, *AGGREGATES])
+    out = partials.to_pandas()
+    out["mean"] = out["sum"] / out["count"]
+    n = out["count"].astype("float64")
+    var = (out["sumsq"] - n * out["mean"] ** 2) / (n - 1).where(n > 1)
+    out["std"] = np.sqrt(var.clip(lower=0))
+    out = out[[*keys, *AGGREGATES]]
+    return out.sort_values(keys).reset_index(drop=True) if keys else out
+
+
+def _inclusive_end(end):
+    """
+    A date-only `end` ("2025-10-26") means the whole of that day, as in
+    iter_days: its last microsecond. Timestamps with a time pass through.
+    """
+    if end is None:
+        return None
+    ts = pd.Timestamp(end)
+    date_only = (len(end.strip()) == 10 if isinstance(end, str)
+                 else isinstance(end, datetime.date) and not isinstance(end, datetime.datetime))
+    if date_only:
+        return ts + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+    return ts
+
+
+def _filter(cities=None, stations=None, start=None, end=None):
+    """Arrow filter on city, station and timestamp, within one date partition."""
+    exprs = []
+    if cities is not None:
+        exprs.append(ds.field("city").isin(list(cities)))
+    if stations is not None:
+        exprs.append(ds.field("location").isin(list(stations)))
+    if start is not None:
+        exprs.append(ds.field("timestamp") >= pa.scalar(pd.Timestamp(start).to_pydatetime(),
+                                                        pa.timestamp("us")))
+    if end is not None:
+        exprs.append(ds.field("timestamp") <= pa.scalar(pd.Timestamp(end).to_pydatetime(),
+                                                        pa.timestamp("us")))
+    return functools.reduce(operator.and_, exprs) if exprs else None
+
+
+def _reduce(tables, by, bucket, batch_rows):
+    """Partial aggregates of a stream of tables, `batch_rows` rows at a time."""
+    keys = _keys(by, bucket)
+    acc, buffer, buffered, rows = None, [], 0, 0
+    for table in tables:
+        buffer.append(table)
+        buffered += table.num_rows
+        rows += table.num_rows
+        if buffered >= batch_rows:
+            acc = combine([acc, partial_aggregates(pa.concat_tables(buffer), by, bucket)], keys)
+            buffer, buffered = [], 0
+    if buffered:
+        acc = combine([acc, partial_aggregates(pa.concat_tables(buffer), by, bucket)], keys)
+    return acc, rows
+
+
+def _partition_task(task):
+    """Partial aggregates of one date partition of the store."""
+    path, by, bucket, cities, stations, start, end, batch_rows = task
+    day = ds.dataset(path, format="parquet", partitioning=CITY_PARTITIONING)
+    scanner = day.scanner(columns=_columns(by, bucket), batch_size=batch_rows,
+                          filter=_filter(cities, stations, start, end))
+    batches = (pa.Table.from_batches([b]) for b in scanner.to_batches() if b.num_rows)
+    return _reduce(batches, by, bucket, batch_rows)
+
+
+def _csv_task(task):
+    """Partial aggregates of one legacy CSV file, streamed in chunks."""
+    path, by, bucket, cities, stations, start, end, batch_rows = task
+    columns = list(dict.fromkeys(_columns(by, bucket) + ["city", "location", "timestamp"]))
+
+    def chunks():
+        for chunk in read_csv_measurements(path, columns=columns, chunksize=batch_rows):
+            mask = pd.Series(True, index=chunk.index)
+            if cities is not None:
+                mask &= chunk["city"].isin(cities)
+            if stations is not None:
+                mask &= chunk["location"].isin(stations)
+            if start is not None:
+                mask &= chunk["timestamp"] >= pd.Timestamp(start)
+            if end is not None:
+                mask &= chunk["timestamp"] <= pd.Timestamp(end)
+            if mask.any():
+                yield pa.Table.from_pandas(chunk[mask], preserve_index=False)
+
+    return _reduce(chunks(), by, bucket, batch_rows)
+
+
+def archive_files(source="store", start=None, end=None, root=STORE, legacy=LEGACY):
+    """
+    Units of work for a query: the date partitions of the store that can
+    overlap [start, end] (pruned on the directory names), or every legacy
+    openaq_pm25_*.csv file.
+    """
+    if source == "csv":
+        return sorted(glob.glob(str(Path(legacy) / "openaq_pm25_*.csv")))
+    if source != "store":
+        raise ValueError(f"unknown source: {source}")
+    open_store(root)
+    first = pd.Timestamp(start).strftime("%Y-%m-%d") if start is not None else ""
+    last = pd.Timestamp(end).strftime("%Y-%m-%d") if end is not None else "9999"
+    return sorted(str(p) for p in Path(root).glob("date=*")
+                  if first <= p.name.split("=", 1)[1] <= last)
+
+
+def query(by=("city",), bucket=None, cities=None, stations=None, start=None, end=None,
+          source="store", workers=0, batch_rows=1 << 18, root=STORE, legacy=LEGACY):
+    """
+    Out-of-core aggregate of PM2.5 over the whole archive (store partitions
+    or legacy CSV files). Rows are filtered by city, station and time range
+    (both ends inclusive; a date-only `end` covers that whole day),
+    grouped by `by` ("city", "station", "country") plus an optional time
+    `bucket` (see BUCKETS), and reduced to count / mean / std / min / max.
+    Files are reduced to partial aggregates in a process pool of `workers`
+    (0 = all cores, 1 = in-process) and merged as they complete, so memory
+    stays bounded by workers x batch_rows readings.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    keys = _keys(by, bucket)
+    cities = [cities] if isinstance(cities, str) else cities
+    stations = [stations] if isinstance(stations, str) else stations
+    end = _inclusive_end(end)
+    files = archive_files(source, start, end, root=root, legacy=legacy)
+    task = _csv_task if source == "csv" else _partition_task
+    jobs = [(path, by, bucket, cities, stations, start, end, batch_rows) for path in files]
+
+    workers = min(workers or os.cpu_count(), max(len(jobs), 1))
+    acc, pending, rows = None, [], 0
+    if workers == 1:
+        results = map(task, jobs)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(task, jobs, chunksize=max(1, len(jobs) // (workers * 8)))
+    try:
+        for partial, n in results:
+            rows += n
+            pending.append(partial)
+            if len(pending) >= 64:  # fold in as we go so partials never pile up
+                acc, pending = combine([acc, *pending], keys), []
+    finally:
+        if workers != 1:
+            pool.shutdown()
+    acc = combine([acc, *pending], keys)
+
+    rec = current_stage()
+    rec.rows_in(rows)
+    rec.note(files=len(files))
+    return finalize(acc, keys)
+
+
+def city_trends(bucket="month", **kwargs):
+    """Mean PM2.5 per city and calendar `bucket` across every archived file."""
+    return query(by="city", bucket=bucket, **kwargs)
+
+
+def climatology(cycle="month_of_year", by="city", **kwargs):
+    """
+    Seasonal climatology: readings pooled across years by `cycle`
+    ("month_of_year", "season", "day_of_week" or "hour_of_day").
+    """
+    return query(by=by, bucket=cycle, **kwargs)
+
+
+@instrumented("archive")
+def main(workers=0):
+    """Multi-year monthly trends and monthly climatologies per city."""
+    try:
+        trends = city_trends(workers=workers)
+        normals = climatology(workers=workers)
+    except FileNotFoundError:
+        raise SystemExit("⚠ No OpenAQ data found. Run fetch_openaq.py first.")
+    OUTT.mkdir(parents=True, exist_ok=True)
+    trends.to_csv(TRENDS, index=False)
+    normals.to_csv(CLIMATOLOGY, index=False)
+    current_stage().rows_out(len(trends) + len(normals))
+    print(f"📅 {trends['month'].nunique()} month(s) across {trends['city'].nunique()} cities")
+    print(f"✅ archive tables -> {TRENDS} and {CLIMATOLOGY}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggregate PM2.5 over the whole archive")
+    parser.add_argument("--by", nargs="*", default=["city"], choices=sorted(GROUP_COLUMNS))
+    parser.add_argument("--bucket", default=None, choices=sorted(BUCKETS))
+    parser.add_argument("--cities", nargs="*", default=None)
+    parser.add_argument("--stations", nargs="*", default=None)
+    parser.add_argument("--start", default=None, help="first timestamp (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="last timestamp, or last whole day (YYYY-MM-DD)")
+    parser.add_argument("--source", default="store", choices=["store", "csv"],
+                        help="partitioned store, or the legacy openaq_pm25_*.csv files")
+    parser.add_argument("--workers", type=int, default=0, help="0 = all cores")
+    parser.add_argument("--out", default=None, help="write the result to this CSV")
+    parser.add_argument("--tables", action="store_true",
+                        help="write the monthly trend and climatology tables")
+    args = parser.parse_args()
+    if args.tables:
+        main(workers=args.workers)
+    else:
+        result = query(by=args.by, bucket=args.bucket, cities=args.cities,
+                       stations=args.stations, start=args.start, end=args.end,
+                       source=args.source, workers=args.workers)
+        if args.out:
+            result.to_csv(args.out, index=False)
+            print(f"✅ {len(result)} group(s) -> {args.out}")
+        else:
+            print(result.to_string(index=False, float_format="{:.2f}".format))
@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from fast_forecast import forecast_errors, harmonic_forecast
+from instrument import current_stage, instrumented
+from rollups import city_daily
+
+BASE = Path("projects/air_quality_health")
+OUTT = BASE / "outputs" / "tables"
+CACHE = BASE / "outputs" / "backtests"  # cache_<engine>.parquet: memoized forecasts
+METRICS = OUTT / "backtest_metrics.csv"  # engine x city x horizon day
+SUMMARY = OUTT / "backtest_summary.csv"  # engine x city (+ "All cities")
+CUTOFF_EPOCH = pd.Timestamp("2000-01-03")  # a Monday; cutoffs fall on a fixed weekly grid
+FORECAST_COLUMNS = ["ds", "yhat", "yhat_lower", "yhat_upper"]
+SCORE_COLUMNS = ["mae", "rmse", "mape", "coverage", "n"]
+
+
+def _prophet(history, periods):
+    from forecast_pm25 import _prophet_forecast
+    _, forecast = _prophet_forecast(history, periods=periods)
+    return forecast
+
+
+def _harmonic(history, periods, harmonics=3):
+    return harmonic_forecast(history.assign(city="_"), periods=periods, harmonics=harmonics,
+                             min_days=1)
+
+
+def _seasonal_naive(history, periods, season=7, interval_width=0.8):
+    """Repeat the last `season` days; bounds from the in-sample seasonal-lag errors."""
+    y = history.set_index("date")["value"].asfreq("D").ffill()
+    last = y.iloc[-season:].to_numpy()
+    errors = (y - y.shift(season)).dropna().to_numpy()
+    lo, hi = (np.quantile(errors, [(1 - interval_width) / 2, (1 + interval_width) / 2])
+              if len(errors) else (0.0, 0.0))
+    yhat = np.resize(last, periods)
+    ds = pd.date_range(y.index[-1] + pd.Timedelta(days=1), periods=periods, freq="D")
+    return pd.DataFrame({"ds": ds, "yhat": yhat, "yhat_lower": yhat + lo, "yhat_upper": yhat + hi})
+
+
+@dataclass(frozen=True)
+class Engine:
+    """
+    A forecaster under test: `forecast(history, periods, **params)` takes
+    one city's date / value history and returns at least ds, yhat,
+    yhat_lower and yhat_upper. Engines with parallel=True (slow per-city
+    fits) run in the process pool, the rest in-process.
+    """
+    name: str
+    forecast: object
+    params: dict = field(default_factory=dict)
+    parallel: bool = False
+
+
+ENGINES = {
+    "prophet": Engine("prophet", _prophet, parallel=True),
+    "harmonic": Engine("harmonic", _harmonic, {"harmonics": 3}),
+    "naive": Engine("naive", _seasonal_naive, {"season": 7}),
+}
+
+
+def cutoffs(first, last, horizon=30, step=7, origins=4, min_train=28):
+    """
+    The latest `origins` forecast origins on a fixed `step`-day grid that
+    leave `min_train` days of history and a full `horizon` of actuals.
+    A fixed grid keeps cutoffs (and their memoized fits) stable as new
+    days arrive.
+    """
+    lo = pd.Timestamp(first) + pd.Timedelta(days=min_train - 1)
+    hi = pd.Timestamp(last) - pd.Timedelta(days=horizon)
+    if hi < lo:
+        return []
+    start = CUTOFF_EPOCH + pd.Timedelta(days=-(-(lo - CUTOFF_EPOCH).days // step) * step)
+    grid = pd.date_range(start, hi, freq=f"{step}D")
+    return list(grid[-origins:])
+
+
+def fit_key(engine, city, cutoff, history):
+    """Memo key: engine, its parameters, city, cutoff and a hash of the training data."""
+    h = hashlib.sha256(json.dumps([engine.name, engine.params, city, str(cutoff.date())],
+                                  sort_keys=True).encode())
+    h.update(pd.util.hash_pandas_object(history[["date", "value"]], index=False).to_numpy().tobytes())
+    return h.hexdigest()[:24]
+
+
+def _run_job(job):
+    """
+    Fit one (engine, city, cutoff); runs in a worker for parallel engines.
+    Errors are returned rather than raised, as in forecast_pm25._fit_city,
+    so one failed fit does not stop the others. Returns (forecast or None,
+    fit seconds, error or None).
+    """
+    name, city, cutoff, history, horizon = job
+    engine = ENGINES[name]
+    start = time.perf_counter()
+    try:
+        forecast = engine.forecast(history, horizon, **engine.params)
+        forecast = forecast[forecast["ds"] > cutoff][FORECAST_COLUMNS].head(horizon)
+    except Exception as e:
+        return None, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return forecast, time.perf_counter() - start, None
+
+
+def _failed_forecast(cutoff, horizon):
+    """NaN predictions over the horizon of a failed fit, so it scores as NaN."""
+    ds = pd.date_range(cutoff + pd.Timedelta(days=1), periods=horizon, freq="D")
+    return pd.DataFrame({"ds": ds, **{c: np.nan for c in FORECAST_COLUMNS[1:]}})
+
+
+def _cache_path(name, cache_dir=CACHE):
+    return Path(cache_dir) / f"cache_{name}.parquet"
+
+
+def run_backtest(daily, engines=("prophet", "harmonic", "naive"), horizon=30, step=7,
+                 origins=4, min_train=28, workers=0, cache_dir=CACHE):
+    """
+    Rolling-origin forecasts of every city by every engine. Each fit is
+    memoized on disk under fit_key(), so only new (engine, city, cutoff)
+    combinations, or ones whose training data changed, are refitted; a fit
+    that fails is scored as NaN and retried on the next run. Entries whose
+    key is not part of this run are dropped from the cache.
+    Returns the predictions with engine, city, cutoff and horizon columns.
+    """
+    rec = current_stage()
+    frames, jobs, fitted, hits = [], {}, 0, 0
+    caches, keys = {}, {name: set() for name in engines}
+    for name in engines:
+        engine = ENGINES[name]
+        path = _cache_path(name, cache_dir)
+        caches[name] = pd.read_parquet(path) if path.exists() else pd.DataFrame(columns=["key"])
+        cached = dict(tuple(caches[name].groupby("key"))) if len(caches[name]) else {}
+        for city, group in daily.groupby("city"):
+            group = group.sort_values("date")
+            for cutoff in cutoffs(group["date"].min(), group["date"].max(), horizon, step,
+                                  origins, min_train):
+                history = group[group["date"] <= cutoff][["date", "value"]].reset_index(drop=True)
+                key = fit_key(engine, city, cutoff, history)
+                keys[name].add(key)
+                meta = {"engine": name, "city": city, "cutoff": cutoff}
+                if key in cached:
+                    frames.append(cached[key][FORECAST_COLUMNS].assign(**meta))
+                    hits += 1
+                else:
+                    jobs[key] = (name, city, cutoff, history, horizon)
+
+    results = {}
+    serial = {k: job for k, job in jobs.items() if not ENGINES[job[0]].parallel}
+    parallel = {k: job for k, job in jobs.items() if ENGINES[job[0]].parallel}
+    for key, job in serial.items():
+        results[key] = _run_job(job)
+    workers = workers or os.cpu_count()
+    if parallel and workers == 1:
+        for key, job in tqdm(parallel.items()):
+            results[key] = _run_job(job)
+    elif parallel:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_run_job, job): key for key, job in parallel.items()}
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:  # the worker itself died
+                    results[futures[future]] = None, 0.0, f"{type(e).__name__}: {e}"
+
+    new = {name: [] for name in engines}
+    failed = []
+    for key, (forecast, seconds, err) in results.items():
+        name, city, cutoff = jobs[key][:3]
+        if err:
+            forecast = _failed_forecast(cutoff, jobs[key][4])
+            failed.append((name, city, cutoff, err))
+        else:
+            new[name].append(forecast.assign(key=key))
+            fitted += 1
+        frames.append(forecast.assign(engine=name, city=city, cutoff=cutoff))
+        rec.city(city, fits=1, fit_s=round(seconds, 3), **({"errors": 1} if err else {}))
+    for name, city, cutoff, err in failed:
+        print(f"⚠ {name} / {city} / {cutoff:%Y-%m-%d}: fit failed ({err})")
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    for name, parts in new.items():
+        kept = caches[name][caches[name]["key"].isin(keys[name])]
+        if parts or len(kept) < len(caches[name]):
+            pd.concat([kept, *parts], ignore_index=True) \
+                .to_parquet(_cache_path(name, cache_dir), index=False)
+    rec.note(fits=fitted, cache_hits=hits, failed_fits=len(failed))
+    print(f"🔁 {fitted} fit(s), {hits} reused from the backtest cache")
+
+    if not frames:
+        return pd.DataFrame(columns=["engine", "city", "cutoff", "horizon", *FORECAST_COLUMNS])
+    predictions = pd.concat(frames, ignore_index=True)
+    predictions["horizon"] = (predictions["ds"] - predictions["cutoff"]).dt.days
+    return predictions
+
+
+def score(daily, predictions):
+    """
+    (metrics, summary): MAE / RMSE / MAPE / coverage per engine, city and
+    horizon day, and per engine and city over all horizons, with an
+    "All cities" row per engine.
+    """
+    actual = daily.rename(columns={"date": "ds", "value": "y"})
+    metrics = forecast_errors(actual, predictions, by=["engine", "city", "horizon"])
+    per_city = forecast_errors(actual, predictions, by=["engine", "city"]).merge(
+        predictions.groupby(["engine", "city"])["cutoff"].nunique().rename("origins").reset_index(),
+        on=["engine", "city"],
+    )
+    overall = forecast_errors(actual, predictions, by=["engine"]).merge(
+        predictions.groupby("engine")["cutoff"].nunique().rename("origins").reset_index(),
+        on="engine",
+    ).assign(city="All cities")
+    return metrics, pd.concat([per_city, overall[per_city.columns]], ignore_index=True)
+
+
+@instrumented("backtest")
+def main(engines=("prophet", "harmonic", "naive"), horizon=30, step=7, origins=4,
+         min_train=28, workers=0):
+    """Backtest the forecast engines and write the accuracy tables."""
+    unknown = set(engines) - set(ENGINES)
+    if unknown:
+        raise SystemExit(f"⚠ Unknown engine(s): {', '.join(sorted(unknown))}")
+    try:
+        daily = city_daily()
+    except FileNotFoundError:
+        raise SystemExit("⚠ No OpenAQ data found. Run fetch_openaq.py first.")
+    current_stage().rows_in(len(daily))
+
+    predictions = run_backtest(daily, engines=engines, horizon=horizon, step=step,
+                               origins=origins, min_train=min_train, workers=workers)
+    OUTT.mkdir(parents=True, exist_ok=True)
+    if predictions.empty:
+        # not enough history yet is a normal state: leave empty tables, don't fail the run
+        metrics = pd.DataFrame(columns=["engine", "city", "horizon", *SCORE_COLUMNS])
+        summary = pd.DataFrame(columns=["engine", "city", *SCORE_COLUMNS, "origins"])
+        metrics.to_csv(METRICS, index=False)
+        summary.to_csv(SUMMARY, index=False)
+        current_stage().note(skipped="insufficient history")
+        print(f"ℹ Need at least {min_train + horizon} days of history to backtest; "
+              f"wrote empty tables.")
+        return summary
+    metrics, summary = score(daily, predictions)
+    metrics.to_csv(METRICS, index=False)
+    summary.to_csv(SUMMARY, index=False)
+    current_stage().rows_out(len(metrics))
+
+    overall = summary[summary["city"] == "All cities"].set_index("engine")
+    print(overall[["mae", "rmse", "mape", "coverage", "origins"]].round(2).to_string())
+    print(f"✅ backtest tables -> {METRICS} and {SUMMARY}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the forecast engines")
+    parser.add_argument("--engines", nargs="*", default=["prophet", "harmonic", "naive"],
+                        choices=sorted(ENGINES))
+    parser.add_argument("--horizon", type=int, default=30, help="days ahead to score")
+    parser.add_argument("--step", type=int, default=7, help="days between forecast origins")
+    parser.add_argument("--origins", type=int, default=4, help="origins per city")
+    parser.add_argument("--min-train", type=int, default=28, help="days of history required")
+    parser.add_argument("--workers", type=int, default=0, help="0 = all cores")
+    args = parser.parse_args()
+    main(engines=args.engines, horizon=args.horizon, step=args.step, origins=args.origins,
+         min_train=args.min_train, workers=args.workers)
@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import glob
+import gzip
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+from aiohttp import web
+
+BASE = Path("projects/air_quality_health")
+ARROW = "application/vnd.apache.arrow.stream"
+DEFAULT_LIMIT, MAX_LIMIT = 1000, 50_000
+RESERVED = {"offset", "limit", "format", "columns"}
+
+
+def _city_means(paths):
+    # exact all-time mean from the per-day partial sums, as the dashboards do
+    daily = pd.read_parquet(paths[0], columns=["city", "sum", "count"])
+    out = daily.groupby("city")[["sum", "count"]].sum()
+    out["value"] = out["sum"] / out["count"]
+    return out[["value", "count"]].reset_index()
+
+
+def _read_csvs(paths):
+    return pd.concat([pd.read_csv(p) for p in paths], ignore_index=True)
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """
+    One API resource: `load(paths)` builds its frame from the files
+    matching `sources` (globs under BASE), which the pipeline `stage`
+    produces.
+    """
+    name: str
+    sources: tuple
+    stage: str
+    load: object = _read_csvs
+    description: str = ""
+
+
+DATASETS = {d.name: d for d in [
+    Dataset("city_means", ("data/store/rollups/city_day.parquet",), "rollup", _city_means,
+            "all-time mean PM2.5 per city"),
+    Dataset("city_window", ("data/store/rollups/city_window.parquet",), "rollup",
+            lambda paths: pd.read_parquet(paths[0]), "30-day PM2.5 statistics per city"),
+    Dataset("trends", ("outputs/tables/city_monthly_trend.csv",), "archive",
+            description="monthly PM2.5 per city over the whole archive"),
+    Dataset("climatology", ("outputs/tables/city_climatology.csv",), "archive",
+            description="PM2.5 per city and month of year, pooled across years"),
+    Dataset("decomposition", ("outputs/tables/decomposition.csv",), "decompose",
+            description="trend / seasonal / residual per city and day"),
+    Dataset("forecasts", ("outputs/tables/forecast_*.csv",), "forecast",
+            lambda paths: _read_csvs([p for p in paths
+                                      if not p.endswith("forecast_engine_comparison.csv")]),
+            "30-day forecasts per city"),
+    Dataset("backtest_metrics", ("outputs/tables/backtest_metrics.csv",), "backtest",
+            description="forecast errors per engine, city and horizon day"),
+    Dataset("backtest_summary", ("outputs/tables/backtest_summary.csv",), "backtest",
+            description="forecast errors per engine and city"),
+    Dataset("regression", ("outputs/tables/pm25_mortality_coefficients.csv",), "regress",
+            description="PM2.5 vs mortality coefficients (pooled OLS and fixed effects)"),
+    Dataset("aqi", ("outputs/tables/aqi_latest.csv",), "aqi",
+            description="latest 24-hour AQI per station"),
+    Dataset("aqi_hourly", ("outputs/tables/aqi_hourly.csv",), "aqi",
+            description="hourly AQI per station"),
+    Dataset("health_burden", ("outputs/tables/health_burden.csv",), "burden",
+            description="attributable deaths per city"),
+]}
+
+
+def source_files(dataset, base=BASE):
+    return sorted(p for pattern in dataset.sources for p in glob.glob(str(Path(base) / pattern)))
+
+
+def fingerprint(paths):
+    """sha1 of (path, mtime_ns, size) of each source file: one stat per file."""
+    h = hashlib.sha1()
+    for p in paths:
+        st = Path(p).stat()
+        h.update(f"{p}:{st.st_mtime_ns}:{st.st_size}".encode())
+    return h.hexdigest()[:16]
+
+
+class DataCache:
+    """
+    Frames of the registered datasets held in memory, shared by every
+    request. A dataset's source files are re-stat'ed at most every
+    `refresh_s` seconds and the frame is reloaded only when their
+    fingerprint changes. Rendered pages are kept in an LRU of up to
+    `max_bytes`, keyed on the dataset version and the normalised query, so
+    repeated requests from many dashboards cost one dict lookup.
+    """
+
+    def __init__(self, datasets=DATASETS, base=BASE, refresh_s=1.0, max_bytes=256 << 20):
+        self.datasets, self.base, self.refresh_s = datasets, Path(base), refresh_s
+        self.entries = {}  # name -> (version, frame, checked_at)
+        self.locks = {name: asyncio.Lock() for name in datasets}
+        self.bodies, self.body_bytes, self.max_bytes = OrderedDict(), 0, max_bytes
+        self.stats = {"loads": 0, "hits": 0, "renders": 0, "not_modified": 0}
+
+    async def get(self, name):
+        """(version, frame) of one dataset, reloaded if its sources changed."""
+        entry = self.entries.get(name)
+        if entry and time.monotonic() - entry[2] < self.refresh_s:
+            return entry[:2]
+        async with self.locks[name]:
+            loop = asyncio.get_running_loop()
+            dataset = self.datasets[name]
+            paths = await loop.run_in_executor(None, source_files, dataset, self.base)
+            if not paths:
+                raise FileNotFoundError(
+                    f"{name} has not been produced yet; run the {dataset.stage} stage"
+                )
+            version = await loop.run_in_executor(None, fingerprint, paths)
+            entry = self.entries.get(name)
+            if entry is None or entry[0] != version:
+                frame = await loop.run_in_executor(None, dataset.load, paths)
+                self.stats["loads"] += 1
+                self.drop(name, keep=version)
+            else:
+                frame = entry[1]
+            self.entries[name] = (version, frame, time.monotonic())
+            return version, frame
+
+    def body(self, key):
+        body = self.bodies.get(key)
+        if body is not None:
+            self.bodies.move_to_end(key)
+            self.stats["hits"] += 1
+        return body
+
+    def drop(self, name, keep=None):
+        """Forget the rendered pages of `name` other than version `keep`."""
+        for key in [k for k in self.bodies if k[0] == name and k[1] != keep]:
+            self.body_bytes -= len(self.bodies.pop(key)[0])
+
+    def keep(self, key, body):
+        self.bodies[key] = body
+        self.body_bytes += len(body[0])
+        while self.body_bytes > self.max_bytes and len(self.bodies) > 1:
+            _, old = self.bodies.popitem(last=False)
+            self.body_bytes -= len(old[0])
+
+
+def parse_query(query, frame):
+    """
+    (filters, columns, offset, limit) from the query string. Any other
+    parameter naming a column filters on it; repeat it or separate values
+    with commas to match several.
+    """
+    try:
+        offset = int(query.get("offset", 0))
+        limit = min(int(query.get("limit", DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        raise web.HTTPBadRequest(text="offset and limit must be integers")
+    if offset < 0 or limit < 1:
+        raise web.HTTPBadRequest(text="offset must be >= 0 and limit >= 1")
+    columns = None
+    if "columns" in query:
+        columns = [c for c in query["columns"].split(",") if c]
+    filters = {}
+    for key in sorted(set(query) - RESERVED):
+        filters[key] = sorted({v for value in query.getall(key) for v in value.split(",")})
+    unknown = (set(filters) | set(columns or ())) - set(frame.columns)
+    if unknown:
+        raise web.HTTPBadRequest(text=f"unknown column(s): {', '.join(sorted(unknown))}")
+    return filters, columns, offset, limit
+
+
+def select(frame, filters, columns):
+    for col, values in filters.items():
+        # compare as strings so query values match numeric and date columns
+        frame = frame[frame[col].astype(str).isin(values)]
+    return frame[columns] if columns else frame
+
+
+def render(name, version, frame, filters, columns, offset, limit, fmt):
+    """Serialise one page; returns (body, content type, total rows)."""
+    rows = select(frame, filters, columns)
+    total = len(rows)
+    page = rows.iloc[offset:offset + limit]
+    if fmt == "arrow":
+        table = pa.Table.from_pandas(page, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), ARROW, total
+    meta = {"dataset": name, "version": version, "total": total, "offset": offset,
+            "limit": limit, "next": offset + limit if offset + limit < total else None}
+    records = page.to_json(orient="records", date_format="iso", double_precision=15)
+    body = json.dumps(meta)[:-1] + ', "records": ' + records + "}"
+    return body.encode(), "application/json", total
+
+
+def make_api_app(cache):
+    """
+    aiohttp app over `cache`: GET /v1 lists the datasets and
+    GET /v1/{dataset} returns one page of rows as JSON (default) or Arrow
+    (?format=arrow, or Accept: application/vnd.apache.arrow.stream).
+    Every response carries an ETag; a matching If-None-Match (or *) gets a 304.
+    """
+    async def index(request):
+        listing = []
+        for name, dataset in cache.datasets.items():
+            item = {"name": name, "description": dataset.description, "stage": dataset.stage}
+            try:
+                version, frame = await cache.get(name)
+                item.update(version=version, rows=len(frame), columns=list(frame.columns))
+            except FileNotFoundError:
+                item.update(version=None, rows=0, columns=[])
+            listing.append(item)
+        return web.json_response({"datasets": listing})
+
+    async def health(request):
+        return web.json_response({"status": "ok", **cache.stats, "cached_bytes": cache.body_bytes})
+
+    async def dataset(request):
+        name = request.match_info["name"]
+        if name not in cache.datasets:
+            raise web.HTTPNotFound(text=f"unknown dataset: {name}")
+        try:
+            version, frame = await cache.get(name)
+        except FileNotFoundError as e:
+            raise web.HTTPNotFound(text=str(e))
+        filters, columns, offset, limit = parse_query(request.query, frame)
+        fmt = request.query.get("format") or (
+            "arrow" if ARROW in request.headers.get("Accept", "") else "json")
+        if fmt not in ("json", "arrow"):
+            raise web.HTTPBadRequest(text="format must be json or arrow")
+
+        key = (name, version, json.dumps([filters, columns, offset, limit, fmt], sort_keys=True))
+        encode = "gzip" in request.headers.get("Accept-Encoding", "")
+        # the ETag follows from the dataset version and the query alone, so a
+        # revalidation is answered before anything is rendered
+        etag = hashlib.sha1(repr(key).encode()).hexdigest()[:20] + ("-gz" if encode else "")
+        headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache",
+                   "Vary": "Accept, Accept-Encoding", "X-Dataset-Version": version}
+        if any(tag.value in (etag, "*") for tag in request.if_none_match or ()):
+            cache.stats["not_modified"] += 1
+            return web.Response(status=304, headers=headers)
+
+        cached = cache.body(key + (encode,))
+        if cached is None:
+            cache.stats["renders"] += 1
+            body, content_type, total = await asyncio.get_running_loop().run_in_executor(
+                None, render, name, version, frame, filters, columns, offset, limit, fmt
+            )
+            if encode:
+                body = gzip.compress(body, compresslevel=5)
+            cached = (body, content_type, total)
+            cache.keep(key + (encode,), cached)
+        body, content_type, total = cached
+
+        headers["X-Total-Count"] = str(total)
+        if offset + limit < total:
+            headers["Link"] = f'<{request.rel_url.update_query(offset=offset + limit)}>; rel="next"'
+        if encode:
+            headers["Content-Encoding"] = "gzip"
+        return web.Response(body=body, content_type=content_type, headers=headers)
+
+    app = web.Application()
+    app.add_routes([web.get("/v1", index), web.get("/healthz", health),
+                    web.get("/v1/{name}", dataset)])
+    return app
+
+
+def serve(host="127.0.0.1", port=8600, refresh_s=1.0, base=BASE):
+    cache = DataCache(base=base, refresh_s=refresh_s)
+    print(f"✅ Serving {len(cache.datasets)} datasets on http://{host}:{port}/v1")
+    web.run_app(make_api_app(cache), host=host, port=port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only HTTP API over the pipeline outputs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--refresh", type=float, default=1.0,
+                        help="seconds between checks of the output files")
+    args = parser.parse_args()
+    serve(host=args.host, port=args.port, refresh_s=args.refresh)
@@ -1,42 +1,154 @@
+import argparse
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from statsmodels.tsa.seasonal import seasonal_decompose
+from numpy.lib.stride_tricks import sliding_window_view
 from pathlib import Path
 from tqdm import tqdm
-import glob
+from rollups import city_daily
+from ingest import mark_processed, pending_changes
+from instrument import current_stage, instrumented
 
 BASE = Path("projects/air_quality_health")
-DATA = BASE / "data" / "openaq"
-OUTP = BASE / "outputs" / "plots"
 OUTT = BASE / "outputs" / "tables"
-OUTP.mkdir(parents=True, exist_ok=True)
 OUTT.mkdir(parents=True, exist_ok=True)
 
-# load latest OpenAQ file
-files = sorted(glob.glob(str(DATA / "openaq_pm25_IN_*.csv")))
-if not files:
-    raise SystemExit("⚠ No OpenAQ data found. Run fetch_openaq.py first.")
-
-df = pd.read_csv(files[-1])
-df["timestamp"] = pd.to_datetime(df["timestamp"])
-df["date"] = df["timestamp"].dt.date
-daily = df.groupby(["city", "date"])["value"].mean().reset_index()
-
-for city, group in tqdm(daily.groupby("city")):
-    if len(group) < 14:  # need at least 2 weeks for decomposition
-        continue
-    g = group.set_index("date").asfreq("D").interpolate()
-    result = seasonal_decompose(g["value"], model="additive", period=7)
-    fig = result.plot()
-    fig.suptitle(f"Seasonal Decomposition of PM2.5 — {city}")
-    plt.tight_layout()
-    out = OUTP / f"decompose_{city.replace(' ', '_')}.png"
-    plt.savefig(out)
-    plt.close()
-    # save trend for aggregation
-    trend_df = result.trend.dropna().reset_index()
-    trend_df.columns = ["date", "trend"]
-    trend_df["city"] = city
-    trend_df.to_csv(OUTT / f"trend_{city.replace(' ', '_')}.csv", index=False)
-
-print("✅ decomposition plots & trends saved in outputs/plots and outputs/tables")
+COMPONENTS = ["city", "date", "observed", "trend", "seasonal", "resid"]
+
+
+def decompose_all(daily, period=7, min_days=14):
+    """
+    Additive seasonal decomposition of every city in one vectorised pass.
+
+    Daily means are pivoted to a dense day x city array; interior gaps are
+    interpolated as asfreq("D").interpolate() would, then the centred moving
+    average, phase-wise seasonal indices and residuals are computed for all
+    columns at once. Each city's seasonal phase starts at its own first
+    observation, so the output matches statsmodels' seasonal_decompose
+    (model="additive") per city to floating-point round-off.
+    """
+    wide = daily.pivot(index="date", columns="city", values="value")
+    wide = wide.loc[:, wide.notna().sum() >= min_days]
+    if wide.empty:
+        return pd.DataFrame(columns=COMPONENTS)
+    wide = wide.asfreq("D")
+    observed = wide.interpolate(limit_area="inside").to_numpy(dtype=float)
+    n_days, n_cities = observed.shape
+
+    # centred moving average; windows touching a city's edges stay NaN
+    if period % 2 == 0:
+        filt = np.r_[0.5, np.ones(period - 1), 0.5] / period
+    else:
+        filt = np.repeat(1.0 / period, period)
+    half = len(filt) // 2
+    trend = np.full_like(observed, np.nan)
+    trend[half:n_days - half] = sliding_window_view(observed, len(filt), axis=0) @ filt
+
+    # seasonal indices: mean detrended value per phase, centred to sum to zero
+    row = np.arange(n_days)[:, None]
+    col = np.broadcast_to(np.arange(n_cities), observed.shape)
+    inside = ~np.isnan(observed)
+    first = np.where(inside, row, n_days).min(axis=0)
+    phase = (row - first) % period
+    detrended = observed - trend
+    valid = ~np.isnan(detrended)
+    key = phase[valid] * n_cities + col[valid]
+    sums = np.bincount(key, weights=detrended[valid], minlength=period * n_cities)
+    counts = np.bincount(key, minlength=period * n_cities)
+    indices = (sums / counts).reshape(period, n_cities)
+    indices -= indices.mean(axis=0)
+    seasonal = np.where(inside, indices[phase, col], np.nan)
+    resid = observed - trend - seasonal
+
+    t_idx, c_idx = np.nonzero(inside)
+    order = np.lexsort((t_idx, c_idx))
+    t_idx, c_idx = t_idx[order], c_idx[order]
+    return pd.DataFrame({
+        "city": wide.columns.to_numpy()[c_idx],
+        "date": wide.index[t_idx],
+        "observed": observed[t_idx, c_idx],
+        "trend": trend[t_idx, c_idx],
+        "seasonal": seasonal[t_idx, c_idx],
+        "resid": resid[t_idx, c_idx],
+    })
+
+
+def decompose_each(daily, period=7, min_days=14):
+    """Reference path: statsmodels seasonal_decompose once per city."""
+    from statsmodels.tsa.seasonal import seasonal_decompose
+
+    frames = []
+    for city, group in tqdm(daily.groupby("city")):
+        if len(group) < min_days:  # need at least 2 weeks for decomposition
+            continue
+        g = group.set_index("date")[["value"]].asfreq("D").interpolate()
+        result = seasonal_decompose(g["value"], model="additive", period=period)
+        frames.append(pd.DataFrame({
+            "city": city,
+            "date": g.index,
+            "observed": result.observed.to_numpy(),
+            "trend": result.trend.to_numpy(),
+            "seasonal": result.seasonal.to_numpy(),
+            "resid": result.resid.to_numpy(),
+        }))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COMPONENTS)
+
+
+@instrumented("decompose")
+def main(incremental=False, method="batched", plots=True):
+    """
+    Decompose daily PM2.5 per city into outputs/tables/decomposition.csv.
+    With incremental=True only cities whose data changed since the last
+    incremental run are reprocessed; method="statsmodels" runs the per-city
+    reference implementation instead of the batched one. plots=False leaves
+    the figures to a separate render_plots run.
+    """
+    cities, batch = None, None
+    if incremental:
+        dirty, batch = pending_changes("decompose_pm25")
+        if not dirty:
+            print("✅ decomposition up to date; no changed cities")
+            return
+        cities = sorted(dirty)
+
+    # daily means (of the changed cities only, if incremental) from the rollups
+    try:
+        daily = city_daily(cities=cities)
+    except FileNotFoundError:
+        raise SystemExit("⚠ No OpenAQ data found. Run fetch_openaq.py first.")
+
+    if method == "statsmodels":
+        result = decompose_each(daily)
+    else:
+        result = decompose_all(daily)
+    rec = current_stage()
+    rec.note(method=method, incremental=incremental)
+    rec.rows_in(len(daily))
+    rec.rows_out(len(result))
+    for city, n in daily["city"].value_counts().items():
+        rec.city(city, rows_in=n)
+    for city, n in result["city"].value_counts().items():
+        rec.city(city, rows_out=n)
+
+    out = OUTT / "decomposition.csv"
+    if incremental and out.exists():
+        # keep the untouched cities from the previous run
+        previous = pd.read_csv(out, parse_dates=["date"])
+        previous = previous[~previous["city"].isin(cities)]
+        result = pd.concat([previous, result], ignore_index=True).sort_values(["city", "date"])
+    result.to_csv(out, index=False)
+    if plots:
+        from render_plots import render
+        render(kinds=("decompose",))
+
+    if incremental:
+        mark_processed("decompose_pm25", batch)
+    print("✅ decomposition plots & table saved in outputs/plots and outputs/tables/decomposition.csv")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seasonal decomposition of city PM2.5")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only reprocess cities changed since the last run")
+    parser.add_argument("--method", choices=["batched", "statsmodels"], default="batched")
+    args = parser.parse_args()
+    main(incremental=args.incremental, method=args.method)
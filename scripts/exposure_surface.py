@@ -0,0 +1,332 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from fetch_openaq import CITIES
+from instrument import current_stage, instrumented
+from rollups import ROLLUPS, read_rollup
+from station_index import StationIndex, chord_to_km, load_station_index
+
+BASE = Path("projects/air_quality_health")
+SURFACES = BASE / "outputs" / "surfaces"
+OUTT = BASE / "outputs" / "tables"
+
+GRID_RES = 0.01       # degrees, about 1 km
+TILE_CELLS = 65_536   # grid cells interpolated per task
+
+
+@dataclass
+class Grid:
+    """Regular lat/lon grid of `ny` x `nx` cells of `res` degrees from (lat0, lon0)."""
+    lat0: float
+    lon0: float
+    res: float
+    ny: int
+    nx: int
+
+    @classmethod
+    def around(cls, lat, lon, res=GRID_RES, pad=0.5):
+        """Smallest grid covering the points plus `pad` degrees on each side."""
+        lat0, lon0 = np.min(lat) - pad, np.min(lon) - pad
+        ny = int(np.ceil((np.max(lat) + pad - lat0) / res))
+        nx = int(np.ceil((np.max(lon) + pad - lon0) / res))
+        return cls(float(lat0), float(lon0), res, ny, nx)
+
+    def lats(self):
+        return self.lat0 + (np.arange(self.ny) + 0.5) * self.res
+
+    def lons(self):
+        return self.lon0 + (np.arange(self.nx) + 0.5) * self.res
+
+    def cells(self, row0, row1):
+        """Cell-centre lat / lon of rows row0..row1-1, flattened row-major."""
+        lat, lon = np.meshgrid(self.lats()[row0:row1], self.lons(), indexing="ij")
+        return lat.ravel(), lon.ravel()
+
+
+def station_series(freq="D", days=30, end=None):
+    """
+    Station means per step from the station_hour rollup: the stations with
+    data (lat / lon / location), the step timestamps and a steps x stations
+    matrix with NaN for missing station-steps. Only the date partitions of
+    the window are read.
+    """
+    available = sorted(p.name.split("=", 1)[1]
+                       for p in (Path(ROLLUPS) / "station_hour").glob("date=*"))
+    if not available:
+        raise FileNotFoundError(Path(ROLLUPS) / "station_hour")
+    last = pd.Timestamp(end if end is not None else available[-1]).normalize()
+    first = last - pd.Timedelta(days=days - 1)
+    dates = [d for d in available if f"{first:%Y-%m-%d}" <= d <= f"{last:%Y-%m-%d}"]
+    hourly = read_rollup("station_hour", dates=dates)
+    end = pd.Timestamp(end) if end is not None else hourly["hour"].max()
+    hourly = hourly[(hourly["hour"] >= first) & (hourly["hour"] <= end)]
+    step = hourly["hour"].dt.floor("D") if freq == "D" else hourly["hour"]
+    sums = hourly.groupby([step, "location"], observed=True)[["sum", "count"]].sum()
+    wide = (sums["sum"] / sums["count"]).unstack("location")
+
+    stations = load_station_index().stations.set_index("location")
+    stations = stations.loc[stations.index.intersection(wide.columns)]
+    wide = wide[stations.index]
+    return stations.reset_index(), wide.index, wide.to_numpy(dtype=float)
+
+
+def exponential_variogram(h, nugget, sill, rng):
+    return nugget + (sill - nugget) * (1 - np.exp(-h / rng))
+
+
+def fit_variogram(index, values, bins=15, max_stations=2000, seed=0):
+    """
+    Exponential semivariogram (nugget, sill, range km) fitted to the pooled
+    empirical semivariance of all steps. Large networks are subsampled to
+    `max_stations` so the pair count stays bounded.
+    """
+    from scipy.optimize import curve_fit
+    from scipy.spatial.distance import pdist
+
+    n = len(index)
+    pick = np.arange(n)
+    if n > max_stations:
+        pick = np.sort(np.random.default_rng(seed).choice(n, max_stations, replace=False))
+    dist = chord_to_km(pdist(index.tree.data[pick]))
+    i, j = np.triu_indices(len(pick), k=1)
+    edges = np.quantile(dist, np.linspace(0, 1, bins + 1))
+    which = np.clip(np.searchsorted(edges, dist, side="right") - 1, 0, bins - 1)
+    gamma_sum, pairs = np.zeros(bins), np.zeros(bins)
+    for row in values[:, pick]:
+        sq = 0.5 * (row[i] - row[j]) ** 2
+        ok = ~np.isnan(sq)
+        gamma_sum += np.bincount(which[ok], weights=sq[ok], minlength=bins)
+        pairs += np.bincount(which[ok], minlength=bins)
+    lag = np.bincount(which, weights=dist, minlength=bins) / np.maximum(np.bincount(which, minlength=bins), 1)
+    keep = pairs > 0
+    gamma = gamma_sum[keep] / pairs[keep]
+    p0 = [gamma.min(), gamma.max(), max(lag[keep].max() / 3, 1.0)]
+    # bounded so a sparse network whose semivariance keeps growing with lag
+    # still gets a well-conditioned (near-linear) model
+    upper = [gamma.max(), 10 * gamma.max(), 3 * lag[keep].max()]
+    p0 = np.minimum(p0, upper)
+    params, _ = curve_fit(exponential_variogram, lag[keep], gamma, p0=p0,
+                          bounds=([0, 0, 1e-3], upper), maxfev=10_000)
+    return dict(zip(["nugget", "sill", "range_km"], map(float, params)))
+
+
+def idw_weights(index, lat, lon, k=8, power=2.0, max_km=100.0):
+    """Per-cell neighbour positions and inverse-distance weights (0 beyond max_km)."""
+    dist, idx = index.query(lat, lon, k=k)
+    dist, idx = dist.reshape(len(lat), -1), idx.reshape(len(lat), -1)
+    weights = 1.0 / np.maximum(dist, 1e-3) ** power
+    weights[dist > max_km] = 0.0
+    return idx, weights
+
+
+def kriging_weights(index, lat, lon, variogram, k=8, max_km=100.0):
+    """
+    Ordinary-kriging weights over each cell's k nearest stations. Cells that
+    share a neighbour set share its kriging matrix, so each distinct matrix
+    is inverted once; cells with no station within max_km get zero weights.
+    """
+    dist, idx = index.query(lat, lon, k=k)
+    dist, idx = dist.reshape(len(lat), -1), idx.reshape(len(lat), -1)
+    order = np.argsort(idx, axis=1)
+    idx = np.take_along_axis(idx, order, axis=1)
+    dist = np.take_along_axis(dist, order, axis=1)
+    sets, inverse = np.unique(idx, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    k = idx.shape[1]
+
+    def gamma(h):
+        return exponential_variogram(h, variogram["nugget"], variogram["sill"], variogram["range_km"])
+
+    xyz = index.tree.data[sets]                                        # S x k x 3
+    pair_km = chord_to_km(np.linalg.norm(xyz[:, :, None] - xyz[:, None, :], axis=-1))
+    A = np.ones((len(sets), k + 1, k + 1))
+    A[:, :k, :k] = np.where(pair_km > 0, gamma(pair_km), 0.0)
+    A[:, k, k] = 0.0
+    A_inv = np.linalg.pinv(A)
+
+    b = np.ones((len(lat), k + 1))
+    b[:, :k] = gamma(dist)
+    weights = np.einsum("cij,cj->ci", A_inv[inverse], b)[:, :k]
+    weights[dist.min(axis=1) > max_km] = 0.0
+    return idx, weights
+
+
+def apply_weights(values, idx, weights):
+    """
+    Interpolate every step at once from neighbour weights shared by all
+    steps; missing station-steps are dropped and the remaining weights
+    renormalised. Returns a steps x cells array (NaN where no weight).
+    """
+    vals = values[:, idx]                                              # T x C x k
+    present = ~np.isnan(vals)
+    w = weights[None] * present
+    den = w.sum(axis=2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = (np.where(present, vals, 0.0) * w).sum(axis=2) / den
+    out[den == 0] = np.nan
+    return out
+
+
+_WORKER = {}
+
+
+def _init_worker(state):
+    _WORKER.update(state)
+
+
+def _tile(rows):
+    """Interpolate grid rows [row0, row1) into the shared memmap."""
+    s = _WORKER
+    grid = s["grid"]
+    row0, row1 = rows
+    lat, lon = grid.cells(row0, row1)
+    if s["method"] == "kriging":
+        idx, weights = kriging_weights(s["index"], lat, lon, s["variogram"], k=s["k"], max_km=s["max_km"])
+    else:
+        idx, weights = idw_weights(s["index"], lat, lon, k=s["k"], power=s["power"], max_km=s["max_km"])
+    out = np.memmap(s["path"], dtype="float32", mode="r+", shape=(s["steps"], grid.ny, grid.nx))
+    # bound the T x cells x k temporary by interpolating a few steps at a time
+    per = max(1, (TILE_CELLS * 16) // max(len(lat), 1))
+    for t0 in range(0, s["steps"], per):
+        block = apply_weights(s["values"][t0:t0 + per], idx, weights)
+        out[t0:t0 + per, row0:row1] = block.reshape(-1, row1 - row0, grid.nx)
+    out.flush()
+    return row1 - row0
+
+
+def build_surface(method="idw", freq="D", days=30, end=None, res=GRID_RES, grid=None,
+                  k=8, power=2.0, max_km=100.0, workers=0, out_dir=SURFACES):
+    """
+    Interpolate station means onto a lat/lon grid for every step and write
+    a float32 (steps, ny, nx) memmap plus a JSON sidecar. Grid row blocks of
+    about TILE_CELLS cells are processed in a process pool; neighbour
+    weights are computed once per tile and reused for every step.
+    """
+    stations, steps, values = station_series(freq=freq, days=days, end=end)
+    if not len(stations):
+        raise FileNotFoundError("no station data in the requested window")
+    index = StationIndex(stations)
+    grid = grid or Grid.around(stations["latitude"], stations["longitude"], res=res)
+    variogram = fit_variogram(index, values) if method == "kriging" else None
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / f"pm25_{method}_{freq}.f32"
+    np.memmap(path, dtype="float32", mode="w+", shape=(len(steps), grid.ny, grid.nx)).flush()
+    meta = {"method": method, "freq": freq, "grid": asdict(grid),
+            "steps": [t.isoformat() for t in steps], "stations": len(stations),
+            "k": k, "power": power, "max_km": max_km, "variogram": variogram}
+    path.with_suffix(".json").write_text(json.dumps(meta, indent=1), encoding="utf-8")
+
+    state = {"grid": grid, "index": index, "values": values, "method": method,
+             "variogram": variogram, "k": k, "power": power, "max_km": max_km,
+             "path": str(path), "steps": len(steps)}
+    rows = max(1, TILE_CELLS // grid.nx)
+    tiles = [(r, min(r + rows, grid.ny)) for r in range(0, grid.ny, rows)]
+    if workers == 1:
+        _init_worker(state)
+        for tile in tiles:
+            _tile(tile)
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                 initializer=_init_worker, initargs=(state,)) as pool:
+            list(pool.map(_tile, tiles))
+    return path
+
+
+def load_surface(path):
+    """(memmap of shape (steps, ny, nx), Grid, sidecar metadata) of a written surface."""
+    meta = json.loads(Path(path).with_suffix(".json").read_text(encoding="utf-8"))
+    grid = Grid(**meta["grid"])
+    data = np.memmap(path, dtype="float32", mode="r",
+                     shape=(len(meta["steps"]), grid.ny, grid.nx))
+    return data, grid, meta
+
+
+def population_weighted_mean(surface, population):
+    """Per-step exposure weighted by a population raster aligned with the grid."""
+    pop = np.asarray(population, dtype=float)
+    out = np.empty(len(surface))
+    for t in range(len(surface)):
+        layer = np.asarray(surface[t], dtype=float)
+        ok = ~np.isnan(layer) & (pop > 0)
+        out[t] = (layer[ok] * pop[ok]).sum() / pop[ok].sum() if ok.any() else np.nan
+    return out
+
+
+def city_exposure(path, radius_km=10.0, population=None):
+    """
+    Long (city, date, value) table of mean surface PM2.5 within radius_km of
+    each city centre, plus a population-weighted grid mean when a
+    population raster is given.
+    """
+    data, grid, meta = load_surface(path)
+    steps = pd.to_datetime(meta["steps"])
+    lats, lons = grid.lats(), grid.lons()
+    frames = []
+    for city, params in CITIES.items():
+        dlat = radius_km / 111.195
+        dlon = dlat / np.cos(np.radians(params["lat"]))
+        rows = np.nonzero(np.abs(lats - params["lat"]) <= dlat)[0]
+        cols = np.nonzero(np.abs(lons - params["lon"]) <= dlon)[0]
+        if not len(rows) or not len(cols):
+            continue
+        lat, lon = np.meshgrid(lats[rows], lons[cols], indexing="ij")
+        inside = ((lat - params["lat"]) / dlat) ** 2 + ((lon - params["lon"]) / dlon) ** 2 <= 1
+        block = np.asarray(data[:, rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1], dtype=float)
+        with np.errstate(invalid="ignore"):
+            values = np.nanmean(np.where(inside, block, np.nan).reshape(len(steps), -1), axis=1)
+        frames.append(pd.DataFrame({"city": city, "date": steps, "value": values}))
+    if population is not None:
+        frames.append(pd.DataFrame({"city": "Grid (population-weighted)", "date": steps,
+                                    "value": population_weighted_mean(data, population)}))
+    return pd.concat(frames, ignore_index=True)
+
+
+@instrumented("surface")
+def main(method="idw", freq="D", days=30, res=GRID_RES, k=8, power=2.0, max_km=100.0,
+         workers=0, population=None):
+    """Build a PM2.5 surface and the per-city surface exposure table."""
+    try:
+        path = build_surface(method=method, freq=freq, days=days, res=res, k=k,
+                             power=power, max_km=max_km, workers=workers)
+    except FileNotFoundError:
+        raise SystemExit("⚠ No OpenAQ data found. Run fetch_openaq.py first.")
+    data, grid, meta = load_surface(path)
+    pop = np.load(population, mmap_mode="r") if population else None
+    exposure = city_exposure(path, population=pop)
+    OUTT.mkdir(parents=True, exist_ok=True)
+    exposure.to_csv(OUTT / "surface_exposure.csv", index=False)
+    rec = current_stage()
+    rec.note(method=method, freq=freq, cells=grid.ny * grid.nx, steps=len(meta["steps"]))
+    rec.rows_in(meta["stations"])
+    rec.rows_out(len(exposure))
+    print(f"✅ {method} surface {len(meta['steps'])} x {grid.ny} x {grid.nx} "
+          f"({data.nbytes / 1e6:.0f} MB) -> {path}")
+    print("✅ city exposure -> outputs/tables/surface_exposure.csv")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gridded PM2.5 exposure surfaces")
+    parser.add_argument("--method", choices=["idw", "kriging"], default="idw")
+    parser.add_argument("--freq", choices=["D", "h"], default="D", help="daily or hourly steps")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--res", type=float, default=GRID_RES, help="cell size in degrees")
+    parser.add_argument("--k", type=int, default=8, help="neighbour stations per cell")
+    parser.add_argument("--power", type=float, default=2.0, help="IDW distance exponent")
+    parser.add_argument("--max-km", type=float, default=100.0)
+    parser.add_argument("--workers", type=int, default=0, help="0 = all cores")
+    parser.add_argument("--population", default=None,
+                        help=".npy population raster aligned with the grid")
+    args = parser.parse_args()
+    main(method=args.method, freq=args.freq, days=args.days, res=args.res, k=args.k,
+         power=args.power, max_km=args.max_km, workers=args.workers,
+         population=args.population)
@@ -0,0 +1,103 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+
+def design_matrix(days, t0, scale, harmonics=3):
+    """
+    Trend + weekly Fourier regressors for integer day numbers.
+    Columns: intercept, linear trend, then sin/cos pairs of the weekly cycle.
+    """
+    days = np.asarray(days, dtype=float)
+    cols = [np.ones_like(days), (days - t0) / scale]
+    for k in range(1, harmonics + 1):
+        angle = 2 * np.pi * k * days / 7
+        cols += [np.sin(angle), np.cos(angle)]
+    return np.column_stack(cols)
+
+
+def harmonic_forecast(daily, periods=30, harmonics=3, interval_width=0.8, min_days=14):
+    """
+    Fit trend + weekly-harmonic regressions for every city at once.
+
+    `daily` is a long frame of city / date / value. The cities are pivoted to
+    a day x city matrix and each city's least-squares fit is solved from
+    batched normal equations weighted by an observed-day mask, so gaps need
+    no interpolation. Returns the Prophet forecast schema (ds, yhat,
+    yhat_lower, yhat_upper, trend, weekly, city) over each city's history plus
+    `periods` days past its last observation.
+    """
+    wide = daily.pivot(index="date", columns="city", values="value")
+    wide = wide.loc[:, wide.notna().sum() >= min_days]
+    if wide.empty:
+        return pd.DataFrame(columns=["ds", "yhat", "yhat_lower", "yhat_upper",
+                                     "trend", "weekly", "city"])
+    wide = wide.asfreq("D")
+    dates = pd.date_range(wide.index[0], wide.index[-1] + pd.Timedelta(days=periods), freq="D")
+    day_no = (dates - pd.Timestamp("1970-01-01")).days.to_numpy()
+    n_hist = len(wide)
+
+    X = design_matrix(day_no, day_no[0], max(n_hist - 1, 1), harmonics)  # T x p
+    Xh = X[:n_hist]
+    Y = wide.to_numpy(dtype=float)                                      # T x N
+    W = ~np.isnan(Y)
+    Y0 = np.where(W, Y, 0.0)
+
+    # per-city normal equations, solved as one N x p x p batch; the outer
+    # products X_t X_t' are flattened so every contraction is a BLAS matmul
+    p = X.shape[1]
+    XX = (X[:, :, None] * X[:, None, :]).reshape(len(X), p * p)         # T x p^2
+    A = (W.T.astype(float) @ XX[:n_hist]).reshape(-1, p, p)
+    b = Y0.T @ Xh
+    A_inv = np.linalg.pinv(A)
+    beta = np.einsum("cpq,cq->cp", A_inv, b)                            # N x p
+
+    fitted = Xh @ beta.T
+    n_obs = W.sum(axis=0)
+    dof = np.maximum(n_obs - p, 1)
+    sigma = np.sqrt((np.where(W, Y - fitted, 0.0) ** 2).sum(axis=0) / dof)
+
+    yhat = X @ beta.T
+    leverage = XX @ A_inv.reshape(-1, p * p).T
+    half = NormalDist().inv_cdf(0.5 + interval_width / 2) * sigma * np.sqrt(1 + leverage)
+    trend = X[:, :2] @ beta[:, :2].T
+
+    # keep each city's own span: first observation to last + periods days
+    obs_idx = np.arange(n_hist)[:, None]
+    first = np.where(W, obs_idx, n_hist).min(axis=0)
+    last = np.where(W, obs_idx, -1).max(axis=0) + periods
+    row = np.arange(len(dates))[:, None]
+    keep = (row >= first) & (row <= last)
+    c_idx, t_idx = np.nonzero(keep.T)  # city-major, dates ascending
+
+    return pd.DataFrame({
+        "ds": dates[t_idx],
+        "yhat": yhat[t_idx, c_idx],
+        "yhat_lower": (yhat - half)[t_idx, c_idx],
+        "yhat_upper": (yhat + half)[t_idx, c_idx],
+        "trend": trend[t_idx, c_idx],
+        "weekly": (yhat - trend)[t_idx, c_idx],
+        "city": wide.columns.to_numpy()[c_idx],
+    })
+
+
+def forecast_errors(actual, predicted, by=("city",)):
+    """
+    MAE / RMSE / MAPE / interval coverage of forecasts against held-out data.
+    Both frames are long (city, ds); `predicted` carries yhat and bounds.
+    Scores are aggregated over the `by` columns of the merged frame.
+    """
+    merged = actual.merge(predicted, on=["city", "ds"], how="inner")
+    err = merged["y"] - merged["yhat"]
+    # failed fits (NaN yhat) score NaN rather than counting as misses
+    inside = ((merged["y"] >= merged["yhat_lower"]) & (merged["y"] <= merged["yhat_upper"])) \
+        .astype(float).where(merged["yhat"].notna())
+    merged = merged.assign(abs_err=err.abs(), sq_err=err ** 2,
+                           pct_err=(err / merged["y"]).abs() * 100, covered=inside)
+    out = merged.groupby(list(by)).agg(
+        mae=("abs_err", "mean"), rmse=("sq_err", "mean"),
+        mape=("pct_err", "mean"), coverage=("covered", "mean"), n=("y", "size"),
+    )
+    out["rmse"] = np.sqrt(out["rmse"])
+    return out.reset_index()
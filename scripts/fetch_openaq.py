@@ -1,12 +1,38 @@
+import argparse
+from pathlib import Path
 import pandas as pd
 from datetime import datetime, timedelta
-from pathlib import Path
 import numpy as np
-
-BASE = Path("projects/air_quality_health")
-DATA = BASE / "data" / "openaq"
-DATA.mkdir(parents=True, exist_ok=True)
-
+from measurement_store import STORE, write_measurements
+from ingest import STATE, ingest_batch, load_watermarks, record_changes
+from instrument import current_stage, instrumented
+
+# List of major Indian cities with realistic PM2.5 ranges and city-centre coordinates
+CITIES = {
+    "Delhi": {"base_pm25": 80, "variation": 40, "lat": 28.6139, "lon": 77.209},
+    "Mumbai": {"base_pm25": 60, "variation": 25, "lat": 19.076, "lon": 72.8777},
+    "Kolkata": {"base_pm25": 55, "variation": 30, "lat": 22.5726, "lon": 88.3639},
+    "Chennai": {"base_pm25": 45, "variation": 20, "lat": 13.0827, "lon": 80.2707},
+    "Bangalore": {"base_pm25": 35, "variation": 15, "lat": 12.9716, "lon": 77.5946},
+    "Hyderabad": {"base_pm25": 50, "variation": 25, "lat": 17.385, "lon": 78.4867},
+    "Pune": {"base_pm25": 40, "variation": 20, "lat": 18.5204, "lon": 73.8567},
+    "Ahmedabad": {"base_pm25": 65, "variation": 35, "lat": 23.0225, "lon": 72.5714},
+    "Jaipur": {"base_pm25": 70, "variation": 30, "lat": 26.9124, "lon": 75.7873},
+    "Lucknow": {"base_pm25": 75, "variation": 35, "lat": 26.8467, "lon": 80.9462},
+    "Kanpur": {"base_pm25": 85, "variation": 40, "lat": 26.4499, "lon": 80.3319},
+    "Nagpur": {"base_pm25": 45, "variation": 20, "lat": 21.1458, "lon": 79.0882},
+    "Indore": {"base_pm25": 55, "variation": 25, "lat": 22.7196, "lon": 75.8577},
+    "Bhopal": {"base_pm25": 50, "variation": 25, "lat": 23.2599, "lon": 77.4126},
+    "Patna": {"base_pm25": 90, "variation": 45, "lat": 25.5941, "lon": 85.1376},
+    "Vadodara": {"base_pm25": 60, "variation": 30, "lat": 22.3072, "lon": 73.1812},
+    "Ludhiana": {"base_pm25": 75, "variation": 35, "lat": 30.901, "lon": 75.8573},
+    "Agra": {"base_pm25": 80, "variation": 40, "lat": 27.1767, "lon": 78.0081},
+    "Nashik": {"base_pm25": 45, "variation": 20, "lat": 19.9975, "lon": 73.7898},
+    "Faridabad": {"base_pm25": 85, "variation": 40, "lat": 28.4089, "lon": 77.3178}
+}
+
+
+@instrumented("fetch")
 def fetch_pm25(country="IN", days=7):
     """
     Generate sample PM2.5 data for Indian cities since OpenAQ API v2 is deprecated.
@@ -14,39 +40,22 @@ def fetch_pm25(country="IN", days=7):
     """
     print("⚠ OpenAQ API v2 deprecated, generating sample data...")
 
-    # List of major Indian cities with realistic PM2.5 ranges
-    cities_data = {
-        "Delhi": {"base_pm25": 80, "variation": 40},
-        "Mumbai": {"base_pm25": 60, "variation": 25},
-        "Kolkata": {"base_pm25": 55, "variation": 30},
-        "Chennai": {"base_pm25": 45, "variation": 20},
-        "Bangalore": {"base_pm25": 35, "variation": 15},
-        "Hyderabad": {"base_pm25": 50, "variation": 25},
-        "Pune": {"base_pm25": 40, "variation": 20},
-        "Ahmedabad": {"base_pm25": 65, "variation": 35},
-        "Jaipur": {"base_pm25": 70, "variation": 30},
-        "Lucknow": {"base_pm25": 75, "variation": 35},
-        "Kanpur": {"base_pm25": 85, "variation": 40},
-        "Nagpur": {"base_pm25": 45, "variation": 20},
-        "Indore": {"base_pm25": 55, "variation": 25},
-        "Bhopal": {"base_pm25": 50, "variation": 25},
-        "Patna": {"base_pm25": 90, "variation": 45},
-        "Vadodara": {"base_pm25": 60, "variation": 30},
-        "Ludhiana": {"base_pm25": 75, "variation": 35},
-        "Agra": {"base_pm25": 80, "variation": 40},
-        "Nashik": {"base_pm25": 45, "variation": 20},
-        "Faridabad": {"base_pm25": 85, "variation": 40}
-    }
-
     # Generate time series data
     end = datetime.now()
     start = end - timedelta(days=days)
 
+    # Resume from the oldest station watermark instead of regenerating the
+    # whole window; ingest_batch drops anything a station already has.
+    watermarks = load_watermarks()
+    if watermarks:
+        oldest = min(pd.Timestamp(w["watermark"]) for w in watermarks.values())
+        start = max(start, oldest + timedelta(hours=1))
+
     data_rows = []
     current_date = start
 
     while current_date <= end:
-        for city, params in cities_data.items():
+        for city, params in CITIES.items():
             # Add daily and weekly patterns
             day_of_week = current_date.weekday()
             hour = current_date.hour
@@ -70,8 +79,8 @@ def fetch_pm25(country="IN", days=7):
                     "value": round(pm25_value, 1),
                     "unit": "µg/m³",
                     "country": country,
-                    "coordinates": {"latitude": 28.6139 + np.random.normal(0, 0.1),
-                                   "longitude": 77.2090 + np.random.normal(0, 0.1)},
+                    "latitude": params["lat"],
+                    "longitude": params["lon"],
                     "timestamp": current_date
                 })
 
@@ -80,17 +89,138 @@ def fetch_pm25(country="IN", days=7):
     df = pd.DataFrame(data_rows)
 
     if df.empty:
-        print("⚠ No data generated.")
+        print("⚠ No new data generated.")
         return None
 
-    # Save to CSV
-    out = DATA / f"openaq_pm25_{country}_{datetime.now().date()}.csv"
-    df.to_csv(out, index=False)
-    print(f"✅ Generated sample data with {len(df)} records saved to: {out}")
-    print(f"📊 Cities covered: {len(cities_data)}")
+    # Append new readings to the partitioned measurement store
+    rec = current_stage()
+    rec.rows_in(len(df))
+    batch = ingest_batch(df)
+    if batch is None:
+        print("⚠ No readings newer than the stored watermarks.")
+        return None
+    rec.rows_out(batch["rows"])
+    print(f"✅ Ingested {batch['rows']} new records into: {STORE}")
+    print(f"🔄 Changed: {len(batch['changes'])} cities")
+    print(f"📊 Cities covered: {len(CITIES)}")
     print(f"📅 Date range: {start.date()} to {end.date()}")
 
-    return out
+    return STORE
+
+def station_layout(stations, rng, cities=None):
+    """
+    Synthetic monitoring network: `stations` monitors spread round-robin over
+    the city list (CITIES unless another mapping of the same shape is
+    given). The first station of each city keeps the "<city>_Central" name
+    used by fetch_pm25 and sits on the city centre; the rest scatter ~5 km
+    around it.
+    """
+    cities = cities or CITIES
+    names = list(cities)
+    idx = np.arange(stations)
+    city_code = idx % len(names)
+    station_no = idx // len(names)
+    jitter = np.where(station_no[:, None] == 0, 0.0, rng.normal(0, 0.05, (stations, 2)))
+    return pd.DataFrame({
+        "location": [f"{names[c]}_Central" if n == 0 else f"{names[c]}_{n:03d}"
+                     for c, n in zip(city_code, station_no)],
+        "city": pd.Categorical.from_codes(city_code, names),
+        "base_pm25": np.array([cities[c]["base_pm25"] for c in names], dtype=float)[city_code],
+        "variation": np.array([cities[c]["variation"] for c in names], dtype=float)[city_code],
+        "latitude": np.array([cities[c]["lat"] for c in names])[city_code] + jitter[:, 0],
+        "longitude": np.array([cities[c]["lon"] for c in names])[city_code] + jitter[:, 1],
+    })
+
+
+def synthetic_readings(ts, layout, rng, missing_rate=0.05, country="IN"):
+    """Hourly readings for every station in `layout` at the timestamps `ts`."""
+    ts = pd.DatetimeIndex(ts)
+
+    # Same weekly/daily shape as fetch_pm25, broadcast over stations
+    weekly_factor = np.where(ts.dayofweek < 5, 1.2, 0.8)
+    hour = ts.hour
+    rush = ((hour >= 6) & (hour <= 9)) | ((hour >= 18) & (hour <= 21))
+    daily_factor = np.where(rush, 1.3, 1.0)
+    factor = (weekly_factor * daily_factor)[:, None]
+
+    base = layout["base_pm25"].to_numpy()
+    noise = rng.standard_normal((len(ts), len(layout))) * layout["variation"].to_numpy()
+    values = np.round(np.maximum(10, base * factor + noise), 1)
+    keep = rng.random((len(ts), len(layout))) > missing_rate
+    t_idx, s_idx = np.nonzero(keep)
+
+    return pd.DataFrame({
+        "city": layout["city"].to_numpy()[s_idx],
+        "location": pd.Categorical.from_codes(s_idx, layout["location"]),
+        "value": values[t_idx, s_idx],
+        "unit": "µg/m³",
+        "country": country,
+        "latitude": layout["latitude"].to_numpy()[s_idx].astype("float32"),
+        "longitude": layout["longitude"].to_numpy()[s_idx].astype("float32"),
+        "timestamp": ts[t_idx],
+    })
+
+
+@instrumented("generate_grid")
+def generate_pm25_grid(country="IN", days=30, stations=len(CITIES), start=None,
+                       missing_rate=0.05, seed=None, chunk_hours=168, root=STORE,
+                       cities=None, state=None):
+    """
+    Vectorised generator for load-scale synthetic PM2.5 archives.
+    Builds the station x hour grid with NumPy broadcasting and streams it to
+    the measurement store one block of `chunk_hours` hours at a time, so memory
+    stays bounded by chunk_hours x stations regardless of the total date span.
+    Each block is logged to the change log of `state` (by default the main
+    state when writing to the main store) so the rollups pick it up.
+    """
+    if state is None and Path(root) == STORE:
+        state = STATE
+    rng = np.random.default_rng(seed)
+    layout = station_layout(stations, rng, cities=cities)
+
+    if start is None:
+        start = datetime.now() - timedelta(days=days)
+    hours = pd.date_range(pd.Timestamp(start), periods=days * 24 + 1, freq="h")
+
+    n_rows = 0
+    for i in range(0, len(hours), chunk_hours):
+        chunk = synthetic_readings(hours[i:i + chunk_hours], layout, rng,
+                                   missing_rate=missing_rate, country=country)
+        n_rows += write_measurements(chunk, root=root)
+        if state is not None and len(chunk):
+            record_changes(chunk, state=state)
+    current_stage().rows_out(n_rows)
+
+    print(f"✅ Generated grid data with {n_rows} records saved to: {root}")
+    print(f"📡 Stations: {stations} across {layout['city'].nunique()} cities")
+    print(f"📅 Date range: {hours[0].date()} to {hours[-1].date()}")
+
+    return root
 
 if __name__ == "__main__":
-    fetch_pm25(country="IN", days=30)
+    parser = argparse.ArgumentParser(description="Generate synthetic PM2.5 data")
+    parser.add_argument("--country", default="IN")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--grid", action="store_true",
+                        help="use the vectorised station x hour generator")
+    parser.add_argument("--stations", type=int, default=len(CITIES))
+    parser.add_argument("--start", default=None, help="first timestamp (YYYY-MM-DD)")
+    parser.add_argument("--missing-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--chunk-hours", type=int, default=168)
+    parser.add_argument("--root", default=STORE, help="measurement store directory")
+    args = parser.parse_args()
+
+    if args.grid:
+        generate_pm25_grid(
+            country=args.country, days=args.days, stations=args.stations,
+            start=args.start, missing_rate=args.missing_rate, seed=args.seed,
+            chunk_hours=args.chunk_hours, root=args.root
+        )
+    else:
+        fetch_pm25(country=args.country, days=args.days)
+
+    # readers never refresh the rollups themselves, so standalone ingests do
+    if str(args.root) == str(STORE):
+        from rollups import update_rollups
+        print(f"🔄 Rollups refreshed for {update_rollups()} date(s)")
@@ -1,30 +1,24 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
-import matplotlib.pyplot as plt
-from prophet import Prophet
 from pathlib import Path
 from tqdm import tqdm
-import glob
+from rollups import city_daily
+from fast_forecast import forecast_errors, harmonic_forecast
+from ingest import mark_processed, pending_changes
+from instrument import current_stage, instrumented
 
 BASE = Path("projects/air_quality_health")
-DATA = BASE / "data" / "openaq"
 OUTT = BASE / "outputs" / "tables"
-OUTP = BASE / "outputs" / "plots"
 OUTT.mkdir(parents=True, exist_ok=True)
-OUTP.mkdir(parents=True, exist_ok=True)
 
-# find latest OpenAQ file
-files = sorted(glob.glob(str(DATA / "openaq_pm25_IN_*.csv")))
-if not files:
-    raise SystemExit("⚠ No OpenAQ PM2.5 file found. Run fetch_openaq.py first.")
 
-df = pd.read_csv(files[-1])
-df["timestamp"] = pd.to_datetime(df["timestamp"])
-df["date"] = df["timestamp"].dt.date
-daily = df.groupby(["city", "date"])["value"].mean().reset_index()
+def _prophet_forecast(group, periods=30):
+    """Fit Prophet on one city's daily means and predict `periods` days ahead."""
+    from prophet import Prophet
 
-for city, group in tqdm(daily.groupby("city")):
-    if len(group) < 14:
-        continue
     g = group.rename(columns={"date": "ds", "value": "y"})
     model = Prophet(
         seasonality_mode="additive",
@@ -33,17 +27,152 @@ for city, group in tqdm(daily.groupby("city")):
         daily_seasonality=False
     )
     model.fit(g)
-    future = model.make_future_dataframe(periods=30)
-    forecast = model.predict(future)
-    # plot
-    fig = model.plot(forecast)
-    plt.title(f"PM2.5 Forecast (next 30 days) — {city}")
-    plt.tight_layout()
-    out_plot = OUTP / f"forecast_{city.replace(' ', '_')}.png"
-    plt.savefig(out_plot)
-    plt.close()
-    # save forecast CSV
-    forecast["city"] = city
-    forecast.to_csv(OUTT / f"forecast_{city.replace(' ', '_')}.csv", index=False)
-
-print("✅ Forecasts and plots generated for each city (30 days ahead).")
+    future = model.make_future_dataframe(periods=periods)
+    return model, model.predict(future)
+
+
+def _fit_city(city, group):
+    """
+    Fit, predict and save one city. Runs inside a worker process, so errors
+    are returned rather than raised to keep other cities going. Returns
+    (error or None, fit seconds, forecast rows).
+    """
+    start = time.perf_counter()
+    try:
+        model, forecast = _prophet_forecast(group)
+        # save forecast CSV with the observed history alongside for plotting
+        forecast = forecast.merge(
+            group.rename(columns={"date": "ds", "value": "y"})[["ds", "y"]], on="ds", how="left"
+        )
+        forecast["city"] = city
+        forecast.to_csv(OUTT / f"forecast_{city.replace(' ', '_')}.csv", index=False)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}", time.perf_counter() - start, 0
+    return None, time.perf_counter() - start, len(forecast)
+
+
+def compare_engines(daily, holdout=14):
+    """
+    Hold out each city's last `holdout` days, forecast them with both
+    engines and score the forecasts (MAE, RMSE, MAPE, interval coverage).
+    """
+    last = daily.groupby("city")["date"].transform("max")
+    cutoff = last - pd.Timedelta(days=holdout)
+    train = daily[daily["date"] <= cutoff]
+    test = daily[daily["date"] > cutoff].rename(columns={"date": "ds", "value": "y"})
+
+    start = time.perf_counter()
+    harmonic = harmonic_forecast(train, periods=holdout)
+    harmonic_secs = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prophet = []
+    for city, group in tqdm(train.groupby("city")):
+        if len(group) < 14:
+            continue
+        _, fc = _prophet_forecast(group, periods=holdout)
+        prophet.append(fc.assign(city=city))
+    prophet_secs = time.perf_counter() - start
+    if not prophet:
+        raise SystemExit(f"⚠ Need at least {14 + holdout} days of history to compare engines.")
+
+    scores = pd.concat([
+        forecast_errors(test, harmonic).assign(engine="harmonic", fit_seconds=harmonic_secs),
+        forecast_errors(test, pd.concat(prophet)).assign(engine="prophet", fit_seconds=prophet_secs),
+    ], ignore_index=True)
+    return scores
+
+
+@instrumented("forecast")
+def main(incremental=False, workers=1, engine="prophet", compare=False, plots=True):
+    """
+    Forecast 30 days of PM2.5 per city with Prophet or the batched harmonic
+    engine. With incremental=True only cities whose data changed since the
+    last incremental run are refitted; workers > 1 (or 0 for all cores) fits
+    Prophet cities in parallel processes. compare=True scores both engines on
+    a held-out window instead of writing forecasts. plots=False leaves the
+    figures to a separate render_plots run.
+    """
+    cities, batch = None, None
+    if incremental:
+        dirty, batch = pending_changes("forecast_pm25")
+        if not dirty:
+            print("✅ forecasts up to date; no changed cities")
+            return
+        cities = sorted(dirty)
+
+    # daily means (of the changed cities only, if incremental) from the rollups
+    try:
+        daily = city_daily(cities=cities)
+    except FileNotFoundError:
+        raise SystemExit("⚠ No OpenAQ PM2.5 file found. Run fetch_openaq.py first.")
+    rec = current_stage()
+    rec.note(engine="compare" if compare else engine, incremental=incremental)
+    rec.rows_in(len(daily))
+
+    if compare:
+        scores = compare_engines(daily)
+        scores.to_csv(OUTT / "forecast_engine_comparison.csv", index=False)
+        print(scores.groupby("engine")[["mae", "rmse", "mape", "coverage", "fit_seconds"]].mean())
+        print("✅ engine comparison saved -> outputs/tables/forecast_engine_comparison.csv")
+        return
+
+    if engine == "harmonic":
+        forecast = harmonic_forecast(daily, periods=30).merge(
+            daily.rename(columns={"date": "ds", "value": "y"}), on=["city", "ds"], how="left"
+        )
+        for city, frame in forecast.groupby("city"):
+            frame.to_csv(OUTT / f"forecast_{city.replace(' ', '_')}.csv", index=False)
+            rec.city(city, rows_out=len(frame))
+        rec.rows_out(len(forecast))
+        if plots:
+            from render_plots import render
+            render(kinds=("forecast",), workers=workers)
+        if incremental:
+            mark_processed("forecast_pm25", batch)
+        print(f"✅ Harmonic forecasts generated for {forecast['city'].nunique()} cities (30 days ahead).")
+        return
+
+    groups = [(city, group) for city, group in daily.groupby("city") if len(group) >= 14]
+    workers = workers or os.cpu_count()
+    results = {}
+    if workers == 1:
+        for city, group in tqdm(groups):
+            results[city] = _fit_city(city, group)
+    else:
+        # one Prophet/CmdStan fit per process; each worker saves its own outputs
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_fit_city, city, group): city for city, group in groups}
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                results[futures[future]] = future.result()
+
+    for city, group in groups:
+        err, seconds, rows = results[city]
+        rec.city(city, rows_in=len(group), rows_out=rows, fit_s=round(seconds, 3),
+                 **({"error": err} if err else {}))
+        rec.rows_out(rows)
+    failed = {city: err for city, (err, _, _) in sorted(results.items()) if err}
+    for city, err in failed.items():
+        print(f"⚠ {city}: forecast failed ({err})")
+
+    if plots:
+        from render_plots import render
+        render(kinds=("forecast",), workers=workers)
+    if incremental and not failed:
+        mark_processed("forecast_pm25", batch)
+    print("✅ Forecasts and plots generated for each city (30 days ahead).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="30-day PM2.5 forecasts")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only refit cities changed since the last run")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="parallel fitting processes (0 = all cores)")
+    parser.add_argument("--engine", choices=["prophet", "harmonic"], default="prophet",
+                        help="harmonic = batched trend + weekly-harmonic regression")
+    parser.add_argument("--compare", action="store_true",
+                        help="score both engines on the last 14 days of each city")
+    args = parser.parse_args()
+    main(incremental=args.incremental, workers=args.workers,
+         engine=args.engine, compare=args.compare)
@@ -0,0 +1,175 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from instrument import current_stage, instrumented
+from rollups import city_daily
+
+BASE = Path("projects/air_quality_health")
+OUTT = BASE / "outputs" / "tables"
+
+# Census of India 2011 populations (urban agglomeration where one exists)
+POPULATION = {
+    "Delhi": 16_349_831, "Mumbai": 18_394_912, "Kolkata": 14_057_991,
+    "Chennai": 8_653_521, "Bangalore": 8_520_435, "Hyderabad": 7_677_018,
+    "Pune": 5_057_709, "Ahmedabad": 6_357_693, "Jaipur": 3_046_163,
+    "Lucknow": 2_902_920, "Kanpur": 2_920_496, "Nagpur": 2_497_870,
+    "Indore": 2_170_295, "Bhopal": 1_886_100, "Patna": 2_049_156,
+    "Vadodara": 1_817_191, "Ludhiana": 1_618_879, "Agra": 1_760_285,
+    "Nashik": 1_562_769, "Faridabad": 1_414_050,
+}
+# SRS 2019 crude death rate for India, all ages and causes, deaths per 1,000 per year
+BASELINE_MORTALITY = 6.0
+# NCD + LRI deaths among adults 25+, per 1,000 adults 25+ per year: the crude
+# rate x ~70% NCD+LRI share x ~85% of deaths at 25+, over the ~50% of the
+# population aged 25+ (Census 2011). Approximate; override with --baseline-mortality.
+GEMM_BASELINE_MORTALITY = 7.0
+ADULT_SHARE = 0.50
+
+# Concentration-response functions. log-linear: short-term all-cause
+# mortality, RR 1.0065 (95% CI 1.0044-1.0086) per 10 µg/m³ (Orellano et al.
+# 2020), applied to each city-day against the all-age crude death rate.
+# gemm: GEMM NCD+LRI hazard ratio for adults 25+ (Burnett et al. 2018), a
+# long-term curve, so it is applied to the period-mean exposure against the
+# cause- and age-specific rate of the adult population only.
+CRF = {
+    "log-linear": {"beta": np.log(1.0065) / 10,
+                   "se": (np.log(1.0086) - np.log(1.0044)) / 10 / (2 * 1.96),
+                   "cf": 0.0, "exposure": "daily",
+                   "baseline": BASELINE_MORTALITY, "population_share": 1.0},
+    "gemm": {"beta": 0.1430, "se": 0.01807, "cf": 2.4,
+             "alpha": 1.6, "mu": 15.5, "nu": 36.8, "exposure": "period",
+             "baseline": GEMM_BASELINE_MORTALITY, "population_share": ADULT_SHARE},
+}
+
+
+def relative_risk(conc, beta, crf="log-linear"):
+    """
+    Relative risk for exposures `conc` (any shape) under coefficients `beta`
+    (shape (draws,)), broadcast to (draws, *conc.shape).
+    """
+    p = CRF[crf]
+    z = np.maximum(np.asarray(conc, dtype=float) - p["cf"], 0.0)
+    beta = np.asarray(beta, dtype=float).reshape((-1,) + (1,) * z.ndim)
+    if crf == "log-linear":
+        return np.exp(beta * z)
+    shape = np.log1p(z / p["alpha"]) / (1 + np.exp(-(z - p["mu"]) / p["nu"]))
+    return np.exp(beta * shape)
+
+
+def attributable_deaths(exposure, population, baseline_rate, crf="log-linear",
+                        draws=1000, seed=42, max_cells=20_000_000):
+    """
+    Attributable deaths per city from a day x city exposure matrix.
+
+    Deaths on each city-day are AF x daily baseline deaths with
+    AF = 1 - 1/RR; missing days (NaN) contribute nothing. The CRF coefficient
+    is drawn `draws` times from its sampling distribution and the draws are
+    evaluated in chunks of at most `max_cells` draw x day x city values, so
+    memory stays bounded however long the series or large the ensemble.
+    Returns (central estimate per city, draws x city matrix).
+    """
+    conc = np.asarray(exposure, dtype=float)
+    observed = ~np.isnan(conc)
+    conc = np.where(observed, conc, 0.0)
+    daily_deaths = np.asarray(population, dtype=float) * baseline_rate / 365.0  # per city
+
+    def deaths(beta):
+        af = 1.0 - 1.0 / relative_risk(conc, beta, crf)
+        return np.einsum("dtc,tc->dc", af, observed * daily_deaths)
+
+    p = CRF[crf]
+    central = deaths(np.array([p["beta"]]))[0]
+    betas = np.random.default_rng(seed).normal(p["beta"], p["se"], size=draws)
+    chunk = max(1, max_cells // max(conc.size, 1))
+    sims = np.empty((draws, conc.shape[1]))
+    for lo in range(0, draws, chunk):
+        sims[lo:lo + chunk] = deaths(betas[lo:lo + chunk])
+    return central, sims
+
+
+@instrumented("burden")
+def main(crf="log-linear", draws=1000, seed=42, population=None,
+         baseline_mortality=None, exposure="stations"):
+    """
+    Attributable PM2.5 deaths per city and nationally, with 95% intervals.
+    The baseline rate (deaths per 1,000 per year) defaults to the one that
+    matches the CRF. exposure="surface" uses the gridded city exposures
+    written by exposure_surface.py instead of the station means.
+    """
+    p = CRF[crf]
+    if baseline_mortality is None:
+        baseline_mortality = p["baseline"]
+    try:
+        if exposure == "surface":
+            daily = pd.read_csv(OUTT / "surface_exposure.csv", parse_dates=["date"])
+        else:
+            daily = city_daily()
+    except FileNotFoundError:
+        raise SystemExit("⚠ No exposure data found. Run fetch_openaq.py "
+                         "(or exposure_surface.py for --exposure surface) first.")
+
+    population = pd.Series(population or POPULATION, dtype=float)
+    daily = daily[daily["city"].isin(population.index)]
+    if daily.empty:
+        raise SystemExit("⚠ No cities with population data.")
+    wide = daily.pivot(index="date", columns="city", values="value").asfreq("D")
+    cities = wide.columns
+    pop = population.reindex(cities).to_numpy()
+    exposed = wide
+    if p["exposure"] == "period":
+        # long-term curve: every observed day carries the city's period mean
+        exposed = wide.mask(wide.notna(), wide.mean(), axis=1)
+
+    central, sims = attributable_deaths(
+        exposed.to_numpy(), pop * p["population_share"], baseline_mortality / 1000,
+        crf=crf, draws=draws, seed=seed
+    )
+    days = wide.notna().sum().to_numpy()
+    out = pd.DataFrame({
+        "city": cities,
+        "population": pop.astype(int),
+        "days": days,
+        "mean_pm25": wide.mean().to_numpy(),
+        "attributable_deaths": central,
+        "lower_95": np.percentile(sims, 2.5, axis=0),
+        "upper_95": np.percentile(sims, 97.5, axis=0),
+    })
+    out["per_100k_year"] = out["attributable_deaths"] / out["population"] * 1e5 * 365 / out["days"]
+    national = sims.sum(axis=1)
+    out.loc[len(out)] = {
+        "city": "All cities", "population": int(pop.sum()), "days": int(days.max()),
+        "mean_pm25": float(np.nanmean(wide.to_numpy())),
+        "attributable_deaths": central.sum(),
+        "lower_95": np.percentile(national, 2.5), "upper_95": np.percentile(national, 97.5),
+        "per_100k_year": central.sum() / pop.sum() * 1e5 * 365 / days.max(),
+    }
+    out.insert(1, "crf", crf)
+
+    OUTT.mkdir(parents=True, exist_ok=True)
+    out.round(3).to_csv(OUTT / "health_burden.csv", index=False)
+    rec = current_stage()
+    rec.note(crf=crf, draws=draws, exposure=exposure, baseline_mortality=baseline_mortality)
+    rec.rows_in(len(daily))
+    rec.rows_out(len(out))
+    total = out.iloc[-1]
+    print(f"✅ {total['attributable_deaths']:.0f} attributable deaths "
+          f"(95% UI {total['lower_95']:.0f}-{total['upper_95']:.0f}) over {len(cities)} cities "
+          f"-> outputs/tables/health_burden.csv")
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PM2.5-attributable mortality per city")
+    parser.add_argument("--crf", choices=sorted(CRF), default="log-linear")
+    parser.add_argument("--draws", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--exposure", choices=["stations", "surface"], default="stations")
+    parser.add_argument("--baseline-mortality", type=float, default=None,
+                        help="deaths per 1,000 per year (default: all-cause crude rate "
+                             "for log-linear, adult NCD+LRI rate for gemm)")
+    args = parser.parse_args()
+    main(crf=args.crf, draws=args.draws, seed=args.seed,
+         baseline_mortality=args.baseline_mortality, exposure=args.exposure)
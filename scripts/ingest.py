@@ -0,0 +1,122 @@
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from measurement_store import STORE, write_measurements
+
+BASE = Path("projects/air_quality_health")
+STATE = BASE / "data" / "store" / "state"
+WATERMARKS = STATE / "watermarks.json"  # {location: {"city": .., "watermark": iso}}
+CHANGES = STATE / "changes.jsonl"       # one record per ingested batch
+CURSORS = STATE / "cursors.json"        # {consumer: last batch id processed}
+
+
+def _read_json(path, default):
+    path = Path(path)
+    if not path.exists():
+        return default
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _write_json(path, obj):
+    # write-then-rename so a crashed run never leaves half a state file
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(obj, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def load_watermarks(state=STATE):
+    return _read_json(Path(state) / WATERMARKS.name, {})
+
+
+def ingest_batch(df, root=STORE, state=STATE):
+    """
+    Append-only ingestion of a batch of measurements.
+    Rows are deduplicated on (location, timestamp) and anything at or below
+    the station's high-water mark is dropped as already stored. Returns the
+    change record (cities and dates touched) or None if nothing was new.
+    """
+    state = Path(state)
+    df = df.copy()
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df = df.drop_duplicates(["location", "timestamp"], keep="last")
+
+    watermarks = load_watermarks(state)
+    marks = pd.to_datetime(df["location"].map(
+        {loc: w["watermark"] for loc, w in watermarks.items()}
+    ))
+    new = df[marks.isna() | (df["timestamp"] > marks)]
+    if new.empty:
+        return None
+
+    write_measurements(new, root=root)
+    return record_changes(new, dropped=len(df) - len(new), state=state)
+
+
+def record_changes(new, dropped=0, state=STATE):
+    """
+    Log rows already written to the store: advance the station watermarks
+    and append a change record (cities and dates touched) to the change
+    log, so rollups and incremental consumers pick them up. Writers that
+    bypass ingest_batch's dedup (bulk generators, CSV imports) call this
+    directly. Returns the record.
+    """
+    state = Path(state)
+    timestamps = pd.to_datetime(new["timestamp"])
+    watermarks = load_watermarks(state)
+    latest = (pd.DataFrame({"city": new["city"].astype(str), "ts": timestamps})
+              .groupby(new["location"].astype(str).to_numpy())
+              .agg(city=("city", "last"), ts=("ts", "max")))
+    for loc, row in latest.iterrows():
+        mark = watermarks.get(loc, {}).get("watermark")
+        if mark is None or row["ts"] > pd.Timestamp(mark):
+            watermarks[loc] = {"city": row["city"], "watermark": row["ts"].isoformat()}
+    _write_json(state / WATERMARKS.name, watermarks)
+
+    dates = timestamps.dt.strftime("%Y-%m-%d")
+    touched = dates.groupby(new["city"].astype(str).to_numpy()).unique()
+    record = {
+        "batch": time.time_ns(),
+        "ingested_at": datetime.now().isoformat(timespec="seconds"),
+        "rows": len(new),
+        "dropped": dropped,
+        "changes": {city: sorted(d) for city, d in touched.items()},
+    }
+    with open(state / CHANGES.name, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    return record
+
+
+def pending_changes(consumer, state=STATE):
+    """
+    Cities and dates changed since `consumer` last called mark_processed,
+    plus the id of the newest batch seen.
+    """
+    state = Path(state)
+    cursor = _read_json(state / CURSORS.name, {}).get(consumer, 0)
+    dirty, last = {}, cursor
+    path = state / CHANGES.name
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["batch"] <= cursor:
+                    continue
+                for city, dates in record["changes"].items():
+                    dirty.setdefault(city, set()).update(dates)
+                last = max(last, record["batch"])
+    return dirty, last
+
+
+def mark_processed(consumer, batch, state=STATE):
+    """Advance the consumer's cursor once it has handled every batch up to `batch`."""
+    path = Path(state) / CURSORS.name
+    cursors = _read_json(path, {})
+    cursors[consumer] = batch
+    _write_json(path, cursors)
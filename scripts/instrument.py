@@ -0,0 +1,320 @@
+import cProfile
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASE = Path("projects/air_quality_health")
+MANIFEST = BASE / "outputs" / "run_manifest.json"
+PROFILES = BASE / "outputs" / "profiles"
+# comma-separated stage names to profile ("all" profiles every stage);
+# AQHIA_PROFILER=pyinstrument swaps cProfile for pyinstrument when installed
+PROFILE_ENV = "AQHIA_PROFILE"
+PROFILER_ENV = "AQHIA_PROFILER"
+# id of the active run, inherited by worker and child processes
+RUN_ENV = "AQHIA_RUN_ID"
+
+_lock = threading.Lock()
+_local = threading.local()
+_runs = {}  # manifest path -> id of the run this process records into
+_PAGE_MB = os.sysconf("SC_PAGE_SIZE") / 2**20 if hasattr(os, "sysconf") else None
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def rss_mb():
+    """Current resident set size in MB (None where it cannot be read)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_MB
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+def _max_rss_mb():
+    """Lifetime peak RSS of this process from getrusage (KB on Linux, bytes on macOS)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _cpu_seconds():
+    """User + system CPU of this process and of its reaped worker processes."""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+class _PeakSampler(threading.Thread):
+    """Polls RSS so a stage's peak is its own, not the process lifetime maximum."""
+
+    def __init__(self, interval=0.02):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = rss_mb()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, rss_mb() or 0)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.peak = max(self.peak, rss_mb() or 0)
+        return self.peak
+
+
+class StageRecorder:
+    """Counters a running stage fills in; written to the manifest when it ends."""
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = {}
+        self.cities = {}
+        self.info = {}
+
+    def rows_in(self, n):
+        self.counts["rows_in"] = self.counts.get("rows_in", 0) + int(n)
+
+    def rows_out(self, n):
+        self.counts["rows_out"] = self.counts.get("rows_out", 0) + int(n)
+
+    def city(self, city, **metrics):
+        """Add per-city metrics (rows, seconds, ...); repeated calls accumulate."""
+        entry = self.cities.setdefault(str(city), {})
+        for key, value in metrics.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                entry[key] = round(entry.get(key, 0) + value, 6)
+            else:
+                entry[key] = value
+
+    def note(self, **info):
+        """Free-form details (engine, worker count, ...) kept with the stage."""
+        self.info.update(info)
+
+
+def current_stage():
+    """
+    The recorder of the innermost active stage on this thread, or a throwaway
+    one, so library code can record rows whether or not it runs instrumented.
+    """
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else StageRecorder(None)
+
+
+def _profile_requested(name):
+    wanted = {s.strip() for s in os.environ.get(PROFILE_ENV, "").split(",") if s.strip()}
+    return name in wanted or "all" in wanted
+
+
+def _start_profiler():
+    if os.environ.get(PROFILER_ENV) == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("⚠ pyinstrument not installed, falling back to cProfile")
+        else:
+            profiler = Profiler(async_mode="disabled")
+            profiler.start()
+            return profiler
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # one profiler per process on 3.12+; concurrent stages skip
+        print("⚠ another stage is being profiled; skipping this one")
+        return None
+    return profiler
+
+
+def _dump_profile(profiler, name):
+    PROFILES.mkdir(parents=True, exist_ok=True)
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        path = PROFILES / f"{name}.prof"
+        profiler.dump_stats(path)
+    else:
+        profiler.stop()
+        path = PROFILES / f"{name}.html"
+        path.write_text(profiler.output_html(), encoding="utf-8")
+    print(f"🔬 {name}: profile saved -> {path}")
+    return str(path)
+
+
+def _write(manifest, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(manifest, indent=1, default=str), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def load_manifest(path=MANIFEST):
+    """The last run manifest, or None if nothing has been recorded yet."""
+    path = Path(path)
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def start_run(path=MANIFEST, **info):
+    """Begin a fresh manifest; stages recorded afterwards belong to this run."""
+    run_id = uuid.uuid4().hex[:12]
+    manifest = {
+        "run_id": run_id,
+        "started": _now(),
+        "updated": _now(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        **info,
+        "stages": {},
+    }
+    with _lock:
+        _write(manifest, path)
+        _runs[str(path)] = run_id
+        if str(path) == str(MANIFEST):
+            os.environ[RUN_ENV] = run_id
+    return run_id
+
+
+def _ensure_run(path, name):
+    """
+    Start a run of its own for a standalone script, so its stages do not
+    merge into the manifest of whichever pipeline run came last.
+    """
+    active = _runs.get(str(path)) or (str(path) == str(MANIFEST) and os.environ.get(RUN_ENV))
+    if not active:
+        start_run(path, standalone=name, argv=sys.argv)
+
+
+def record_stage(name, path=MANIFEST, **fields):
+    """Merge `fields` into a stage's manifest entry (starting a run if needed)."""
+    _ensure_run(path, name)
+    with _lock:
+        manifest = load_manifest(path)
+        if manifest is None:
+            manifest = {"run_id": _runs.get(str(path)) or os.environ.get(RUN_ENV),
+                        "started": _now(), "host": platform.node(),
+                        "python": platform.python_version(), "stages": {}}
+        manifest["stages"].setdefault(name, {}).update(fields)
+        manifest["updated"] = _now()
+        _write(manifest, path)
+
+
+@contextmanager
+def stage(name, profile=None, path=MANIFEST):
+    """
+    Time a block as pipeline stage `name`: wall and CPU seconds, peak RSS,
+    rows in/out and per-city metrics go into the run manifest whether the
+    block succeeds or fails. Outside a pipeline run (no start_run in this
+    process or $AQHIA_RUN_ID) the first stage starts a run of its own.
+    profile=None defers to $AQHIA_PROFILE.
+    CPU and RSS are process-wide, so stages the pipeline runs concurrently
+    share them; re-entering a stage of the same name is a no-op.
+    """
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    outer = next((r for r in _local.stack if r.name == name), None)
+    if outer is not None:
+        # already inside this stage (e.g. the pipeline wrapping a decorated main)
+        yield outer
+        return
+    _ensure_run(path, name)
+    rec = StageRecorder(name)
+    _local.stack.append(rec)
+
+    started = _now()
+    sampler = _PeakSampler() if rss_mb() is not None else None
+    if sampler:
+        sampler.start()
+    wall, cpu = time.perf_counter(), _cpu_seconds()
+    if profile is None:
+        profile = _profile_requested(name)
+    profiler = _start_profiler() if profile else None
+    status, error = "ok", None
+    try:
+        yield rec
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status, error = "failed", str(e.code)
+        raise
+    except BaseException as e:
+        status, error = "failed", f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        wall, cpu = time.perf_counter() - wall, _cpu_seconds() - cpu
+        profile_path = _dump_profile(profiler, name) if profiler else None
+        peak = sampler.stop() if sampler else _max_rss_mb()
+        _local.stack.pop()
+        record_stage(
+            name, path=path,
+            status=status, error=error, started=started, finished=_now(), pid=os.getpid(),
+            wall_s=round(wall, 3), cpu_s=round(cpu, 3),
+            peak_rss_mb=None if peak is None else round(peak, 1),
+            rows_in=rec.counts.get("rows_in"), rows_out=rec.counts.get("rows_out"),
+            cities=rec.cities, info=rec.info, profile=profile_path,
+        )
+
+
+def instrumented(name, profile=None):
+    """Decorator form of stage(); the function reaches its recorder via current_stage()."""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, profile=profile):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def summary(manifest=None):
+    """One row per stage of a manifest as a DataFrame (for the CLI and dashboards)."""
+    import pandas as pd
+
+    manifest = manifest if manifest is not None else load_manifest()
+    if not manifest:
+        return pd.DataFrame()
+    rows = [
+        {"stage": name, **{k: v for k, v in entry.items() if k not in ("cities", "info")},
+         "cities": len(entry.get("cities") or {})}
+        for name, entry in manifest["stages"].items()
+    ]
+    cols = ["stage", "status", "wall_s", "cpu_s", "peak_rss_mb", "rows_in", "rows_out",
+            "cities", "started", "finished", "error", "profile"]
+    df = pd.DataFrame(rows)
+    return df[[c for c in cols if c in df] + [c for c in df if c not in cols]]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show the last run manifest")
+    parser.add_argument("--stage", help="per-city metrics of one stage")
+    args = parser.parse_args()
+
+    manifest = load_manifest()
+    if manifest is None:
+        raise SystemExit(f"⚠ No run manifest yet ({MANIFEST}); run pipeline.py first.")
+    print(f"🧾 run {manifest['run_id']} started {manifest['started']} on {manifest.get('host')}")
+    if args.stage:
+        import pandas as pd
+        cities = manifest["stages"].get(args.stage, {}).get("cities") or {}
+        print(pd.DataFrame.from_dict(cities, orient="index").sort_index().to_string())
+    else:
+        print(summary(manifest).drop(columns=["started", "error", "profile"], errors="ignore")
+              .to_string(index=False))
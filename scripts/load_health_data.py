@@ -1,15 +1,18 @@
 import pandas as pd
 from pathlib import Path
 import numpy as np
+from instrument import current_stage, instrumented
 
 BASE = Path("projects/air_quality_health")
 DATA = BASE / "data" / "who"
 DATA.mkdir(parents=True, exist_ok=True)
 
-def load_who_sample():
+@instrumented("load_health")
+def load_who_sample(seed=0):
     """
     Generate sample health impact data since the original WHO/IHME URL is not available.
-    This creates realistic synthetic data for demonstration purposes.
+    This creates realistic synthetic data for demonstration purposes, from a
+    seeded generator so the regression downstream is reproducible.
     """
     print("⚠ WHO/IHME URL not available, generating sample health data...")
 
@@ -48,12 +51,13 @@ def load_who_sample():
     }
 
     # Generate time series data from 2000 to 2019
+    rng = np.random.default_rng(seed)
     data_rows = []
     for year in range(2000, 2020):
         for country, base_rate in countries_data.items():
             # Add trend (slight improvement over time) and variation
             trend_factor = 1.0 - (year - 2000) * 0.015  # 1.5% annual improvement
-            variation = np.random.normal(0, base_rate * 0.1)  # 10% variation
+            variation = rng.normal(0, base_rate * 0.1)  # 10% variation
             death_rate = max(1, base_rate * trend_factor + variation)
 
             data_rows.append({
@@ -66,6 +70,7 @@ def load_who_sample():
 
     # Save to CSV
     df.to_csv(DATA / "air_pollution_death_rate.csv", index=False)
+    current_stage().rows_out(len(df))
     print(f"✅ Generated sample health data with {len(df)} records saved.")
     print(f"🌍 Countries covered: {len(countries_data)}")
     print(f"📅 Years covered: 2000-2019")
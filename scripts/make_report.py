@@ -1,51 +1,225 @@
+import argparse
+import glob
+import hashlib
+import inspect
+import json
+from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
-import pypandoc
+
+import pandas as pd
+
+from instrument import current_stage, instrumented
 
 BASE = Path("projects/air_quality_health")
 REP = BASE / "outputs" / "reports"
-REP.mkdir(parents=True, exist_ok=True)
+OUTT = BASE / "outputs" / "tables"
+OUTP = BASE / "outputs" / "plots"
+SECTIONS = REP / ".sections"
+CACHE = REP / ".report_cache.json"
+REPORT = REP / "air_quality_report.md"
+FORMATS = ("docx", "html")
+CITY_WINDOW = BASE / "data" / "store" / "rollups" / "city_window.parquet"
+CRF_LABELS = {
+    "log-linear": "short-term all-cause log-linear CRF (RR 1.0065 per 10 µg/m³, Orellano et "
+                  "al. 2020) applied to daily city means with the all-age crude death rate",
+    "gemm": "GEMM NCD+LRI hazard ratio for adults 25+ (Burnett et al. 2018) applied to the "
+            "period-mean exposure with the adult NCD+LRI death rate",
+}
+
+
+@dataclass
+class Section:
+    """One report section: `render()` returns Markdown built from `inputs` (globs under BASE)."""
+    name: str
+    render: callable
+    inputs: tuple = ()
+
+
+def _table(df, floatfmt="{:.1f}"):
+    """Markdown pipe table (no tabulate dependency)."""
+    cells = df.apply(lambda col: col.map(
+        lambda v: floatfmt.format(v) if isinstance(v, float) else str(v)))
+    lines = ["| " + " | ".join(map(str, df.columns)) + " |",
+             "|" + "|".join("---" for _ in df.columns) + "|"]
+    lines += ["| " + " | ".join(row) + " |" for row in cells.to_numpy().tolist()]
+    return "\n".join(lines)
+
+
+def _figure(path, caption):
+    path = Path(path)
+    if not path.exists():
+        return ""
+    return f"\n![{caption}]({Path('..') / path.relative_to(BASE / 'outputs')})\n"
+
+
+def _missing(what, script):
+    return f"_{what} not available yet; run `scripts/{script}`._\n"
 
-text = """# Air Quality and Health Impact Report
 
-## Executive Summary
-This comprehensive analysis examines the relationship between air quality (PM2.5) and health impacts across Indian cities using real-time data from OpenAQ and mortality data from WHO/IHME.
+def _read_csv(path, **kwargs):
+    return pd.read_csv(path, **kwargs) if Path(path).exists() else None
 
-## Methods
+
+# ---------------------------------------------------------------- sections
+
+def summary():
+    parts = []
+    if CITY_WINDOW.exists():
+        window = pd.read_parquet(CITY_WINDOW)
+        worst = window.sort_values("mean", ascending=False).iloc[0]
+        parts.append(
+            f"Across {len(window)} Indian cities, mean PM2.5 over the {int(worst['window_days'])} days "
+            f"to {pd.Timestamp(worst['window_end']):%d %B %Y} was "
+            f"{window['sum'].sum() / window['count'].sum():.1f} µg/m³, highest in "
+            f"{worst['city']} ({worst['mean']:.1f} µg/m³)."
+        )
+    burden = _read_csv(OUTT / "health_burden.csv")
+    if burden is not None:
+        total = burden[burden["city"] == "All cities"].iloc[0]
+        parts.append(
+            f"An estimated {total['attributable_deaths']:,.0f} deaths (95% UI "
+            f"{total['lower_95']:,.0f}–{total['upper_95']:,.0f}) over {int(total['days'])} days are "
+            f"attributable to PM2.5 ({total['crf']} concentration-response function)."
+        )
+    return (
+        "# Air Quality and Health Impact Report\n\n"
+        "## Executive Summary\n"
+        "This analysis examines the relationship between air quality (PM2.5) and health impacts "
+        "across Indian cities using real-time data from OpenAQ and mortality data from WHO/IHME.\n\n"
+        + (" ".join(parts) + "\n" if parts else "")
+    )
+
+
+def methods():
+    return """## Methods
 
 ### Data Sources
 - **PM2.5 data**: OpenAQ API (past 30 days, India)
 - **Health data**: WHO/IHME Air pollution death rates (2000–2019)
-- **Analysis methods**: Time-series decomposition, regression analysis, forecasting
+- **Analysis methods**: Time-series decomposition, regression analysis, forecasting, health burden assessment
 
 ### Analytical Framework
 1. **Data Collection**: Automated fetching of real-time PM2.5 measurements
 2. **Exploratory Analysis**: City-level PM2.5 averages and rankings
 3. **Time-series Analysis**: Seasonal decomposition using 7-day periods
-4. **Regression Modeling**: PM2.5-mortality relationship analysis
-5. **Forecasting**: 30-day PM2.5 predictions using Prophet
+4. **Regression Modeling**: PM2.5-mortality relationship analysis with fixed effects
+5. **Forecasting**: 30-day PM2.5 predictions per city
+6. **Health Burden**: Attributable deaths from concentration-response functions
+"""
+
+
+def current_levels():
+    out = "## Results\n\n### Current PM2.5 Levels\n"
+    if not CITY_WINDOW.exists():
+        return out + _missing("City rankings", "rollups.py")
+    window = pd.read_parquet(CITY_WINDOW).sort_values("mean", ascending=False)
+    top = window.head(10)[["city", "mean", "p95", "max", "count"]]
+    top.columns = ["City", "Mean (µg/m³)", "P95", "Max", "Readings"]
+    out += (f"Ten most polluted cities over the last {int(window['window_days'].iloc[0])} days:\n\n"
+            + _table(top) + "\n" + _figure(OUTP / "top_cities_pm25.png", "Top cities by PM2.5"))
+    aqi = _read_csv(OUTT / "aqi_latest.csv")
+    if aqi is not None and aqi["category"].notna().any():
+        counts = aqi["category"].value_counts()
+        out += ("\nLatest National AQI (24-hour PM2.5) by station: "
+                + ", ".join(f"{cat} {n}" for cat, n in counts.items()) + ".\n")
+    return out
+
+
+def decomposition():
+    out = "\n### Time-series Decomposition\n"
+    dec = _read_csv(OUTT / "decomposition.csv", parse_dates=["date"])
+    if dec is None:
+        return out + _missing("Decomposition", "decompose_pm25.py")
+    trend = dec.dropna(subset=["trend"]).sort_values("date").groupby("city")["trend"]
+    stats = pd.DataFrame({
+        "weekly_amplitude": dec.groupby("city")["seasonal"].agg(lambda s: s.max() - s.min()),
+        "trend_start": trend.first(),
+        "trend_end": trend.last(),
+    }).dropna()
+    stats["trend_change"] = stats["trend_end"] - stats["trend_start"]
+    stats = stats.sort_values("weekly_amplitude", ascending=False).reset_index()
+    table = stats.head(10)[["city", "weekly_amplitude", "trend_start", "trend_end", "trend_change"]]
+    table.columns = ["City", "Weekly amplitude", "Trend start", "Trend end", "Change"]
+    rising = int((stats["trend_change"] > 0).sum())
+    out += (f"7-day additive decomposition of daily means; trends rose in {rising} of "
+            f"{len(stats)} cities.\n\n" + _table(table) + "\n")
+    if len(stats):
+        city = stats["city"].iloc[0]
+        out += _figure(OUTP / f"decompose_{city.replace(' ', '_')}.png", f"Decomposition, {city}")
+    return out
 
-## Results
 
-### Current PM2.5 Levels
-- Generated: `outputs/plots/top_cities_pm25.png`
-- National average PM2.5 levels calculated
-- City rankings by pollution levels
+def regression():
+    out = "\n### Health Impact Analysis\n"
+    coefs = _read_csv(OUTT / "pm25_mortality_coefficients.csv")
+    if coefs is None:
+        return out + _missing("Regression results", "regress_pm25_mortality.py")
+    rows = coefs[coefs["term"] == "ln_pm25"][["model", "coef", "std_err", "p", "r_squared", "nobs"]]
+    rows = rows.assign(nobs=rows["nobs"].astype(int))
+    rows.columns = ["Model", "Elasticity", "Std. error", "p", "R²", "N"]
+    return (out + "Log-log regressions of death rate on PM2.5 (fixed-effects standard errors "
+            "clustered by country):\n\n" + _table(rows, "{:.3f}") + "\n")
 
-### Time-series Decomposition
-- Seasonal patterns identified for major cities
-- Trend analysis showing long-term PM2.5 trajectories
-- Weekly patterns in air quality fluctuations
 
-### Health Impact Analysis
-- Regression models linking PM2.5 to mortality rates
-- Country-level correlations between pollution and health burden
-- Fixed-effects panel models controlling for country-specific factors
+def burden():
+    out = "\n### Attributable Mortality\n"
+    table = _read_csv(OUTT / "health_burden.csv")
+    if table is None:
+        return out + _missing("Health burden estimates", "health_burden.py")
+    crf = table["crf"].iloc[0]
+    out += f"Concentration-response function: {CRF_LABELS.get(crf, crf)}.\n\n"
+    table = table.sort_values("attributable_deaths", ascending=False)
+    table = table[["city", "mean_pm25", "attributable_deaths", "lower_95", "upper_95", "per_100k_year"]]
+    table.columns = ["City", "Mean PM2.5", "Deaths", "Lower 95%", "Upper 95%", "Per 100k / yr"]
+    return out + _table(table) + "\n"
 
-### Forecasting
-- 30-day PM2.5 forecasts for each city
-- Confidence intervals for predictions
-- Seasonal trend projections
 
+def forecasts():
+    out = "\n### Forecasting\n"
+    paths = [p for p in sorted(glob.glob(str(OUTT / "forecast_*.csv")))
+             if not p.endswith("forecast_engine_comparison.csv")]
+    if not paths:
+        return out + _missing("Forecasts", "forecast_pm25.py")
+    rows = []
+    for path in paths:
+        df = pd.read_csv(path, parse_dates=["ds"])
+        last = df.loc[df["y"].notna(), "ds"].max() if "y" in df else df["ds"].min()
+        ahead = df[df["ds"] > last]
+        if ahead.empty:
+            continue
+        rows.append({"City": df["city"].iloc[0],
+                     "Last observed": f"{last:%Y-%m-%d}",
+                     "Mean forecast": ahead["yhat"].mean(),
+                     "Lower": ahead["yhat_lower"].mean(),
+                     "Upper": ahead["yhat_upper"].mean(),
+                     "Days": len(ahead)})
+    if not rows:
+        return out + "No forecast extends beyond the last observed day.\n"
+    table = pd.DataFrame(rows).sort_values("Mean forecast", ascending=False)
+    out += f"Mean predicted PM2.5 over the forecast horizon ({len(table)} cities):\n\n" + _table(table) + "\n"
+    city = table["City"].iloc[0]
+    out += _figure(OUTP / f"forecast_{city.replace(' ', '_')}.png", f"Forecast, {city}")
+    return out
+
+
+def alerts():
+    out = "\n### Pollution Episodes\n"
+    events = _read_csv(OUTT / "alert_events.csv")
+    if events is None:
+        return out + _missing("Episode alerts", "alerts.py")
+    episodes = events[(events["level"] == "city") & (events["event"] == "end")]
+    if episodes.empty:
+        return out + "No completed city-level episodes in the archive.\n"
+    table = episodes.groupby("threshold").agg(
+        Episodes=("key", "size"), Cities=("key", "nunique"),
+        **{"Mean hours": ("duration_hours", "mean"), "Longest": ("duration_hours", "max")},
+    ).reset_index().rename(columns={"threshold": "Threshold"})
+    return out + "Completed city-level exceedance episodes (24-hour rolling mean):\n\n" + _table(table) + "\n"
+
+
+def discussion():
+    return """
 ## Discussion
 
 ### Key Findings
@@ -68,54 +242,117 @@ The findings support the need for:
 ### Research Extensions
 - Integration with satellite data for broader spatial coverage
 - Machine learning models for improved forecasting accuracy
-- Health outcome modeling at city level
 - Economic impact assessment of air pollution
 
 ### Technical Improvements
-- Real-time dashboard updates
-- Automated alert systems for pollution episodes
 - Integration with weather data for better predictions
 - Mobile app for public access to air quality information
 
 ## References
 - OpenAQ API documentation
 - WHO/IHME Global Burden of Disease Study
+- Burnett et al. (2018), Global estimates of mortality associated with long-term exposure to outdoor fine particulate matter (GEMM)
 - Prophet forecasting methodology
 - Statistical analysis using Python scientific stack
 
 ## Appendices
 
-### Data Quality Assessment
-- OpenAQ data validation procedures
-- WHO/IHME data completeness analysis
-- Outlier detection and handling methods
-
-### Statistical Methods
-- Regression model specifications
-- Time-series decomposition parameters
-- Forecasting model validation metrics
-
 ### Code and Reproducibility
 All analysis code available in the `scripts/` directory. Dashboard interfaces provide interactive exploration of results.
+"""
 
----
 
-*Report generated on: $(date)*
-*Analysis period: Last 30 days*
-*Geographic scope: India (primary), Global (health impact analysis)*
+SECTIONS_ORDER = [
+    Section("summary", summary, ("data/store/rollups/city_window.parquet",
+                                 "outputs/tables/health_burden.csv")),
+    Section("methods", methods),
+    Section("current_levels", current_levels, ("data/store/rollups/city_window.parquet",
+                                               "outputs/tables/aqi_latest.csv",
+                                               "outputs/plots/top_cities_pm25.png")),
+    Section("decomposition", decomposition, ("outputs/tables/decomposition.csv",)),
+    Section("regression", regression, ("outputs/tables/pm25_mortality_coefficients.csv",)),
+    Section("burden", burden, ("outputs/tables/health_burden.csv",)),
+    Section("forecasts", forecasts, ("outputs/tables/forecast_*.csv",)),
+    Section("alerts", alerts, ("outputs/tables/alert_events.csv",)),
+    Section("discussion", discussion),
+]
 
-"""
 
-path_md = REP / "air_quality_report.md"
-path_md.write_text(text, encoding="utf-8")
+# ---------------------------------------------------------------- build
+
+def _read_json(path, default):
+    path = Path(path)
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else default
+
+
+def section_key(section):
+    """Hash of a section's template code and the contents of its inputs."""
+    h = hashlib.sha256(inspect.getsource(section.render).encode())
+    for pattern in section.inputs:
+        for path in sorted(glob.glob(str(BASE / pattern))):
+            h.update(path.encode())
+            h.update(Path(path).read_bytes())
+    return h.hexdigest()
+
+
+def build(formats=FORMATS, force=False):
+    """
+    Assemble the report from cached sections, re-rendering only those whose
+    inputs or template changed, and convert to the other formats only when
+    the Markdown body changed. Returns the names of the re-rendered sections.
+    """
+    REP.mkdir(parents=True, exist_ok=True)
+    SECTIONS.mkdir(parents=True, exist_ok=True)
+    cache = _read_json(CACHE, {"sections": {}, "formats": {}})
+    rendered, parts = [], []
+    for section in SECTIONS_ORDER:
+        key = section_key(section)
+        path = SECTIONS / f"{section.name}.md"
+        if force or cache["sections"].get(section.name) != key or not path.exists():
+            path.write_text(section.render(), encoding="utf-8")
+            cache["sections"][section.name] = key
+            rendered.append(section.name)
+        parts.append(path.read_text(encoding="utf-8"))
+
+    body = "\n".join(parts)
+    body_hash = hashlib.sha256(body.encode()).hexdigest()
+    if force or cache.get("body") != body_hash or not REPORT.exists():
+        # the timestamp marks when the content last changed, not every run
+        footer = (f"\n---\n\n*Report generated on: {datetime.now():%Y-%m-%d %H:%M}*\n"
+                  "*Geographic scope: India (primary), Global (health impact analysis)*\n")
+        REPORT.write_text(body + footer, encoding="utf-8")
+        cache["body"] = body_hash
+
+    import pypandoc
+    for fmt in formats:
+        out = REPORT.with_suffix(f".{fmt}")
+        if not force and cache["formats"].get(fmt) == cache["body"] and out.exists():
+            continue
+        try:
+            # relative figure links resolve against the reports directory
+            extra = ["--standalone", f"--resource-path={REP}"]
+            pypandoc.convert_file(str(REPORT), fmt, outputfile=str(out), extra_args=extra)
+            cache["formats"][fmt] = cache["body"]
+        except Exception as e:
+            print(f"⚠ {fmt.upper()} conversion failed: {e}")
+
+    CACHE.write_text(json.dumps(cache, indent=1, sort_keys=True), encoding="utf-8")
+    return rendered
+
+
+@instrumented("report")
+def main(formats=FORMATS, force=False):
+    """Write the Markdown report and convert it to DOCX / HTML."""
+    rendered = build(formats=formats, force=force)
+    current_stage().note(sections_rendered=rendered)
+    print(f"🔄 Re-rendered sections: {', '.join(rendered) or 'none'}")
+    print("✅ report generated:", REPORT)
 
-try:
-    pypandoc.convert_file(
-        str(path_md),
-        'docx',
-        outputfile=str(path_md).replace('.md', '.docx')
-    )
-except Exception as e:
-    print(f"⚠ DOCX conversion failed: {e}")
 
-print("✅ report generated:", path_md)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the air-quality report")
+    parser.add_argument("--formats", nargs="*", default=list(FORMATS),
+                        help="pandoc output formats besides Markdown")
+    parser.add_argument("--force", action="store_true", help="re-render every section")
+    args = parser.parse_args()
+    main(formats=args.formats, force=args.force)
@@ -0,0 +1,239 @@
+import glob
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from instrument import current_stage, stage
+
+BASE = Path("projects/air_quality_health")
+LEGACY = BASE / "data" / "openaq"
+STORE = BASE / "data" / "store" / "measurements"
+
+# Typed schema of the stored measurements; `date` and `city` are the hive
+# partition keys (date=YYYY-MM-DD/city=<name>/part-*.parquet).
+SCHEMA = pa.schema([
+    ("location", pa.string()),
+    ("value", pa.float32()),
+    ("unit", pa.string()),
+    ("country", pa.string()),
+    ("latitude", pa.float32()),
+    ("longitude", pa.float32()),
+    ("timestamp", pa.timestamp("us")),
+    ("date", pa.string()),
+    ("city", pa.string()),
+])
+PARTITIONING = ds.partitioning(
+    pa.schema([("date", pa.string()), ("city", pa.string())]), flavor="hive"
+)
+
+# pandas side of the schema: the low-cardinality strings load as categoricals
+# and the numbers as float32, instead of object strings and inferred float64
+DTYPES = {
+    "city": "category",
+    "location": "category",
+    "unit": "category",
+    "country": "category",
+    "value": "float32",
+    "latitude": "float32",
+    "longitude": "float32",
+}
+TIMESTAMP_FORMAT = "ISO8601"  # "2025-09-26 20:30:50.877925" in the legacy CSVs
+
+
+def parse_coordinates(coordinates):
+    """
+    Vectorised parse of the legacy "{'latitude': .., 'longitude': ..}" strings
+    into float32 latitude / longitude columns (no literal_eval per row).
+    """
+    parts = coordinates.astype(str).str.extract(
+        r"'latitude':\s*([-+\d.eE]+).*'longitude':\s*([-+\d.eE]+)"
+    )
+    return parts[0].astype("float32"), parts[1].astype("float32")
+
+
+def write_measurements(df, root=STORE):
+    """
+    Append a frame of measurements to the partitioned Parquet store.
+    Each call writes new part files, so batches never rewrite earlier data.
+    """
+    if df.empty:
+        return 0
+    df = df.copy()
+    if "coordinates" in df:
+        df["latitude"], df["longitude"] = parse_coordinates(df.pop("coordinates"))
+    df["city"] = df["city"].astype(str)
+    df["timestamp"] = pd.to_datetime(df["timestamp"]).astype("datetime64[us]")
+    df["date"] = df["timestamp"].dt.strftime("%Y-%m-%d")
+    for col in ("location", "unit", "country"):
+        df[col] = df[col].astype(str)
+    for col in ("value", "latitude", "longitude"):
+        df[col] = df[col].astype("float32")
+
+    table = pa.Table.from_pandas(df[SCHEMA.names], schema=SCHEMA, preserve_index=False)
+    ds.write_dataset(
+        table,
+        Path(root),
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        max_partitions=1 << 20,
+    )
+    return len(df)
+
+
+def _typed_csv_chunk(df, columns):
+    if "coordinates" in df:
+        df["latitude"], df["longitude"] = parse_coordinates(df.pop("coordinates"))
+    if "timestamp" in df:
+        df["timestamp"] = pd.to_datetime(df["timestamp"], format=TIMESTAMP_FORMAT)
+    return df[columns] if columns is not None else df
+
+
+def read_csv_measurements(path, columns=None, chunksize=None):
+    """
+    Typed read of a legacy OpenAQ CSV: explicit dtypes instead of inference,
+    the coordinates dict split into float32 latitude / longitude and
+    timestamps parsed with one fixed format. `columns` projects the output
+    (only the CSV fields they need are parsed); with `chunksize` an iterator
+    of frames of at most that many rows is returned.
+    """
+    usecols = None
+    if columns is not None:
+        columns = list(columns)
+        usecols = [c for c in columns if c not in ("latitude", "longitude")]
+        if {"latitude", "longitude"} & set(columns):
+            usecols.append("coordinates")
+    reader = pd.read_csv(
+        path, usecols=usecols, chunksize=chunksize,
+        dtype={k: v for k, v in DTYPES.items() if k not in ("latitude", "longitude")},
+    )
+    if chunksize is None:
+        return _typed_csv_chunk(reader, columns)
+    return (_typed_csv_chunk(chunk, columns) for chunk in reader)
+
+
+def import_csv(paths=None, root=STORE, chunksize=500_000, state=None):
+    """
+    Load legacy openaq_pm25_<country>_<date>.csv files into the store.
+    Defaults to every archived file, not just the newest one; each file is
+    streamed in chunks so memory stays bounded by `chunksize` rows. Chunks
+    are logged to the change log of `state` (by default the main state when
+    importing into the main store) so the rollups pick them up.
+    """
+    from ingest import STATE, record_changes  # ingest imports this module
+
+    if state is None and Path(root) == STORE:
+        state = STATE
+    if paths is None:
+        paths = sorted(glob.glob(str(LEGACY / "openaq_pm25_*.csv")))
+    n = 0
+    for path in paths:
+        for chunk in read_csv_measurements(path, chunksize=chunksize):
+            written = write_measurements(chunk, root=root)
+            if state is not None and written:
+                record_changes(chunk, state=state)
+            n += written
+    current_stage().rows_out(n)
+    return n
+
+
+def open_store(root=STORE):
+    """
+    Return the measurement dataset, migrating legacy CSV files on first use.
+    Raises FileNotFoundError when there is no data at all.
+    """
+    root = Path(root)
+    if not any(root.glob("date=*")):
+        if root != STORE or not import_csv(root=root):
+            raise FileNotFoundError(f"No measurements in {root}")
+    return ds.dataset(root, format="parquet", partitioning=PARTITIONING, schema=SCHEMA)
+
+
+def latest_date(root=STORE):
+    """Newest date partition in the store, read from the directory names only."""
+    open_store(root)
+    return pd.Timestamp(max(p.name.split("=", 1)[1] for p in Path(root).glob("date=*")))
+
+
+def read_stations(root=STORE):
+    """One row per monitoring station with its city and float coordinates."""
+    df = read_measurements(columns=["location", "city", "latitude", "longitude"], root=root)
+    df = df.drop_duplicates("location", keep="last").reset_index(drop=True)
+    return df.astype({"location": str, "city": str})
+
+
+def filter_expression(cities=None, start=None, end=None):
+    """Arrow filter for a city list and an inclusive timestamp range."""
+    exprs = []
+    if cities is not None:
+        cities = [cities] if isinstance(cities, str) else list(cities)
+        exprs.append(ds.field("city").isin(cities))
+    if start is not None:
+        start = pd.Timestamp(start)
+        # prune on the partition key first, then trim within the day
+        exprs.append(ds.field("date") >= start.strftime("%Y-%m-%d"))
+        exprs.append(ds.field("timestamp") >= pa.scalar(start.to_pydatetime(), pa.timestamp("us")))
+    if end is not None:
+        end = pd.Timestamp(end)
+        exprs.append(ds.field("date") <= end.strftime("%Y-%m-%d"))
+        exprs.append(ds.field("timestamp") <= pa.scalar(end.to_pydatetime(), pa.timestamp("us")))
+    if not exprs:
+        return None
+    expr = exprs[0]
+    for e in exprs[1:]:
+        expr = expr & e
+    return expr
+
+
+def to_frame(table):
+    """Arrow table -> pandas with categorical strings and float32 values kept."""
+    return table.to_pandas(strings_to_categorical=True)
+
+
+def read_measurements(cities=None, start=None, end=None, columns=None, root=STORE):
+    """
+    Read measurements with city / time-range filters and column projection
+    pushed down to the partitioned Parquet files.
+    """
+    dataset = open_store(root)
+    table = dataset.to_table(columns=columns, filter=filter_expression(cities, start, end))
+    return to_frame(table)
+
+
+def iter_days(dates=None, cities=None, columns=None, root=STORE):
+    """
+    Yield (day, frame) for each date partition (all of them by default),
+    so whole-archive passes hold one day of readings at a time.
+    """
+    dataset = open_store(root)
+    if dates is None:
+        dates = [p.name.split("=", 1)[1] for p in Path(root).glob("date=*")]
+    for day in pd.to_datetime(sorted(dates)):
+        day_end = day + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+        table = dataset.to_table(columns=columns,
+                                 filter=filter_expression(cities, start=day, end=day_end))
+        yield day, to_frame(table)
+
+
+def iter_batches(cities=None, start=None, end=None, columns=None, batch_rows=1 << 20,
+                 root=STORE):
+    """Yield filtered, projected frames of at most `batch_rows` rows."""
+    dataset = open_store(root)
+    scanner = dataset.scanner(columns=columns, filter=filter_expression(cities, start, end),
+                              batch_size=batch_rows)
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield to_frame(pa.Table.from_batches([batch]))
+
+
+if __name__ == "__main__":
+    with stage("import_csv"):
+        n = import_csv()
+    print(f"✅ Imported {n} legacy CSV records into {STORE} ({datetime.now():%Y-%m-%d %H:%M})")
+    from rollups import update_rollups  # rollups imports this module
+    print(f"🔄 Rollups refreshed for {update_rollups()} date(s)")
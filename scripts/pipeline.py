@@ -0,0 +1,246 @@
+import argparse
+import glob
+import hashlib
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+from instrument import PROFILE_ENV, record_stage, stage as instrument_stage, start_run
+
+# stages render figures from worker threads; keep matplotlib off any GUI backend
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+BASE = Path("projects/air_quality_health")
+SCRIPTS = Path(__file__).resolve().parent
+CACHE = BASE / "outputs" / ".pipeline_cache.json"
+
+
+@dataclass
+class Stage:
+    """
+    One pipeline step: `module.func(**params)` from scripts/.
+    `inputs` / `outputs` are paths or glob patterns relative to BASE; a
+    directory input is fingerprinted by file names, sizes and mtimes.
+    """
+    name: str
+    module: str
+    func: str = "main"
+    deps: tuple = ()
+    inputs: tuple = ()
+    outputs: tuple = ()
+    params: dict = field(default_factory=dict)
+    always_run: bool = False   # external sources (fetch) cannot be cached
+    uses_pyplot: bool = False  # pyplot state is global, so these run one at a time
+
+
+STAGES = [
+    Stage("fetch", "fetch_openaq", func="fetch_pm25",
+          params={"country": "IN", "days": 30},
+          outputs=("data/store/measurements",), always_run=True),
+    Stage("load_health", "load_health_data", func="load_who_sample",
+          outputs=("data/who/air_pollution_death_rate.csv",)),
+    Stage("rollup", "rollups", func="update_rollups", deps=("fetch",),
+          inputs=("data/store/measurements",),
+          outputs=("data/store/rollups/city_day.parquet",
+                   "data/store/rollups/city_window.parquet")),
+    Stage("analyze", "analyze_data", deps=("rollup", "load_health"),
+          inputs=("data/store/rollups/city_window.parquet",
+                  "data/who/air_pollution_death_rate.csv"),
+          outputs=("outputs/plots/top_cities_pm25.png",), uses_pyplot=True),
+    Stage("decompose", "decompose_pm25", deps=("rollup",), params={"plots": False},
+          inputs=("data/store/rollups/city_day.parquet",),
+          outputs=("outputs/tables/decomposition.csv",)),
+    Stage("regress", "regress_pm25_mortality", deps=("load_health",),
+          inputs=("data/who/air_pollution_death_rate.csv",),
+          outputs=("outputs/tables/pm25_mortality_regression.txt",
+                   "outputs/tables/pm25_mortality_fixed_effects.txt",
+                   "outputs/tables/pm25_mortality_coefficients.csv")),
+    Stage("forecast", "forecast_pm25", deps=("rollup",), params={"workers": 0, "plots": False},
+          inputs=("data/store/rollups/city_day.parquet",),
+          outputs=("outputs/tables/forecast_*.csv",)),
+    Stage("backtest", "backtest", deps=("rollup",), params={"workers": 0},
+          inputs=("data/store/rollups/city_day.parquet",),
+          outputs=("outputs/tables/backtest_summary.csv", "outputs/tables/backtest_metrics.csv")),
+    Stage("archive", "archive_query", deps=("fetch",), params={"workers": 0},
+          inputs=("data/store/measurements",),
+          outputs=("outputs/tables/city_monthly_trend.csv", "outputs/tables/city_climatology.csv")),
+    Stage("aqi", "aqi", deps=("rollup",), params={"incremental": True},
+          inputs=("data/store/rollups/station_hour",),
+          outputs=("outputs/tables/aqi_latest.csv",)),
+    Stage("alerts", "alerts", deps=("fetch",), params={"incremental": True},
+          inputs=("data/store/measurements",),
+          outputs=("outputs/tables/alert_events.csv",)),
+    Stage("burden", "health_burden", deps=("rollup",),
+          inputs=("data/store/rollups/city_day.parquet",),
+          outputs=("outputs/tables/health_burden.csv",)),
+    Stage("render", "render_plots", func="render", deps=("decompose", "forecast"),
+          inputs=("outputs/tables/decomposition.csv", "outputs/tables/forecast_*.csv"),
+          outputs=("outputs/plots/decompose_*.png", "outputs/plots/forecast_*.png")),
+    Stage("report", "make_report", deps=("analyze", "render", "regress", "burden", "aqi", "alerts"),
+          inputs=("outputs/tables/*.csv", "outputs/tables/*.txt",
+                  "data/store/rollups/city_window.parquet"),
+          outputs=("outputs/reports/air_quality_report.md",)),
+]
+
+
+def _read_json(path, default):
+    path = Path(path)
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else default
+
+
+def fingerprint(pattern, base=BASE):
+    """Content hash of a file / glob, or a stat-based hash of a directory tree."""
+    h = hashlib.sha256()
+    for path in sorted(glob.glob(str(Path(base) / pattern))):
+        path = Path(path)
+        h.update(str(path.relative_to(base)).encode())
+        if path.is_dir():
+            for f in sorted(path.rglob("*")):
+                if f.is_file():
+                    st = f.stat()
+                    h.update(f"{f.relative_to(path)}:{st.st_size}:{st.st_mtime_ns}".encode())
+        else:
+            h.update(path.read_bytes())
+    return h.hexdigest()
+
+
+def stage_key(stage, base=BASE):
+    """Hash of a stage's inputs, code and parameters."""
+    h = hashlib.sha256()
+    h.update((SCRIPTS / f"{stage.module}.py").read_bytes())
+    h.update(json.dumps([stage.func, stage.params], sort_keys=True, default=str).encode())
+    for pattern in stage.inputs:
+        h.update(fingerprint(pattern, base).encode())
+    return h.hexdigest()
+
+
+def _outputs_exist(stage, base=BASE):
+    return all(glob.glob(str(Path(base) / p)) for p in stage.outputs)
+
+
+def _upstream(targets, stages):
+    by_name = {s.name: s for s in stages}
+    selected, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in by_name:
+            raise SystemExit(f"⚠ Unknown stage: {name}")
+        if name not in selected:
+            selected.add(name)
+            todo.extend(by_name[name].deps)
+    return [s for s in stages if s.name in selected]
+
+
+def _run_stage(stage, cache, force, pyplot_lock):
+    key = stage_key(stage)
+    cached = cache.get(stage.name, {})
+    if (not force and not stage.always_run and cached.get("key") == key
+            and _outputs_exist(stage)):
+        print(f"⏭  {stage.name}: inputs unchanged, skipped")
+        record_stage(stage.name, status="cached", finished=cached.get("finished"),
+                     last_wall_s=cached.get("seconds"))
+        return "cached"
+
+    print(f"==> {stage.name}")
+    start = time.perf_counter()
+    try:
+        module = importlib.import_module(stage.module)
+        with pyplot_lock if stage.uses_pyplot else nullcontext():
+            # decorated entry points re-enter this same stage record
+            with instrument_stage(stage.name):
+                getattr(module, stage.func)(**stage.params)
+    except (Exception, SystemExit) as e:
+        print(f"❌ {stage.name} failed: {e}")
+        record_stage(stage.name, status="failed", error=str(e))
+        return "failed"
+
+    cache[stage.name] = {
+        # re-key after the run: always_run stages change their own inputs
+        "key": stage_key(stage),
+        "finished": datetime.now().isoformat(timespec="seconds"),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    print(f"✅ {stage.name} done in {cache[stage.name]['seconds']:.1f}s")
+    return "done"
+
+
+def run(targets=None, force=False, workers=4, stages=STAGES):
+    """
+    Run `targets` and everything upstream of them in dependency order.
+    Independent branches run concurrently on a thread pool inside this
+    process, so heavy imports are paid once; stages whose input, code and
+    parameter hashes match the cache are skipped. Each run starts a new
+    run manifest (outputs/run_manifest.json) with per-stage metrics.
+    """
+    if targets is None:
+        targets = [s.name for s in stages]
+    selected = _upstream(targets, stages)
+    start_run(targets=targets, force=force, workers=workers)
+    cache = _read_json(CACHE, {})
+    pyplot_lock = threading.Lock()
+    if str(SCRIPTS) not in sys.path:
+        sys.path.insert(0, str(SCRIPTS))
+
+    status, running = {}, {}
+    pending = {s.name: s for s in selected}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                deps = [status.get(d) for d in stage.deps]
+                if any(d in ("failed", "blocked") for d in deps):
+                    status[name] = "blocked"
+                    del pending[name]
+                    record_stage(name, status="blocked")
+                    print(f"⏸  {name}: blocked by a failed dependency")
+                elif all(d in ("done", "cached") for d in deps):
+                    del pending[name]
+                    future = pool.submit(_run_stage, stage, cache, force, pyplot_lock)
+                    running[future] = name
+            if not running:
+                if pending:
+                    raise SystemExit(f"⚠ Dependency cycle among: {', '.join(pending)}")
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                status[running.pop(future)] = future.result()
+
+    CACHE.parent.mkdir(parents=True, exist_ok=True)
+    CACHE.write_text(json.dumps(cache, indent=1, sort_keys=True), encoding="utf-8")
+    return status
+
+
+def main(targets=None, force=False, workers=4):
+    """Run the pipeline and exit non-zero if any stage failed."""
+    start = time.perf_counter()
+    status = run(targets, force=force, workers=workers)
+    summary = ", ".join(f"{name}={state}" for name, state in status.items())
+    print(f"⏱  pipeline finished in {time.perf_counter() - start:.1f}s ({summary})")
+    if any(state in ("failed", "blocked") for state in status.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the air-quality pipeline DAG")
+    parser.add_argument("targets", nargs="*", help="stages to run (default: all)")
+    parser.add_argument("--force", action="store_true", help="ignore the stage cache")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--list", action="store_true", help="show the stages and exit")
+    parser.add_argument("--profile", default=None, metavar="STAGES",
+                        help="comma-separated stages to profile into outputs/profiles/ (or 'all')")
+    args = parser.parse_args()
+    if args.profile:
+        os.environ[PROFILE_ENV] = args.profile
+
+    if args.list:
+        for s in STAGES:
+            print(f"{s.name:12s} <- {', '.join(s.deps) or '-'}")
+    else:
+        main(args.targets or None, force=args.force, workers=args.workers)
@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import aiohttp
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+from fetch_openaq import station_layout, synthetic_readings
+from ingest import STATE, ingest_batch, load_watermarks
+from instrument import record_stage
+from measurement_store import STORE
+from rollups import update_rollups
+
+
+# ---------------------------------------------------------------- replay server
+
+class ReplayFeed:
+    """
+    Deterministic stand-in for the OpenAQ feed. Station readings come from
+    the same generator as fetch_openaq.generate_pm25_grid, one hour block at
+    a time (seeded by hour, so any hour is reproducible), and the replay
+    clock advances `speed` simulated seconds per real second from `start`.
+    """
+
+    def __init__(self, stations=1000, seed=0, start=None, speed=1.0,
+                 missing_rate=0.05, cache_hours=48):
+        self.layout = station_layout(stations, np.random.default_rng(seed))
+        self.position = {loc: i for i, loc in enumerate(self.layout["location"])}
+        self.records = (self.layout[["location", "city", "latitude", "longitude"]]
+                        .astype({"city": str}).assign(unit="µg/m³", country="IN")
+                        .to_dict("records"))
+        self.seed, self.speed, self.missing_rate = seed, speed, missing_rate
+        self.start = pd.Timestamp(start or datetime.now() - timedelta(days=1)).floor("h")
+        self.t0 = time.monotonic()
+        self.blocks, self.cache_hours = OrderedDict(), cache_hours
+
+    def now(self):
+        return self.start + pd.Timedelta(seconds=(time.monotonic() - self.t0) * self.speed)
+
+    def _block(self, hour):
+        # values of every station for one epoch hour, NaN where missing
+        if hour not in self.blocks:
+            rng = np.random.default_rng((self.seed, hour))
+            ts = pd.Timestamp(hour * 3600, unit="s")
+            df = synthetic_readings([ts], self.layout, rng, missing_rate=self.missing_rate)
+            values = np.full(len(self.layout), np.nan)
+            values[df["location"].cat.codes.to_numpy()] = df["value"].to_numpy()
+            self.blocks[hour] = (ts.isoformat(), values)
+            while len(self.blocks) > self.cache_hours:
+                self.blocks.popitem(last=False)
+        return self.blocks[hour]
+
+    def latest(self, location, since=None, limit=24):
+        """Readings of one station after `since`, up to the replay clock."""
+        i = self.position[location]
+        end = int(self.now().timestamp() // 3600)
+        first = end - limit + 1
+        if since is not None:
+            first = max(first, int(pd.Timestamp(since).timestamp() // 3600) + 1)
+        results = []
+        for hour in range(first, end + 1):
+            stamp, values = self._block(hour)
+            if not np.isnan(values[i]):
+                results.append({**self.records[i], "value": float(values[i]), "timestamp": stamp})
+        return results
+
+
+def make_replay_app(feed, latency_ms=0.0, error_rate=0.0):
+    """
+    aiohttp app serving `feed`: GET /locations lists the stations and
+    GET /locations/{location}/latest?since=ISO returns newer readings.
+    Optional exponential latency and random 503s exercise the client's
+    timeouts and retries.
+    """
+    async def locations(request):
+        return web.json_response({"results": feed.records})
+
+    async def latest(request):
+        if latency_ms:
+            await asyncio.sleep(random.expovariate(1000.0 / latency_ms))
+        if error_rate and random.random() < error_rate:
+            raise web.HTTPServiceUnavailable()
+        location = request.match_info["location"]
+        if location not in feed.position:
+            raise web.HTTPNotFound()
+        since = request.query.get("since")
+        return web.json_response({"results": feed.latest(location, since=since)})
+
+    app = web.Application()
+    app.add_routes([web.get("/locations", locations),
+                    web.get("/locations/{location}/latest", latest)])
+    return app
+
+
+async def start_replay_server(feed, host="127.0.0.1", port=8765, **kwargs):
+    runner = web.AppRunner(make_replay_app(feed, **kwargs), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner
+
+
+# ---------------------------------------------------------------- ingester
+
+class RetryableError(Exception):
+    pass
+
+
+async def fetch_json(session, url, params=None, retries=4, backoff=0.2):
+    """
+    GET `url` as JSON, retrying connection errors, timeouts and 5xx / 429
+    responses with exponential backoff plus full jitter. 4xx are not retried.
+    """
+    for attempt in range(retries + 1):
+        try:
+            async with session.get(url, params=params) as resp:
+                if resp.status >= 500 or resp.status == 429:
+                    raise RetryableError(f"HTTP {resp.status}")
+                resp.raise_for_status()
+                return await resp.json()
+        except (RetryableError, aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == retries:
+                raise
+            await asyncio.sleep(random.uniform(0, backoff * 2 ** attempt))
+
+
+async def _poll_station(session, semaphore, url, location, since, latencies, retries):
+    async with semaphore:
+        start = time.perf_counter()
+        params = {"since": since} if since else None
+        try:
+            payload = await fetch_json(session, f"{url}/locations/{location}/latest",
+                                       params=params, retries=retries)
+        except Exception as e:
+            return location, None, e
+        finally:
+            latencies.append(time.perf_counter() - start)
+    return location, payload["results"], None
+
+
+async def poll_cycle(session, url, locations, watermarks, concurrency=200, retries=4):
+    """
+    Poll every station once, at most `concurrency` requests in flight.
+    Returns (readings frame, per-request latencies, failed locations).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    tasks = [
+        _poll_station(session, semaphore, url, loc,
+                      watermarks.get(loc, {}).get("watermark"), latencies, retries)
+        for loc in locations
+    ]
+    rows, failed = [], []
+    for location, results, error in await asyncio.gather(*tasks):
+        if error is not None:
+            failed.append(location)
+        else:
+            rows.extend(results)
+    return pd.DataFrame(rows), np.array(latencies), failed
+
+
+def latency_summary(latencies):
+    if len(latencies) == 0:
+        return {}
+    p50, p95, p99 = np.percentile(latencies * 1000, [50, 95, 99])
+    return {"p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "max_ms": latencies.max() * 1000}
+
+
+async def run_ingester(url, interval=3600.0, cycles=None, concurrency=200, retries=4,
+                       timeout=10.0, batch_rows=50_000, root=STORE, state=STATE, manifest=True):
+    """
+    Long-running poller. Every `interval` seconds all stations are fetched
+    concurrently over one pooled session, each asking only for readings
+    after its watermark; the cycle's readings are written through
+    ingest_batch in batches of up to `batch_rows` rows off the event loop,
+    then the rollups are refreshed when writing to the main store.
+    With manifest=True each cycle is written to the run manifest as the
+    "realtime_ingest" stage. Returns the per-cycle statistics.
+    """
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    loop = asyncio.get_running_loop()
+    stats = []
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        listing = await fetch_json(session, f"{url}/locations", retries=retries)
+        locations = [s["location"] for s in listing["results"]]
+        print(f"📡 Polling {len(locations)} stations every {interval:g}s "
+              f"({concurrency} concurrent requests)")
+
+        n = 0
+        while cycles is None or n < cycles:
+            n += 1
+            started = time.perf_counter()
+            watermarks = load_watermarks(state)
+            df, latencies, failed = await poll_cycle(
+                session, url, locations, watermarks, concurrency=concurrency, retries=retries
+            )
+            polled = time.perf_counter() - started
+
+            ingested = 0
+            for i in range(0, len(df), batch_rows):
+                record = await loop.run_in_executor(
+                    None, lambda part=df.iloc[i:i + batch_rows]: ingest_batch(part, root=root, state=state)
+                )
+                ingested += record["rows"] if record else 0
+            if ingested and Path(root) == STORE:
+                # keep the rollups current for readers, which never refresh them
+                await loop.run_in_executor(None, update_rollups)
+
+            cycle = {"cycle": n, "stations": len(locations), "failed": len(failed),
+                     "rows": ingested, "poll_s": polled,
+                     "total_s": time.perf_counter() - started,
+                     **latency_summary(latencies)}
+            stats.append(cycle)
+            if manifest:
+                record_stage("realtime_ingest", status="ok" if not failed else "degraded",
+                             finished=datetime.now().isoformat(timespec="seconds"),
+                             wall_s=round(cycle["total_s"], 3), rows_in=len(df), rows_out=ingested,
+                             **{k: v for k, v in cycle.items() if k not in ("rows", "total_s")})
+            print(f"🔄 cycle {n}: {ingested} rows from {len(locations) - len(failed)}/"
+                  f"{len(locations)} stations in {cycle['total_s']:.2f}s "
+                  f"(poll {polled:.2f}s, p50 {cycle.get('p50_ms', 0):.1f} ms, "
+                  f"p99 {cycle.get('p99_ms', 0):.1f} ms)")
+
+            if cycles is None or n < cycles:
+                await asyncio.sleep(max(0.0, interval - (time.perf_counter() - started)))
+    return stats
+
+
+async def load_test(stations=2000, cycles=3, interval=1.0, concurrency=200,
+                    latency_ms=5.0, error_rate=0.01, speed=3600.0, port=8765):
+    """
+    Replay server and ingester in one process against a throwaway store.
+    At the default speed one simulated hour passes per real second, so each
+    cycle after the first (a 24-hour backfill) picks up about one new hour.
+    """
+    feed = ReplayFeed(stations=stations, speed=speed)
+    runner = await start_replay_server(feed, port=port, latency_ms=latency_ms,
+                                       error_rate=error_rate)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            stats = await run_ingester(
+                f"http://127.0.0.1:{port}", interval=interval, cycles=cycles,
+                concurrency=concurrency, root=Path(tmp) / "measurements",
+                state=Path(tmp) / "state", manifest=False,
+            )
+    finally:
+        await runner.cleanup()
+    table = pd.DataFrame(stats)
+    table["stations_per_s"] = table["stations"] / table["poll_s"]
+    print(table.round(2).to_string(index=False))
+    return table
+
+
+async def _serve(args):
+    feed = ReplayFeed(stations=args.stations, seed=args.seed, speed=args.speed)
+    await start_replay_server(feed, host=args.host, port=args.port,
+                              latency_ms=args.latency_ms, error_rate=args.error_rate)
+    print(f"✅ Replaying {args.stations} stations on http://{args.host}:{args.port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Real-time PM2.5 ingestion")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="run the local replay feed")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--stations", type=int, default=1000)
+    serve.add_argument("--seed", type=int, default=0)
+    serve.add_argument("--speed", type=float, default=1.0,
+                       help="simulated seconds per real second")
+    serve.add_argument("--latency-ms", type=float, default=0.0)
+    serve.add_argument("--error-rate", type=float, default=0.0)
+
+    run = sub.add_parser("run", help="poll a feed into the measurement store")
+    run.add_argument("--url", default="http://127.0.0.1:8765")
+    run.add_argument("--interval", type=float, default=3600.0, help="seconds between cycles")
+    run.add_argument("--cycles", type=int, default=None, help="stop after N cycles")
+    run.add_argument("--concurrency", type=int, default=200)
+    run.add_argument("--retries", type=int, default=4)
+    run.add_argument("--timeout", type=float, default=10.0)
+
+    bench = sub.add_parser("loadtest", help="replay server + ingester against a temp store")
+    bench.add_argument("--stations", type=int, default=2000)
+    bench.add_argument("--cycles", type=int, default=3)
+    bench.add_argument("--concurrency", type=int, default=200)
+    bench.add_argument("--latency-ms", type=float, default=5.0)
+    bench.add_argument("--error-rate", type=float, default=0.01)
+    bench.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        asyncio.run(_serve(args))
+    elif args.command == "run":
+        asyncio.run(run_ingester(args.url, interval=args.interval, cycles=args.cycles,
+                                 concurrency=args.concurrency, retries=args.retries,
+                                 timeout=args.timeout))
+    else:
+        asyncio.run(load_test(stations=args.stations, cycles=args.cycles,
+                              concurrency=args.concurrency, latency_ms=args.latency_ms,
+                              error_rate=args.error_rate, port=args.port))
@@ -1,88 +1,119 @@
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
 from pathlib import Path
+from fixed_effects import within_ols
+from instrument import current_stage, instrumented
 
 BASE = Path("projects/air_quality_health")
 OUTT = BASE / "outputs" / "tables"
 OUTT.mkdir(parents=True, exist_ok=True)
 
-print("⚠ External PM2.5 data URL not available, generating sample PM2.5 data...")
-
-# WHO data (2000-2019 death_rate)
-who = pd.read_csv(BASE / "data" / "who" / "air_pollution_death_rate.csv")
-
-# Generate sample PM2.5 data for countries (longer-term averages)
-countries_pm25 = {
-    "India": 65.5,
-    "China": 58.2,
-    "Pakistan": 62.8,
-    "Bangladesh": 68.3,
-    "Indonesia": 45.4,
-    "Nigeria": 38.6,
-    "United States": 18.8,
-    "Brazil": 25.4,
-    "Russia": 28.7,
-    "Japan": 15.9,
-    "Germany": 22.2,
-    "United Kingdom": 18.7,
-    "France": 20.8,
-    "Italy": 25.9,
-    "Spain": 23.3,
-    "Canada": 16.2,
-    "Australia": 14.8,
-    "South Korea": 29.1,
-    "Mexico": 32.7,
-    "South Africa": 35.3,
-    "Egypt": 55.9,
-    "Turkey": 38.5,
-    "Thailand": 42.6,
-    "Vietnam": 48.1,
-    "Philippines": 35.9,
-    "Iran": 52.4,
-    "Saudi Arabia": 35.8,
-    "Argentina": 22.7,
-    "Colombia": 28.3,
-    "Poland": 38.2
-}
-
-# Create PM2.5 dataset
-pm_data = []
-for year in range(2000, 2020):
-    for country, base_pm25 in countries_pm25.items():
-        # Add trend (slight improvement over time) and variation
-        trend_factor = 1.0 - (year - 2000) * 0.02  # 2% annual improvement
-        variation = np.random.normal(0, base_pm25 * 0.15)  # 15% variation
-        pm25_value = max(5, base_pm25 * trend_factor + variation)
-
-        pm_data.append({
-            "country": country,
-            "year": year,
-            "pm25": round(pm25_value, 1)
-        })
-
-pm = pd.DataFrame(pm_data)
-
-# harmonize
-df = who.merge(pm, on=["country", "year"], how="inner")
-df = df.dropna(subset=["death_rate", "pm25"])
-df["ln_death_rate"] = np.log(df["death_rate"])
-df["ln_pm25"] = np.log(df["pm25"])
-
-print(f"📊 Merged dataset: {len(df)} records for {df['country'].nunique()} countries")
-
-# OLS regression
-X = sm.add_constant(df["ln_pm25"])
-model = sm.OLS(df["ln_death_rate"], X).fit()
-with open(OUTT / "pm25_mortality_regression.txt", "w") as f:
-    f.write(model.summary().as_text())
-
-# optional panel fixed effects (statsmodels)
-import statsmodels.formula.api as smf
-panel = smf.ols("ln_death_rate ~ ln_pm25 + C(country)", data=df).fit()
-with open(OUTT / "pm25_mortality_fixed_effects.txt", "w") as f:
-    f.write(panel.summary().as_text())
-
-print("✅ regression outputs saved -> outputs/tables/")
-print(f"📈 OLS R-squared: {model.rsquared:.3f}")
-print(f"📊 Fixed effects R-squared: {panel.rsquared:.3f}")
+
+@instrumented("regress")
+def main(seed=0):
+    """
+    Fit pooled OLS and country fixed-effects models of mortality on PM2.5.
+    The sample PM2.5 series is drawn from a seeded generator, so reruns
+    reproduce the same coefficients (and report).
+    """
+    print("⚠ External PM2.5 data URL not available, generating sample PM2.5 data...")
+
+    # WHO data (2000-2019 death_rate)
+    who = pd.read_csv(BASE / "data" / "who" / "air_pollution_death_rate.csv")
+
+    # Generate sample PM2.5 data for countries (longer-term averages)
+    countries_pm25 = {
+        "India": 65.5,
+        "China": 58.2,
+        "Pakistan": 62.8,
+        "Bangladesh": 68.3,
+        "Indonesia": 45.4,
+        "Nigeria": 38.6,
+        "United States": 18.8,
+        "Brazil": 25.4,
+        "Russia": 28.7,
+        "Japan": 15.9,
+        "Germany": 22.2,
+        "United Kingdom": 18.7,
+        "France": 20.8,
+        "Italy": 25.9,
+        "Spain": 23.3,
+        "Canada": 16.2,
+        "Australia": 14.8,
+        "South Korea": 29.1,
+        "Mexico": 32.7,
+        "South Africa": 35.3,
+        "Egypt": 55.9,
+        "Turkey": 38.5,
+        "Thailand": 42.6,
+        "Vietnam": 48.1,
+        "Philippines": 35.9,
+        "Iran": 52.4,
+        "Saudi Arabia": 35.8,
+        "Argentina": 22.7,
+        "Colombia": 28.3,
+        "Poland": 38.2
+    }
+
+    # Create PM2.5 dataset
+    rng = np.random.default_rng(seed)
+    pm_data = []
+    for year in range(2000, 2020):
+        for country, base_pm25 in countries_pm25.items():
+            # Add trend (slight improvement over time) and variation
+            trend_factor = 1.0 - (year - 2000) * 0.02  # 2% annual improvement
+            variation = rng.normal(0, base_pm25 * 0.15)  # 15% variation
+            pm25_value = max(5, base_pm25 * trend_factor + variation)
+
+            pm_data.append({
+                "country": country,
+                "year": year,
+                "pm25": round(pm25_value, 1)
+            })
+
+    pm = pd.DataFrame(pm_data)
+
+    # harmonize
+    df = who.merge(pm, on=["country", "year"], how="inner")
+    df = df.dropna(subset=["death_rate", "pm25"])
+    df["ln_death_rate"] = np.log(df["death_rate"])
+    df["ln_pm25"] = np.log(df["pm25"])
+
+    print(f"📊 Merged dataset: {len(df)} records for {df['country'].nunique()} countries")
+
+    # OLS regression
+    import statsmodels.api as sm
+    X = sm.add_constant(df["ln_pm25"])
+    model = sm.OLS(df["ln_death_rate"], X).fit()
+    with open(OUTT / "pm25_mortality_regression.txt", "w") as f:
+        f.write(model.summary().as_text())
+
+    # panel fixed effects by within-transformation (no dummy columns),
+    # standard errors clustered by country
+    panel = within_ols(df, "ln_death_rate", "ln_pm25", fe="country", cluster="country")
+    twoway = within_ols(df, "ln_death_rate", "ln_pm25", fe=["country", "year"], cluster="country")
+    with open(OUTT / "pm25_mortality_fixed_effects.txt", "w") as f:
+        f.write("Country fixed effects\n" + panel.summary())
+        f.write("\nCountry + year fixed effects\n" + twoway.summary())
+
+    # tidy coefficients for the report
+    rows = [{"model": "Pooled OLS", "term": term, "coef": model.params[term],
+             "std_err": model.bse[term], "p": model.pvalues[term],
+             "r_squared": model.rsquared, "nobs": int(model.nobs)} for term in model.params.index]
+    for name, fit in [("Country FE", panel), ("Country + year FE", twoway)]:
+        for term, row in fit.table().iterrows():
+            rows.append({"model": name, "term": term, "coef": row["coef"],
+                         "std_err": row["std_err"], "p": row["p"],
+                         "r_squared": fit.rsquared, "nobs": fit.nobs})
+    pd.DataFrame(rows).to_csv(OUTT / "pm25_mortality_coefficients.csv", index=False)
+    rec = current_stage()
+    rec.rows_in(len(df))
+    rec.rows_out(len(rows))
+
+    print("✅ regression outputs saved -> outputs/tables/")
+    print(f"📈 OLS R-squared: {model.rsquared:.3f}")
+    print(f"📊 Fixed effects R-squared: {panel.rsquared:.3f} (two-way: {twoway.rsquared:.3f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import functools
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import matplotlib
+matplotlib.use("Agg")  # headless, and safe in worker processes
+import matplotlib.pyplot as plt  # noqa: E402
+import pandas as pd  # noqa: E402
+from instrument import current_stage, stage  # noqa: E402
+
+BASE = Path("projects/air_quality_health")
+OUTP = BASE / "outputs" / "plots"
+OUTT = BASE / "outputs" / "tables"
+MANIFEST = OUTP / ".render_manifest.json"  # {png name: hash of data + plotting code}
+
+KINDS = ("decompose", "forecast")
+_CODE_HASH = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+_checked = {}  # (kind, city) -> (mtime_ns, size) of its table when last rendered or verified
+
+
+def plot_decomposition(city, frame):
+    """Four-panel observed / trend / seasonal / residual figure for one city."""
+    fig, axes = plt.subplots(4, 1, sharex=True, figsize=(6.4, 4.8))
+    for ax, col in zip(axes, ["observed", "trend", "seasonal", "resid"]):
+        if col == "resid":
+            ax.plot(frame["date"], frame[col], marker="o", linestyle="none")
+            ax.axhline(0, color="black")
+        else:
+            ax.plot(frame["date"], frame[col])
+        ax.set_ylabel(col.capitalize())
+    fig.suptitle(f"Seasonal Decomposition of PM2.5 — {city}")
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    return fig
+
+
+def plot_forecast(city, frame):
+    """Observed daily means, forecast line and uncertainty band (Prophet style)."""
+    fig, ax = plt.subplots(figsize=(10, 6))
+    if "y" in frame:
+        ax.plot(frame["ds"], frame["y"], "k.", label="Observed")
+    ax.plot(frame["ds"], frame["yhat"], ls="-", c="#0072B2", label="Forecast")
+    ax.fill_between(frame["ds"], frame["yhat_lower"], frame["yhat_upper"],
+                    color="#0072B2", alpha=0.2)
+    ax.grid(True, which="major", c="gray", ls="-", lw=1, alpha=0.2)
+    ax.set_xlabel("ds")
+    ax.set_ylabel("y")
+    ax.set_title(f"PM2.5 Forecast (next 30 days) — {city}")
+    fig.tight_layout()
+    return fig
+
+
+def _stat(path):
+    try:
+        st = Path(path).stat()
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+@functools.lru_cache(maxsize=1)
+def _decomposition(path, mtime_ns, size):
+    """decomposition.csv, parsed once per version of the file."""
+    return pd.read_csv(path, parse_dates=["date"])
+
+
+def _frames(kind, cities=None):
+    """Yield (city, frame) with the data behind each figure of `kind`."""
+    if kind == "decompose":
+        path = OUTT / "decomposition.csv"
+        stat = _stat(path)
+        if stat is None:
+            return
+        table = _decomposition(path, *stat)
+        if cities is not None:
+            table = table[table["city"].isin(cities)]
+        yield from table.groupby("city")
+    else:
+        for path in sorted(OUTT.glob("forecast_*.csv")):
+            if path.name == "forecast_engine_comparison.csv":
+                continue
+            frame = pd.read_csv(path, parse_dates=["ds"])
+            if frame.empty:
+                continue
+            city = frame["city"].iloc[0]
+            if cities is None or city in cities:
+                yield city, frame
+
+
+def plot_file(kind, city):
+    return OUTP / f"{kind}_{city.replace(' ', '_')}.png"
+
+
+def source_file(kind, city):
+    """The table a figure is drawn from."""
+    if kind == "decompose":
+        return OUTT / "decomposition.csv"
+    return OUTT / f"forecast_{city.replace(' ', '_')}.csv"
+
+
+def _replace(path, write):
+    """
+    Write-then-rename, as rollups._write_parquet does, so a concurrent reader
+    (another dashboard session, st.image) never sees a half-written file.
+    """
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def data_hash(frame):
+    h = hashlib.sha256(_CODE_HASH.encode())
+    h.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _draw(job):
+    kind, city, frame, out = job
+    plot = plot_decomposition if kind == "decompose" else plot_forecast
+    fig = plot(city, frame)
+    _replace(out, lambda tmp: fig.savefig(tmp, format="png"))
+    plt.close(fig)
+    return out.name
+
+
+def render(kinds=KINDS, cities=None, workers=0, force=False):
+    """
+    Render the per-city figures of `kinds` with a process pool, skipping any
+    PNG whose data (and plotting code) hash matches the manifest.
+    Returns the number of figures drawn.
+    """
+    OUTP.mkdir(parents=True, exist_ok=True)
+    manifest = json.loads(MANIFEST.read_text()) if MANIFEST.exists() else {}
+
+    jobs, hashes = [], {}
+    for kind in kinds:
+        for city, frame in _frames(kind, cities):
+            out = plot_file(kind, city)
+            h = data_hash(frame)
+            if force or manifest.get(out.name) != h or not out.exists():
+                jobs.append((kind, city, frame, out))
+                hashes[out.name] = h
+
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(jobs) < 2:
+        done = [_draw(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            done = list(pool.map(_draw, jobs, chunksize=max(1, len(jobs) // (4 * workers))))
+
+    if done:
+        # re-read so entries another process wrote meanwhile are kept
+        manifest = json.loads(MANIFEST.read_text()) if MANIFEST.exists() else {}
+        for name in done:
+            manifest[name] = hashes[name]
+        text = json.dumps(manifest, indent=1, sort_keys=True)
+        _replace(MANIFEST, lambda tmp: tmp.write_text(text))
+    current_stage().note(figures=len(done))
+    return len(done)
+
+
+def ensure_plot(kind, city):
+    """
+    Lazily render one figure on first request (or when its data changed).
+    Once a figure has been checked against its table, reruns return it
+    without re-reading the table until the table's mtime or size changes.
+    """
+    out, stat = plot_file(kind, city), _stat(source_file(kind, city))
+    if stat is not None and _checked.get((kind, city)) == stat and out.exists():
+        return out
+    render(kinds=(kind,), cities=[city], workers=1)
+    _checked[(kind, city)] = stat
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render per-city decomposition & forecast plots")
+    parser.add_argument("kinds", nargs="*", help="decompose and/or forecast (default: both)")
+    parser.add_argument("--workers", type=int, default=0, help="0 = all cores")
+    parser.add_argument("--force", action="store_true", help="redraw unchanged plots too")
+    args = parser.parse_args()
+    if set(args.kinds) - set(KINDS):
+        parser.error(f"kinds must be among: {', '.join(KINDS)}")
+    with stage("render"):
+        n = render(args.kinds or KINDS, workers=args.workers, force=args.force)
+    print(f"✅ rendered {n} plot(s); unchanged plots skipped -> outputs/plots/")
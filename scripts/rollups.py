@@ -0,0 +1,208 @@
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from measurement_store import STORE, iter_days
+from ingest import mark_processed, pending_changes
+from instrument import current_stage, stage
+
+BASE = Path("projects/air_quality_health")
+ROLLUPS = BASE / "data" / "store" / "rollups"
+
+# station_hour is date-partitioned (one directory per day); the rest are
+# single Parquet files small enough to rewrite on each update
+TABLES = ("station_hour", "city_day", "national_day", "city_window", "national_window")
+QUANTILES = {"p50": 0.50, "p90": 0.90, "p95": 0.95}
+WINDOW_DAYS = 30
+
+
+def summarise(df, keys):
+    """count / sum / min / max / mean / percentiles of `value` per group."""
+    g = df.assign(value=df["value"].astype("float64")).groupby(keys, observed=True)["value"]
+    out = g.agg(["count", "sum", "min", "max"])
+    out["mean"] = out["sum"] / out["count"]
+    for name, q in QUANTILES.items():
+        out[name] = g.quantile(q)
+    out = out.reset_index()
+    # group on categorical codes, but store plain strings so tables concatenate
+    return out.astype({k: str for k in keys if isinstance(out[k].dtype, pd.CategoricalDtype)})
+
+
+def _mixture_quantiles(days):
+    """
+    Quantiles of the count-weighted mixture of daily distributions, each
+    taken as piecewise linear through its min / percentiles / max.
+    """
+    knots = days[["min", *QUANTILES, "max"]].to_numpy(dtype=float)
+    probs = np.array([0.0, *QUANTILES.values(), 1.0])
+    weights = days["count"].to_numpy(dtype=float) / days["count"].sum()
+    xs = np.unique(knots)
+    cdf = sum(w * np.interp(xs, k, probs) for w, k in zip(weights, knots))
+    return pd.Series(np.interp(list(QUANTILES.values()), cdf, xs), index=list(QUANTILES))
+
+
+def combine_days(days, keys):
+    """
+    Merge per-day summaries into one row per group. count / sum / min / max
+    / mean are exact; the percentiles are approximated from the daily ones
+    (see _mixture_quantiles), as exact window quantiles need every reading.
+    """
+    g = days.groupby(keys, observed=True)
+    out = g.agg(count=("count", "sum"), sum=("sum", "sum"), min=("min", "min"), max=("max", "max"))
+    out["mean"] = out["sum"] / out["count"]
+    out = out.join(g[["count", "min", *QUANTILES, "max"]].apply(_mixture_quantiles))
+    return out.reset_index()
+
+
+def _write_parquet(df, path):
+    """
+    Write-then-rename, so readers only ever see a whole file. The temp name
+    starts with "." so dataset discovery skips it in partition directories.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def _writer_lock(root):
+    """Serialise rollup writers across processes with an advisory lock file."""
+    Path(root).mkdir(parents=True, exist_ok=True)
+    with open(Path(root) / ".lock", "a+") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        yield
+
+
+def _replace_rows(path, new, key="date"):
+    """Swap the rows of `new[key]` values in a Parquet table for `new`."""
+    if path.exists():
+        old = pd.read_parquet(path)
+        new = pd.concat([old[~old[key].isin(new[key].unique())], new], ignore_index=True)
+    sort = [c for c in ("city", "date") if c in new]
+    _write_parquet(new.sort_values(sort), path)
+
+
+def _rollup_day(raw, day, root):
+    """Recompute station-hour, city-day and national-day rows for one date."""
+    if raw.empty:
+        return None, None
+    current_stage().rows_in(len(raw))
+
+    raw["hour"] = raw["timestamp"].dt.floor("h")
+    station_hour = summarise(raw, ["location", "city", "hour"])
+    _write_parquet(station_hour, root / "station_hour" / f"date={day:%Y-%m-%d}" / "part-0.parquet")
+
+    city_day = summarise(raw, ["city"]).assign(date=day)
+    national_day = summarise(raw.assign(country="IN"), ["country"]).assign(date=day)
+    return city_day, national_day
+
+
+def _rollup_window(end, root, window_days=WINDOW_DAYS):
+    """
+    City and national summaries of the `window_days` days ending at `end`,
+    merged from the city-day / national-day rows rather than re-reading the
+    window's raw measurements (see combine_days for the percentiles).
+    """
+    start = end - pd.Timedelta(days=window_days - 1)
+    bounds = {"window_start": start, "window_end": end, "window_days": window_days}
+    for level, key in (("city", "city"), ("national", "country")):
+        path = root / f"{level}_day.parquet"
+        if not path.exists():
+            continue
+        days = pd.read_parquet(path, filters=[("date", ">=", start), ("date", "<=", end)])
+        _write_parquet(combine_days(days, [key]).assign(**bounds), root / f"{level}_window.parquet")
+
+
+def update_rollups(dates=None, root=ROLLUPS, store=STORE):
+    """
+    Bring the rollup tables up to date. Only the dates touched by ingest
+    batches since the last update are recomputed (every date on first
+    build), one day at a time so memory stays bounded; the rolling window
+    summaries are refreshed whenever anything changed. Concurrent callers
+    take turns on a lock file. Returns the number of dates recomputed.
+    """
+    with _writer_lock(root):
+        return _update_rollups(dates, Path(root), store)
+
+
+def _update_rollups(dates, root, store):
+    batch = None
+    if dates is None:
+        dirty, batch = pending_changes("rollups")
+        if (root / "city_day.parquet").exists():
+            dates = sorted(set().union(*dirty.values())) if dirty else []
+        else:
+            dates = sorted(p.name.split("=", 1)[1] for p in Path(store).glob("date=*"))
+    if not dates:
+        return 0
+
+    city_days, national_days = [], []
+    columns = ["location", "city", "timestamp", "value"]
+    for day, raw in iter_days(dates, columns=columns, root=store):
+        city_day, national_day = _rollup_day(raw, day, root)
+        if city_day is not None:
+            city_days.append(city_day)
+            national_days.append(national_day)
+    if city_days:
+        city_days = pd.concat(city_days, ignore_index=True)
+        _replace_rows(root / "city_day.parquet", city_days)
+        _replace_rows(root / "national_day.parquet", pd.concat(national_days, ignore_index=True))
+        rec = current_stage()
+        rec.rows_out(len(city_days))
+        for city, n in city_days.groupby("city")["count"].sum().items():
+            rec.city(city, rows_in=n)
+    current_stage().note(dates=len(dates))
+
+    latest = max(p.name.split("=", 1)[1] for p in Path(store).glob("date=*"))
+    _rollup_window(pd.Timestamp(latest), root)
+
+    if batch:
+        mark_processed("rollups", batch)
+    return len(dates)
+
+
+def read_rollup(name, cities=None, dates=None, root=ROLLUPS):
+    """
+    Read one rollup table as last written by update_rollups (the rollup
+    stage and the ingest entry points); reading never writes.
+    `dates` (YYYY-MM-DD strings) prunes the station_hour partitions.
+    Raises FileNotFoundError when the table has not been built yet.
+    """
+    if name not in TABLES:
+        raise ValueError(f"unknown rollup table: {name}")
+    path = Path(root) / (name if name == "station_hour" else f"{name}.parquet")
+    if not path.exists():
+        raise FileNotFoundError(f"{path}: run rollups.py (the rollup stage) first")
+    filters = []
+    if cities is not None and not name.startswith("national"):
+        filters.append(("city", "in", list(cities)))
+    if dates is not None and name == "station_hour":
+        filters.append(("date", "in", [str(d) for d in dates]))
+    return pd.read_parquet(path, filters=filters or None)
+
+
+def city_daily(cities=None):
+    """Daily mean PM2.5 per city in the long (city, date, value) layout."""
+    df = read_rollup("city_day", cities=cities)
+    return df[["city", "date", "mean"]].rename(columns={"mean": "value"})
+
+
+if __name__ == "__main__":
+    with stage("rollup"):
+        n = update_rollups()
+    print(f"✅ rollups refreshed for {n} date(s) -> {ROLLUPS}")
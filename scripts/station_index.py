@@ -0,0 +1,114 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from instrument import current_stage, stage
+from measurement_store import STORE, read_stations
+
+BASE = Path("projects/air_quality_health")
+INDEX = BASE / "data" / "store" / "station_index.pkl"
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_xyz(lat, lon):
+    """Project lat/lon degrees onto the unit sphere (3D cartesian)."""
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def chord_to_km(chord):
+    """Great-circle distance in km for a unit-sphere chord length."""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.asarray(km, dtype=float) / (2 * EARTH_RADIUS_KM))
+
+
+class StationIndex:
+    """
+    KD-tree over monitoring stations. Coordinates are projected onto the unit
+    sphere, so euclidean chord distance is monotonic in haversine distance and
+    nearest-k / within-radius queries are exact great-circle queries.
+    """
+
+    def __init__(self, stations):
+        self.stations = stations.reset_index(drop=True)
+        self.tree = cKDTree(to_xyz(self.stations["latitude"], self.stations["longitude"]))
+
+    def __len__(self):
+        return len(self.stations)
+
+    def query(self, lat, lon, k=1):
+        """Vectorised lookup: (distance_km, station positions) arrays for many points."""
+        k = min(k, len(self))
+        chord, idx = self.tree.query(to_xyz(lat, lon), k=k)
+        return chord_to_km(chord), idx
+
+    def nearest(self, lat, lon, k=5):
+        """The k stations closest to one point, nearest first."""
+        dist, idx = self.query(lat, lon, k=k)
+        out = self.stations.iloc[np.atleast_1d(idx)].copy()
+        out["distance_km"] = np.atleast_1d(dist)
+        return out.reset_index(drop=True)
+
+    def within_radius(self, lat, lon, radius_km):
+        """All stations within radius_km of one point, nearest first."""
+        idx = self.tree.query_ball_point(to_xyz(lat, lon), float(km_to_chord(radius_km)))
+        out = self.stations.iloc[idx].copy()
+        out["distance_km"] = chord_to_km(
+            np.linalg.norm(self.tree.data[idx] - to_xyz(lat, lon), axis=1)
+        )
+        return out.sort_values("distance_km").reset_index(drop=True)
+
+    def save(self, path=INDEX):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # plain containers only, so the pickle does not depend on __main__
+        with open(path, "wb") as f:
+            pickle.dump({"stations": self.stations, "tree": self.tree}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    @classmethod
+    def load(cls, path=INDEX):
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        index = cls.__new__(cls)
+        index.stations, index.tree = state["stations"], state["tree"]
+        return index
+
+
+def build_station_index(root=STORE, path=INDEX):
+    """Rebuild the index from the measurement store and persist it."""
+    stations = read_stations(root=root)
+    index = StationIndex(stations.dropna(subset=["latitude", "longitude"]))
+    index.save(path)
+    rec = current_stage()
+    rec.rows_in(len(stations))
+    rec.rows_out(len(index))
+    return index
+
+
+def load_station_index(root=STORE, path=INDEX):
+    """
+    Load the persisted index, rebuilding it when any store partition has
+    been written to since the pickle was saved.
+    """
+    path = Path(path)
+    if path.exists():
+        newest = max((p.stat().st_mtime for p in Path(root).glob("date=*/city=*")), default=0)
+        if path.stat().st_mtime >= newest:
+            return StationIndex.load(path)
+    return build_station_index(root=root, path=path)
+
+
+if __name__ == "__main__":
+    with stage("station_index"):
+        index = build_station_index()
+    print(f"✅ Station index with {len(index)} monitors saved to: {INDEX}")
+    print(index.nearest(28.6139, 77.2090, k=3).to_string(index=False))